@@ -0,0 +1 @@
+# Empty file to make batch a package
\ No newline at end of file
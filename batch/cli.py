@@ -0,0 +1,22 @@
+import asyncio
+import logging
+import os
+import sys
+from batch.runner import batch_parallelism, run_batch
+from common.log_utils import configure_logging
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def run_batch_cli(args):
+    """Run every job in a JSONL job file in one event loop, resuming from an existing output file."""
+    output_path = args.batch_output or f"{os.path.splitext(args.batch)[0]}.results.jsonl"
+    output_dir = args.batch_output_dir or f"{os.path.splitext(args.batch)[0]}_outputs"
+    parallelism = batch_parallelism(args.parallelism)
+    configure_logging()
+
+    succeeded, failed = asyncio.run(run_batch(args.batch, output_path, output_dir, parallelism))
+    logger.info(f"Batch complete: {succeeded} succeeded, {failed} failed; results in {output_path}")
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from functools import partial
+from typing import Dict, List, Set, Tuple
+from common.async_utils import gather_bounded, repeat_concurrency
+from common.audio_utils import AudioProcessor
+from common.config import config
+from common.executor_utils import shutdown_worker_pool
+from common.image_utils import ImageProcessor
+from common.log_utils import begin_request
+from common.tcp_utils import close_model_service_client, send_request_to_server
+from common.upload_utils import ingest_path, upload_limit
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TASKS = ('voice_mimic', 'describe_photo')
+
+# Jobs use the same fields as the web payloads, plus `task`, an optional `id` and the input file
+INPUT_FIELDS = {'voice_mimic': 'input_file', 'describe_photo': 'image_file'}
+
+def batch_parallelism(requested=None) -> int:
+    """Number of jobs run at once: the --parallelism flag, else `batch.parallelism` in conf.yaml."""
+    if requested is None:
+        requested = (config.get('batch', {}) or {}).get('parallelism', 4)
+    return max(1, int(requested))
+
+def load_jobs(jobs_path: str) -> List[Dict]:
+    """Read a JSONL job file; jobs without an `id` are named after their line number."""
+    jobs = []
+    with open(jobs_path, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            job.setdefault('id', f"line-{line_number}")
+            job['id'] = str(job['id'])
+            jobs.append(job)
+    return jobs
+
+def completed_job_ids(output_path: str) -> Set[str]:
+    """Ids of jobs that already succeeded in a previous run's output file.
+
+    A line cut short by an interrupted run is ignored, so that job runs again.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('status') == 'success':
+                completed.add(str(record.get('id')))
+    return completed
+
+def output_stem(output_dir: str, job_id: str) -> str:
+    return os.path.join(output_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', job_id))
+
+async def run_voice_mimic_job(job: Dict, output_dir: str) -> List[Dict]:
+    from voice_mimic import views as voice_mimic_views  # Loaded only by batches with voice jobs
+    request_data = voice_mimic_views.RequestPayload(**{k: v for k, v in job.items() if k not in ('task', 'id', 'input_file')})
+    params = voice_mimic_views.build_params(request_data)
+    with ingest_path(job['input_file'], upload_limit('audio'), 'audio') as upload:
+        audio_input, _ = await AudioProcessor.load_reference_audio(upload, sample_rate=params['sample_rate'])
+    messages = voice_mimic_views.build_messages(request_data, audio_input)
+
+    async def run_repeat(repeat: int) -> List[Dict]:
+        response = await send_request_to_server(
+            messages, params, use_cache=not request_data.fresh_samples, variant=repeat
+        )
+        if response.get('status') != 'success':
+            raise RuntimeError(f"Server processing failed: {response}")
+        results = []
+        for i, text, _, audio_data in voice_mimic_views.response_audio(request_data, response, repeat):
+            output_path = f"{output_stem(output_dir, job['id'])}_r{repeat}_{i}.wav"
+            with open(output_path, 'wb') as f:
+                f.write(audio_data)
+            results.append({'text': text, 'repeat': repeat, 'output_path': output_path})
+        return results
+
+    repeat_results = await gather_bounded(request_data.repeats, run_repeat, repeat_concurrency(request_data.concurrency))
+    results = [result for results_for_repeat in repeat_results for result in results_for_repeat]
+    if not results:
+        raise RuntimeError("No valid audio files received; check model service response")
+    return results
+
+async def run_describe_photo_job(job: Dict, output_dir: str) -> List[Dict]:
+    from describe_photo import views as describe_photo_views  # Loaded only by batches with photo jobs
+    request_data = describe_photo_views.RequestPayload(**{k: v for k, v in job.items() if k not in ('task', 'id', 'image_file')})
+    params = describe_photo_views.build_params(request_data)
+    with ingest_path(job['image_file'], upload_limit('image'), 'image') as upload:
+        image_data = await ImageProcessor.load_cached_image(upload)
+    messages = describe_photo_views.build_messages(request_data, image_data)
+
+    repeat_results = await gather_bounded(
+        request_data.repeats, partial(describe_photo_views.run_repeat, request_data, messages, params),
+        repeat_concurrency(request_data.concurrency)
+    )
+    results = []
+    for results_for_repeat in repeat_results:
+        for i, result in enumerate(results_for_repeat):
+            output_path = f"{output_stem(output_dir, job['id'])}_r{result['repeat']}_{i}.txt"
+            with open(output_path, 'w') as f:
+                f.write(f"# Prompt: {result['prompt']}\n# Timestamp: {datetime.now().isoformat()}\n\n{result['description']}")
+            results.append({**result, 'output_path': output_path})
+    return results
+
+JOB_RUNNERS = {'voice_mimic': run_voice_mimic_job, 'describe_photo': run_describe_photo_job}
+
+async def run_job(job: Dict, output_dir: str) -> Dict:
+    """Run one job and return its output record; failures are recorded rather than raised."""
+    started = time.monotonic()
+    # Log records of the job carry its id
+    begin_request(job['id'])
+    record = {'id': job['id'], 'task': job.get('task')}
+    try:
+        if job.get('task') not in TASKS:
+            raise ValueError(f"Unknown task {job.get('task')!r}; use one of {', '.join(TASKS)}")
+        input_field = INPUT_FIELDS[job['task']]
+        if not job.get(input_field) or not os.path.exists(job[input_field]):
+            raise FileNotFoundError(f"{input_field} not found: {job.get(input_field)}")
+        record['results'] = await JOB_RUNNERS[job['task']](job, output_dir)
+        record['status'] = 'success'
+    except Exception as e:
+        logger.error(f"Job {job['id']} failed: {str(e)}")
+        record['status'] = 'error'
+        record['error'] = str(e)
+    record['elapsed_seconds'] = round(time.monotonic() - started, 3)
+    return record
+
+async def run_batch(jobs_path: str, output_path: str, output_dir: str, parallelism: int) -> Tuple[int, int]:
+    """Run every job in jobs_path that has not already succeeded in output_path.
+
+    Jobs share the pooled model service connection and preprocessing worker pool, at most
+    `parallelism` run at once, and each record is appended to output_path as soon as its job
+    finishes. Returns (succeeded, failed) for this run.
+    """
+    jobs = load_jobs(jobs_path)
+    completed = completed_job_ids(output_path)
+    pending = [job for job in jobs if job['id'] not in completed]
+    logger.info(f"Batch {jobs_path}: {len(jobs)} job(s), {len(jobs) - len(pending)} already completed, "
+                f"running {len(pending)} with parallelism {parallelism}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    counts = {'success': 0, 'error': 0}
+    with open(output_path, 'a+') as output:
+        # Terminate a line left incomplete by an interrupted run before appending
+        if output.tell() > 0:
+            output.seek(output.tell() - 1)
+            if output.read(1) != '\n':
+                output.write('\n')
+
+        async def worker(index: int):
+            record = await run_job(pending[index], output_dir)
+            output.write(json.dumps(record, default=str) + '\n')
+            output.flush()
+            counts[record['status']] += 1
+            logger.info(f"Job {record['id']} {record['status']} in {record['elapsed_seconds']}s "
+                        f"({counts['success'] + counts['error']}/{len(pending)})")
+
+        try:
+            await gather_bounded(len(pending), worker, parallelism)
+        finally:
+            await close_model_service_client()
+            shutdown_worker_pool()
+    return counts['success'], counts['error']
@@ -0,0 +1 @@
+# Empty file to make benchmark a package
\ No newline at end of file
@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import sys
+import time
+from contextlib import aclosing
+from typing import Dict, List
+from benchmark.report import write_report
+from common.tcp_utils import BalancedModelServiceClient, ModelServiceClient
+from stub_service.server import StubModelService
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MESSAGES = [{'role': 'user', 'content': ['Describe the image.']}, {'role': 'user', 'content': ['What is in it?']}]
+PARAMS = {'generate_audio': False}
+
+def free_port() -> int:
+    """A port nothing listens on (until a stand-in is started on it)."""
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+def balancer(ports: List[int], **options) -> BalancedModelServiceClient:
+    clients = [ModelServiceClient('localhost', port, timeout=10.0, pool_size=8) for port in ports]
+    return BalancedModelServiceClient(clients, **options)
+
+class Check:
+    """Results of one scenario: measurements plus the expectations that did not hold."""
+    def __init__(self, name: str):
+        self.name = name
+        self.values: Dict = {}
+        self.failures: List[str] = []
+
+    def expect(self, condition: bool, failure: str):
+        if not condition:
+            self.failures.append(failure)
+
+    def result(self) -> Dict:
+        return {'name': self.name, **self.values, 'failures': self.failures, 'ok': not self.failures}
+
+async def send(client: BalancedModelServiceClient) -> bool:
+    response = await client.send_request(MESSAGES, PARAMS)
+    return response.get('status') == 'success'
+
+async def check_failover(ejection_seconds: float) -> Dict:
+    """One replica refuses connections: requests fail over, the replica is ejected, backs off and recovers."""
+    check = Check('failover_ejection_backoff')
+    healthy = StubModelService(port=0)
+    await healthy.start()
+    dead_port = free_port()
+    client = balancer([dead_port, healthy.port], failure_threshold=2, ejection_seconds=ejection_seconds,
+                      max_ejection_seconds=ejection_seconds * 4)
+    dead = client.backends[0]
+    revived = None
+    try:
+        ok = [await send(client) for _ in range(20)]
+        check.expect(all(ok), f"{ok.count(False)} of 20 requests failed despite a healthy replica")
+        check.expect(dead.ejections == 1, f"dead replica ejected {dead.ejections} times, expected once")
+        check.expect(dead.requests == 2, f"dead replica tried {dead.requests} times, expected failure_threshold (2)")
+        first_period = dead.ejected_until - time.monotonic()
+        check.expect(0 < first_period <= ejection_seconds, f"first ejection lasts {first_period:.2f}s, expected up to {ejection_seconds}s")
+
+        # Once the ejection ends, one more failure ejects the replica again for twice as long
+        await asyncio.sleep(ejection_seconds)
+        while dead.ejections < 2 and dead.requests < 40:
+            check.expect(await send(client), "request failed while the dead replica was on probation")
+        second_period = dead.ejected_until - time.monotonic()
+        check.expect(dead.ejections == 2, f"dead replica ejected {dead.ejections} times after probation, expected twice")
+        check.expect(ejection_seconds < second_period <= 2 * ejection_seconds,
+                     f"second ejection lasts {second_period:.2f}s, expected {ejection_seconds}-{2 * ejection_seconds}s")
+
+        async with aclosing(client.stream_request(MESSAGES, PARAMS)) as stream:
+            statuses = [message.get('status') async for message in stream]
+        check.expect(statuses[-1:] == ['success'], "stream did not fail over to the healthy replica")
+
+        # Bring the replica back; after its ejection it takes traffic again and its backoff resets
+        revived = StubModelService(port=dead_port)
+        await revived.start()
+        await asyncio.sleep(second_period)
+        for _ in range(20):
+            await send(client)
+        check.expect(revived.requests_served > 0, "revived replica received no requests")
+        check.expect(dead.ejections == 0, "backoff did not reset after the replica recovered")
+        check.values.update({
+            'first_ejection_s': round(first_period, 3), 'second_ejection_s': round(second_period, 3),
+            'dead_failures': dead.failures, 'revived_requests': revived.requests_served
+        })
+    finally:
+        await client.close()
+        await healthy.close()
+        if revived is not None:
+            await revived.close()
+    return check.result()
+
+async def check_hedging(slow_delay: float, hedge_delay: float) -> Dict:
+    """One replica is slow: requests sent to it are hedged to the other, which answers first."""
+    check = Check('hedging')
+    slow = StubModelService(port=0, response_delay=slow_delay)
+    fast = StubModelService(port=0)
+    await slow.start()
+    await fast.start()
+    client = balancer([slow.port, fast.port], hedge_delay=hedge_delay)
+    try:
+        async def timed() -> float:
+            started = time.monotonic()
+            check.expect(await send(client), "hedged request failed")
+            return time.monotonic() - started
+
+        # Concurrent requests are spread over both replicas, so some go to the slow one first
+        latencies = await asyncio.gather(*(timed() for _ in range(8)))
+        check.expect(client.hedges_sent > 0, "no request was hedged")
+        check.expect(client.hedges_won == client.hedges_sent, f"{client.hedges_won} of {client.hedges_sent} hedges won")
+        check.expect(max(latencies) < slow_delay, f"slowest request took {max(latencies):.2f}s, not less than the slow replica's {slow_delay}s")
+        check.expect(client.backends[0].failures == 0, "cancelled attempts on the slow replica were counted as failures")
+        check.values.update({
+            'hedges_sent': client.hedges_sent, 'hedges_won': client.hedges_won,
+            'max_ms': round(max(latencies) * 1000, 1)
+        })
+    finally:
+        await client.close()
+        await slow.close()
+        await fast.close()
+    return check.result()
+
+async def check_ewma(slow_delay: float) -> Dict:
+    """With the ewma policy, sequential traffic moves to the faster replica."""
+    check = Check('ewma_policy')
+    slow = StubModelService(port=0, response_delay=slow_delay)
+    fast = StubModelService(port=0)
+    await slow.start()
+    await fast.start()
+    client = balancer([slow.port, fast.port], policy='ewma')
+    try:
+        for _ in range(30):
+            check.expect(await send(client), "request failed")
+        share = slow.requests_served / 30
+        check.expect(share < 0.2, f"slow replica served {share:.0%} of requests")
+        check.values['slow_share'] = round(share, 3)
+    finally:
+        await client.close()
+        await slow.close()
+        await fast.close()
+    return check.result()
+
+async def run_checks(ejection_seconds: float, slow_delay: float, hedge_delay: float) -> List[Dict]:
+    return [
+        await check_failover(ejection_seconds),
+        await check_hedging(slow_delay, hedge_delay),
+        await check_ewma(slow_delay)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Check replica failover, ejection with backoff and hedging against local stand-in model services")
+    parser.add_argument("--ejection_seconds", type=float, default=0.5, help="Base ejection period for the failover check")
+    parser.add_argument("--slow_delay", type=float, default=0.5, help="Response delay of the slow replica")
+    parser.add_argument("--hedge_delay", type=float, default=0.05, help="Hedge delay for the hedging check")
+    parser.add_argument("--output", type=str, help="Write the results as a JSON report to this file")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines instead of a table")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+    # Connection errors from the replica that is down on purpose are expected
+    logging.getLogger('common.tcp_utils').setLevel(logging.CRITICAL)
+
+    results = asyncio.run(run_checks(args.ejection_seconds, args.slow_delay, args.hedge_delay))
+    for result in results:
+        if args.json:
+            print(json.dumps(result))
+        else:
+            values = ', '.join(f"{key} {value}" for key, value in result.items() if key not in ('name', 'failures', 'ok'))
+            print(f"{result['name']:<26} {'ok' if result['ok'] else 'FAILED'}  {values}")
+            for failure in result['failures']:
+                print(f"    {failure}")
+    if args.output:
+        write_report(args.output, 'balancer', {k: v for k, v in vars(args).items() if k not in ('output', 'json')}, results)
+    failed = [result['name'] for result in results if not result['ok']]
+    if failed:
+        logger.error(f"Balancer checks failed: {', '.join(failed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import io
+import json
+import logging
+import sys
+import tempfile
+import time
+import wave
+from typing import Callable, Dict, List
+import numpy as np
+from benchmark.report import write_report
+from common.async_utils import SingleFlight
+from common.audio_utils import AudioProcessor
+from common.cache_utils import content_hash
+from common.config import config
+from common.image_utils import ImageProcessor
+from common.upload_utils import IngestedUpload
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def make_wav(seconds: float, sample_rate: int = 44100) -> bytes:
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    samples = (8000 * np.sin(2 * np.pi * 440 * t)).astype('<i2')
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+def make_png(size: int) -> bytes:
+    from PIL import Image
+    rng = np.random.default_rng(size)
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def spooled(data: bytes, filename: str) -> IngestedUpload:
+    """An upload as a request would hold it: its own spool of the content."""
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spool.write(data)
+    return IngestedUpload(spool, len(data), content_hash(data), filename)
+
+async def leader_cancelled(name: str, data: bytes, filename: str, process: Callable) -> Dict:
+    """Start two requests for the same content, cancel the first once its run is in flight, and check the second."""
+    flight = SingleFlight.registry[name]
+    uploads = [spooled(data, filename) for _ in range(2)]
+
+    async def request(upload: IngestedUpload):
+        with upload:
+            return await process(upload)
+
+    coalesced = flight.coalesced
+    started = time.perf_counter()
+    leader = asyncio.ensure_future(request(uploads[0]))
+    while not flight.in_flight:
+        await asyncio.sleep(0.001)
+    follower = asyncio.ensure_future(request(uploads[1]))
+    # Let the follower join the run, then cancel the leader (as a closed SSE connection does)
+    await asyncio.sleep(0)
+    leader.cancel()
+    error = None
+    try:
+        await follower
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    await asyncio.gather(leader, return_exceptions=True)
+    joined = flight.coalesced > coalesced
+    # Once both requests are done, the shared run has released the leader's spool as well
+    closed = all(upload.file.closed for upload in uploads)
+    return {
+        'name': name,
+        'bytes': len(data),
+        'leader_cancelled': leader.cancelled(),
+        'follower_joined': joined,
+        'follower_error': error,
+        'spools_closed': closed,
+        'ms': round((time.perf_counter() - started) * 1000, 1),
+        'ok': leader.cancelled() and joined and error is None and closed
+    }
+
+async def run_checks(audio_seconds: float, image_size: int) -> List[Dict]:
+    # Caches would let the second request skip the shared run altogether
+    config['audio_cache'] = {'enabled': False}
+    config['image_cache'] = {'enabled': False}
+    config['coalescing'] = {'enabled': True}
+    config['audio_trim'] = {'enabled': False}
+    wav = make_wav(audio_seconds)
+    results = []
+    for pipeline in ('numpy', 'single_pass'):
+        config.setdefault('audio', {})['pipeline'] = pipeline
+        result = await leader_cancelled(
+            'audio_preprocessing', wav, 'input.wav',
+            lambda upload: AudioProcessor.load_reference_audio(upload, sample_rate=16000)
+        )
+        result['name'] = f"audio_{pipeline}"
+        results.append(result)
+    results.append(await leader_cancelled('image_preprocessing', make_png(image_size), 'input.png', ImageProcessor.load_cached_image))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that coalesced preprocessing survives the cancellation of the request that started it")
+    parser.add_argument("--audio_seconds", type=float, default=20.0, help="Length of the test WAV upload")
+    parser.add_argument("--image_size", type=int, default=2048, help="Width and height of the test PNG upload")
+    parser.add_argument("--output", type=str, help="Write the results as a JSON report to this file")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines instead of a table")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = asyncio.run(run_checks(args.audio_seconds, args.image_size))
+    for result in results:
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(f"{result['name']:<18} {result['bytes']:>9} bytes  {result['ms']:7.1f} ms  "
+                  f"spools closed: {'yes' if result['spools_closed'] else 'no'}  "
+                  f"{'ok' if result['ok'] else 'FAILED: ' + str(result['follower_error'])}")
+    if args.output:
+        write_report(args.output, 'coalescing', {k: v for k, v in vars(args).items() if k not in ('output', 'json')}, results)
+    failed = [result['name'] for result in results if not result['ok']]
+    if failed:
+        logger.error(f"Coalesced requests failed after the first one was cancelled: {', '.join(failed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
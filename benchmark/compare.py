@@ -0,0 +1,45 @@
+import argparse
+import json
+import sys
+from benchmark.report import compare_reports, load_report
+
+# Fields where a larger value is an improvement; for everything else (latencies, sizes, RSS, errors) smaller is better
+HIGHER_IS_BETTER = ('requests_per_second', 'ops_per_second')
+# Fields that describe the run rather than its outcome; they are shown but never flagged
+NEUTRAL_FIELDS = ('count', 'requests', 'elapsed_seconds', 'model_calls', 'mean_batch_size')
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports written with --output")
+    parser.add_argument("baseline", type=str, help="Report of the reference version")
+    parser.add_argument("candidate", type=str, help="Report of the version under test")
+    parser.add_argument("--fields", nargs='+', help="Only compare these result fields (e.g. p95_ms requests_per_second)")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change reported as a regression (default 10%%)")
+    parser.add_argument("--json", action="store_true", help="Print the changes as JSON lines")
+    args = parser.parse_args()
+
+    baseline, candidate = load_report(args.baseline), load_report(args.candidate)
+    if baseline.get('suite') != candidate.get('suite'):
+        parser.error(f"Reports are from different suites: {baseline.get('suite')} and {candidate.get('suite')}")
+
+    regressions = 0
+    for change in compare_reports(baseline, candidate):
+        if args.fields and change['field'] not in args.fields:
+            continue
+        relative = change['change']
+        worse = False
+        if relative is not None and change['field'] not in NEUTRAL_FIELDS:
+            worse = (-relative if change['field'] in HIGHER_IS_BETTER else relative) > args.threshold
+        regressions += worse
+        if args.json:
+            print(json.dumps({**change, 'regression': worse}))
+        else:
+            shown = f"{relative:+8.1%}" if relative is not None else '     n/a'
+            print(f"{change['name']:<22} {change['field']:<24} {change['baseline']:>14} -> {change['candidate']:>14} "
+                  f"{shown}{'  REGRESSION' if worse else ''}")
+    if regressions:
+        print(f"{regressions} field(s) regressed by more than {args.threshold:.0%} "
+              f"({baseline['environment'].get('revision')} -> {candidate['environment'].get('revision')})", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
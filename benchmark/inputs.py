@@ -0,0 +1,21 @@
+import io
+from typing import Dict
+import numpy as np
+
+def make_image(width: int, height: int, image_format: str) -> bytes:
+    """Noisy test image, so encoders do real work (a flat image compresses trivially)."""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert('RGB').save(buffer, format=image_format)
+    return buffer.getvalue()
+
+def voice_request(audio_seconds: float, sample_rate: int = 16000) -> Dict:
+    """A model service request shaped like a voice mimic request with reference audio."""
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, int(audio_seconds * sample_rate)).astype(np.float32)
+    return {
+        'messages': [
+            {'role': 'user', 'content': ["Mimic the voice style of the reference file.", audio]},
+            {'role': 'user', 'content': ["The quick brown fox jumps over the lazy dog."]}
+        ],
+        'params': {'sampling': True, 'temperature': 0.3, 'max_new_tokens': 128, 'generate_audio': True}
+    }
@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import http.client
+import itertools
+import json
+import logging
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from benchmark.inputs import make_image
+from benchmark.report import ROOT, process_rss_bytes, summarize_latencies, write_report
+from common.config import config
+from stub_service.server import make_wav
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAIN_PATH = os.path.join(ROOT, '__main__.py')
+
+# HTTP targets: endpoint path, upload field name, upload content type
+HTTP_TARGETS = {
+    'voice_mimic': ('/voice-mimic/process_audio', 'audio_file', 'audio/wav'),
+    'describe_photo': ('/describe-photo/process_photo', 'image_file', 'image/jpeg')
+}
+TARGETS = (*HTTP_TARGETS, 'model')
+
+class RssSampler:
+    """Track the largest RSS of a process seen while a run is in progress."""
+    def __init__(self, pid: Optional[int], interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.max_rss_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.max_rss_bytes = max(self.max_rss_bytes, process_rss_bytes(self.pid).get('rss_bytes', 0))
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> 'RssSampler':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+def multipart_body(field: str, filename: str, content_type: str, content: bytes, payload: Dict) -> Tuple[bytes, str]:
+    """Encode an upload and its JSON `payload` form field as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    body = b''.join([
+        f'--{boundary}\r\nContent-Disposition: form-data; name="payload"\r\n\r\n'.encode('utf-8'),
+        json.dumps(payload).encode('utf-8'),
+        f'\r\n--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8'),
+        content,
+        f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    ])
+    return body, f'multipart/form-data; boundary={boundary}'
+
+def build_http_bodies(target: str, distinct_inputs: int, args) -> List[Tuple[bytes, str]]:
+    """Request bodies to cycle through; distinct inputs defeat the preprocessing caches."""
+    _, field, content_type = HTTP_TARGETS[target]
+    if target == 'voice_mimic':
+        payload = {'input_mimick_text': args.texts, 'repeats': args.repeats, 'fresh_samples': not args.allow_coalescing}
+        uploads = [make_wav(args.audio_seconds, sample_rate=44100, frequency=220.0 + 10 * i) for i in range(distinct_inputs)]
+        filename = 'reference.wav'
+    else:
+        payload = {'prompts': args.texts, 'repeats': args.repeats, 'fresh_samples': not args.allow_coalescing}
+        uploads = [make_image(args.image_size, args.image_size * 3 // 4, 'JPEG') for _ in range(distinct_inputs)]
+        filename = 'photo.jpg'
+    return [multipart_body(field, filename, content_type, upload, payload) for upload in uploads]
+
+def run_http_load(url: str, target: str, bodies: List[Tuple[bytes, str]], requests: int,
+                  concurrency: int, duration: Optional[float], stream: bool, timeout: float) -> Dict:
+    """Closed-loop load: `concurrency` keep-alive connections each send the next request as soon as the last one ends."""
+    parts = urlsplit(url)
+    path = HTTP_TARGETS[target][0] + ('/stream' if stream else '')
+    indexes = itertools.count()
+    deadline = time.monotonic() + duration if duration else None
+    latencies: List[float] = []
+    first_event: List[float] = []
+    statuses: Counter = Counter()
+    lock = threading.Lock()
+
+    def worker():
+        connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+        try:
+            while True:
+                index = next(indexes)
+                if (deadline is None and index >= requests) or (deadline is not None and time.monotonic() >= deadline):
+                    return
+                body, content_type = bodies[index % len(bodies)]
+                started = time.perf_counter()
+                first = None
+                try:
+                    connection.request('POST', path, body=body, headers={'Content-Type': content_type})
+                    response = connection.getresponse()
+                    if stream and response.status == 200:
+                        response.read(1)
+                        first = time.perf_counter() - started
+                    response.read()
+                    status = str(response.status)
+                except (OSError, http.client.HTTPException) as e:
+                    status = type(e).__name__
+                    connection.close()
+                elapsed = time.perf_counter() - started
+                with lock:
+                    statuses[status] += 1
+                    if status == '200':
+                        latencies.append(elapsed)
+                        if first is not None:
+                            first_event.append(first)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    result = {
+        'name': f"{target}_stream" if stream else target,
+        'requests': sum(statuses.values()),
+        'errors': sum(count for status, count in statuses.items() if status != '200'),
+        'statuses': dict(statuses),
+        'elapsed_seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 3) if elapsed else None,
+        **summarize_latencies(latencies)
+    }
+    if first_event:
+        result.update({f"first_event_{key}": value for key, value in summarize_latencies(first_event).items() if key != 'count'})
+    return result
+
+async def run_model_load(requests: int, concurrency: int, duration: Optional[float], args) -> Dict:
+    """Closed-loop load on send_request_to_server itself, through the pooled model service client."""
+    from benchmark.inputs import voice_request
+    from common.tcp_utils import close_model_service_client, get_micro_batcher, send_request_to_server
+    if args.batching:
+        config['batching'] = {'enabled': True, 'window_ms': args.batch_window_ms, 'max_batch_size': args.max_batch_size}
+    request = voice_request(args.audio_seconds)
+    messages = request['messages'][:1] + [{'role': 'user', 'content': [text]} for text in args.texts]
+    indexes = itertools.count()
+    deadline = time.monotonic() + duration if duration else None
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+
+    async def worker():
+        while True:
+            index = next(indexes)
+            if (deadline is None and index >= requests) or (deadline is not None and time.monotonic() >= deadline):
+                return
+            started = time.perf_counter()
+            try:
+                await send_request_to_server(messages, request['params'], use_cache=args.allow_coalescing)
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            statuses['success'] += 1
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        await close_model_service_client()
+    elapsed = time.perf_counter() - started
+    batcher = get_micro_batcher()
+    return {
+        'name': 'model',
+        'requests': sum(statuses.values()),
+        'errors': sum(count for status, count in statuses.items() if status != 'success'),
+        'statuses': dict(statuses),
+        'elapsed_seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 3) if elapsed else None,
+        **summarize_latencies(latencies),
+        **({'model_calls': batcher.calls, 'mean_batch_size': batcher.stats()['mean_batch_size']} if batcher is not None else {})
+    }
+
+def wait_for_port(host: str, port: int, timeout: float, process: subprocess.Popen):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with status {process.returncode}")
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"Nothing listening on {host}:{port} after {timeout}s")
+
+def spawn_services(stub_args: str, start_server: bool) -> List[subprocess.Popen]:
+    """Start the stand-in model service (and optionally the web server) on their conf.yaml ports."""
+    model_service_config = config.get('model_service', {})
+    processes = [subprocess.Popen([sys.executable, '-m', 'stub_service', *shlex.split(stub_args)], cwd=ROOT)]
+    try:
+        wait_for_port(model_service_config.get('host', 'localhost'), model_service_config.get('port', 9999), 30, processes[0])
+        if start_server:
+            processes.append(subprocess.Popen([sys.executable, MAIN_PATH], cwd=ROOT))
+            wait_for_port('localhost', config.get('server', {}).get('port', 8000), 60, processes[1])
+    except BaseException:
+        stop_services(processes)
+        raise
+    return processes
+
+def stop_services(processes: List[subprocess.Popen]):
+    for process in reversed(processes):
+        process.terminate()
+        process.wait()
+
+def main():
+    server_port = config.get('server', {}).get('port', 8000)
+    parser = argparse.ArgumentParser(description="Load test the web endpoints or the model service client")
+    parser.add_argument("--targets", nargs='+', choices=TARGETS, default=['voice_mimic', 'describe_photo'], help="What to load")
+    parser.add_argument("--url", type=str, default=f"http://localhost:{server_port}", help="Base URL of the web server")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per target (ignored with --duration)")
+    parser.add_argument("--duration", type=float, help="Run each target for this many seconds instead of a fixed request count")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests kept in flight")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming (SSE) variants of the web endpoints")
+    parser.add_argument("--texts", nargs='+', default=["The quick brown fox jumps over the lazy dog."], help="Prompts sent with each request")
+    parser.add_argument("--repeats", type=int, default=1, help="Repeats per request")
+    parser.add_argument("--audio_seconds", type=float, default=5.0, help="Length of the uploaded reference audio")
+    parser.add_argument("--image_size", type=int, default=1024, help="Width of the uploaded images (height is 3/4 of it)")
+    parser.add_argument("--distinct_inputs", type=int, default=1, help="Different uploads to cycle through; 1 measures the preprocessing cache hit path")
+    parser.add_argument("--allow_coalescing", action="store_true", help="Let identical concurrent requests share a model call (off: fresh_samples is set)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument("--server_pid", type=int, help="PID of the web server, to report its memory use")
+    parser.add_argument("--spawn", action="store_true", help="Start the stand-in model service and the web server for the run")
+    parser.add_argument("--stub_args", type=str, default="", help="Extra stub_service arguments with --spawn, e.g. \"--response_delay 0.2 --error_rate 0.01\"")
+    parser.add_argument("--batching", action="store_true", help="Micro-batch the model target's calls (web targets follow the server's conf.yaml)")
+    parser.add_argument("--batch_window_ms", type=float, default=5.0, help="Batching window with --batching")
+    parser.add_argument("--max_batch_size", type=int, default=8, help="Largest batch with --batching")
+    parser.add_argument("--output", type=str, help="Write the results as a JSON report to this file")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    http_targets = [target for target in args.targets if target in HTTP_TARGETS]
+    processes = spawn_services(args.stub_args, start_server=bool(http_targets)) if args.spawn else []
+    server_pid = processes[1].pid if len(processes) > 1 else args.server_pid
+    results = []
+    try:
+        for target in args.targets:
+            if target == 'model':
+                with RssSampler(None) as sampler:
+                    result = asyncio.run(run_model_load(args.requests, args.concurrency, args.duration, args))
+                result['client_max_rss_bytes'] = sampler.max_rss_bytes
+            else:
+                bodies = build_http_bodies(target, max(1, args.distinct_inputs), args)
+                with RssSampler(server_pid) as sampler:
+                    result = run_http_load(args.url, target, bodies, args.requests, args.concurrency,
+                                           args.duration, args.stream, args.timeout)
+                if server_pid:
+                    result['server_max_rss_bytes'] = sampler.max_rss_bytes
+                    result['server_peak_rss_bytes'] = process_rss_bytes(server_pid).get('peak_rss_bytes')
+                else:
+                    result['client_max_rss_bytes'] = sampler.max_rss_bytes
+            results.append(result)
+            print(f"{result['name']:<22} {result.get('requests_per_second') or 0:8.2f} req/s  "
+                  f"p50 {result.get('p50_ms', float('nan')):9.1f} ms  p95 {result.get('p95_ms', float('nan')):9.1f} ms  "
+                  f"p99 {result.get('p99_ms', float('nan')):9.1f} ms  errors {result['errors']}/{result['requests']}")
+    finally:
+        stop_services(processes)
+
+    if args.output:
+        settings = {key: value for key, value in vars(args).items() if key not in ('output', 'server_pid')}
+        write_report(args.output, 'load', settings, results)
+        print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
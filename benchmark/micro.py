@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List
+from benchmark.inputs import make_image, voice_request
+from benchmark.report import summarize_latencies, write_report
+from common.audio_utils import AudioProcessor
+from common.image_utils import ImageProcessor
+from common.upload_utils import ingest_path
+from common.wire_utils import encode_message, read_message
+from stub_service.server import make_wav
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WIRE_FORMATS = ('json', 'framed', 'multipart')
+
+Operation = Callable[[], Awaitable]
+
+def build_benchmarks(work_dir: str, audio_seconds: float, image_size: int) -> Dict[str, Callable[[], Operation]]:
+    """Benchmark setups by name; each builds its inputs untimed and returns the operation to time."""
+    wav_path = os.path.join(work_dir, 'reference.wav')
+
+    def audio_setup(operation: Operation) -> Callable[[], Operation]:
+        def setup() -> Operation:
+            if not os.path.exists(wav_path):
+                with open(wav_path, 'wb') as f:
+                    f.write(make_wav(audio_seconds, sample_rate=44100))
+            return operation
+        return setup
+
+    async def audio_numpy():
+        with ingest_path(wav_path, kind='audio') as upload:
+            return await AudioProcessor.condition_wav_upload(upload, 16000)
+
+    async def audio_pipeline():
+        with ingest_path(wav_path, kind='audio') as upload:
+            return await AudioProcessor.process_audio_pipeline(upload, 16000)
+
+    async def audio_legacy():
+        with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+            cleaned_path = AudioProcessor.process_audio(wav_path, temp_dir)
+            return AudioProcessor.load_and_validate_audio(cleaned_path, sample_rate=16000)
+
+    async def audio_cached():
+        # Every call after the warmup is a reference-audio cache hit
+        with ingest_path(wav_path, kind='audio') as upload:
+            return await AudioProcessor.load_cached_audio(upload, 16000)
+
+    def image_setup(image_format: str) -> Callable[[], Operation]:
+        def setup() -> Operation:
+            image = make_image(image_size, image_size * 3 // 4, image_format)
+
+            async def image_prepare():
+                return ImageProcessor.prepare_image_bytes(image)
+            return image_prepare
+        return setup
+
+    def encode_setup(wire_format: str) -> Callable[[], Operation]:
+        def setup() -> Operation:
+            request = voice_request(audio_seconds)
+
+            async def encode():
+                return sum(len(segment) for segment in encode_message(request, wire_format))
+            return encode
+        return setup
+
+    def decode_setup(wire_format: str) -> Callable[[], Operation]:
+        def setup() -> Operation:
+            encoded = b''.join(bytes(segment) for segment in encode_message(voice_request(audio_seconds), wire_format))
+
+            async def decode():
+                reader = asyncio.StreamReader()
+                reader.feed_data(encoded)
+                reader.feed_eof()
+                await read_message(reader)
+                return len(encoded)
+            return decode
+        return setup
+
+    benchmarks = {
+        'audio_numpy': audio_setup(audio_numpy),
+        'audio_pipeline': audio_setup(audio_pipeline),
+        'audio_legacy': audio_setup(audio_legacy),
+        'audio_cached': audio_setup(audio_cached),
+        'image_prepare_jpeg': image_setup('JPEG'),
+        'image_prepare_png': image_setup('PNG')
+    }
+    for wire_format in WIRE_FORMATS:
+        benchmarks[f"encode_{wire_format}"] = encode_setup(wire_format)
+        benchmarks[f"decode_{wire_format}"] = decode_setup(wire_format)
+    return benchmarks
+
+async def run_benchmark(name: str, setup: Callable[[], Operation], iterations: int, warmup: int) -> Dict:
+    """Time `iterations` sequential calls after `warmup` untimed ones; errors are reported, not raised."""
+    try:
+        operation = setup()
+        for _ in range(warmup):
+            await operation()
+        timings: List[float] = []
+        result = None
+        for _ in range(iterations):
+            started = time.perf_counter()
+            result = await operation()
+            timings.append(time.perf_counter() - started)
+    except Exception as e:
+        return {'name': name, 'error': f"{type(e).__name__}: {str(e)}"}
+
+    summary = summarize_latencies(timings)
+    record = {'name': name, **summary, 'ops_per_second': round(len(timings) / sum(timings), 2) if sum(timings) else None}
+    if isinstance(result, int):
+        record['bytes'] = result
+    return record
+
+async def run_suite(names: List[str], iterations: int, warmup: int, audio_seconds: float, image_size: int) -> List[Dict]:
+    with tempfile.TemporaryDirectory() as work_dir:
+        benchmarks = build_benchmarks(work_dir, audio_seconds, image_size)
+        results = []
+        for name in names or list(benchmarks):
+            if name not in benchmarks:
+                raise ValueError(f"Unknown benchmark {name!r}; use one of {', '.join(benchmarks)}")
+            results.append(await run_benchmark(name, benchmarks[name], iterations, warmup))
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for audio and image preprocessing and wire serialization")
+    parser.add_argument("--benchmarks", nargs='+', help="Benchmarks to run (default: all)")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed calls per benchmark")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed calls before timing starts")
+    parser.add_argument("--audio_seconds", type=float, default=10.0, help="Length of the reference audio clip")
+    parser.add_argument("--image_size", type=int, default=2048, help="Width of the test images (height is 3/4 of it)")
+    parser.add_argument("--output", type=str, help="Write the results as a JSON report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the per-call INFO logs of the code under test")
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    results = asyncio.run(run_suite(args.benchmarks, args.iterations, args.warmup, args.audio_seconds, args.image_size))
+    for result in results:
+        if 'error' in result:
+            print(f"{result['name']:<20} failed: {result['error']}")
+        else:
+            size = f"  {result['bytes'] / 1e6:8.2f} MB" if 'bytes' in result else ''
+            print(f"{result['name']:<20} p50 {result['p50_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms  "
+                  f"{result['ops_per_second']:9.1f} ops/s{size}")
+    if args.output:
+        settings = {key: value for key, value in vars(args).items() if key not in ('output', 'verbose')}
+        write_report(args.output, 'micro', settings, results)
+        print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import struct
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+import numpy as np
+from benchmark.report import write_report
+from common.audio_utils import AudioProcessor
+from common.dsp_utils import condition_wav
+from common.upload_utils import ingest_path
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tones below, inside and above the 200-3000 Hz band, plus noise
+TONES_HZ = (120, 440, 1000, 2500, 5000)
+SAMPLE_RATES = (8000, 16000, 22050, 44100, 48000)
+ENCODINGS = {'pcm16': (1, 16), 'pcm24': (1, 24), 'float32': (3, 32)}
+# Worst-case SNR (dB) of the NumPy output against each FFmpeg path before a case counts as a mismatch
+MIN_SNR_DB = {'single_pass': 40.0, 'legacy': 40.0}
+# The legacy FFmpeg + librosa path is the reference for loudness. The single-pass path downmixes
+# with FFmpeg's -ac 1, which sums stereo at -3 dB per channel instead of averaging, so its gain is only reported.
+MAX_GAIN_DB = 0.5
+MAX_LAG = 8
+
+def test_signal(seconds: float, sample_rate: int, channels: int) -> np.ndarray:
+    """Frames x channels of tones and noise at about -12 dBFS; channels differ in phase and noise."""
+    rng = np.random.default_rng(sample_rate * 10 + channels)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    columns = []
+    for channel in range(channels):
+        tones = sum(np.sin(2 * np.pi * f * t + channel) for f in TONES_HZ if f < sample_rate / 2)
+        columns.append(0.05 * tones + 0.02 * rng.standard_normal(len(t)))
+    return np.stack(columns, axis=1)
+
+def write_wav(path: str, samples: np.ndarray, sample_rate: int, encoding: str):
+    format_tag, bits = ENCODINGS[encoding]
+    frames, channels = samples.shape
+    if encoding == 'float32':
+        data = samples.astype('<f4').tobytes()
+    else:
+        scale = float(1 << (bits - 1))
+        ints = np.clip(np.round(samples * scale), -scale, scale - 1).astype('<i4')
+        data = ints.astype('<i2').tobytes() if bits == 16 else ints.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    block_align = channels * bits // 8
+    header = struct.pack(
+        '<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + len(data), b'WAVE', b'fmt ', 16, format_tag, channels,
+        sample_rate, sample_rate * block_align, block_align, bits, b'data', len(data)
+    )
+    with open(path, 'wb') as f:
+        f.write(header + data)
+
+def snr_db(reference: np.ndarray, candidate: np.ndarray) -> Tuple[float, int, float]:
+    """Gain-matched SNR of candidate against reference at the best alignment within MAX_LAG samples.
+
+    Returns (SNR dB, lag, gain dB of the reference relative to the candidate).
+    """
+    best = (-np.inf, 0, 0.0)
+    for lag in range(-MAX_LAG, MAX_LAG + 1):
+        ref = reference[max(0, lag):]
+        cand = candidate[max(0, -lag):]
+        n = min(len(ref), len(cand))
+        # Ignore the edges, where padding and filter start-up differ between implementations
+        edge = n // 20
+        ref, cand = ref[edge:n - edge].astype(np.float64), cand[edge:n - edge].astype(np.float64)
+        gain = np.dot(ref, cand) / np.dot(cand, cand)
+        noise = np.sum((ref - gain * cand) ** 2)
+        snr = 10 * np.log10(np.sum(ref ** 2) / noise) if noise else np.inf
+        best = max(best, (snr, lag, 20 * np.log10(abs(gain))))
+    return best
+
+async def run_case(work_dir: str, sample_rate: int, channels: int, encoding: str, seconds: float, target_rate: int) -> Dict:
+    path = os.path.join(work_dir, f"{sample_rate}_{channels}_{encoding}.wav")
+    write_wav(path, test_signal(seconds, sample_rate, channels), sample_rate, encoding)
+    case = {'name': f"{sample_rate}hz_{channels}ch_{encoding}"}
+
+    started = time.perf_counter()
+    ours = condition_wav(path, target_rate)
+    case['numpy_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    started = time.perf_counter()
+    with ingest_path(path, kind='audio') as upload:
+        single_pass = await AudioProcessor.process_audio_pipeline(upload, target_rate)
+    case['single_pass_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+        legacy = AudioProcessor.load_and_validate_audio(AudioProcessor.process_audio(path, temp_dir), sample_rate=target_rate)
+    case['legacy_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    for reference_name, reference in (('single_pass', single_pass), ('legacy', legacy)):
+        snr, lag, gain = snr_db(reference, ours)
+        case[f"snr_vs_{reference_name}_db"] = round(float(snr), 2)
+        case[f"gain_vs_{reference_name}_db"] = round(float(gain), 2)
+        case[f"lag_vs_{reference_name}"] = lag
+        case[f"length_diff_vs_{reference_name}"] = len(ours) - len(reference)
+    case['ok'] = (all(case[f"snr_vs_{name}_db"] >= minimum for name, minimum in MIN_SNR_DB.items())
+                  and abs(case['gain_vs_legacy_db']) <= MAX_GAIN_DB)
+    return case
+
+async def run_parity(seconds: float, target_rate: int, sample_rates: List[int]) -> List[Dict]:
+    cases = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for sample_rate in sample_rates:
+            for channels in (1, 2):
+                for encoding in ENCODINGS:
+                    cases.append(await run_case(work_dir, sample_rate, channels, encoding, seconds, target_rate))
+    return cases
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the NumPy audio conditioning against the FFmpeg and librosa paths")
+    parser.add_argument("--seconds", type=float, default=3.0, help="Length of each test signal")
+    parser.add_argument("--sample_rate", type=int, default=16000, help="Output sample rate")
+    parser.add_argument("--input_rates", type=int, nargs='+', default=list(SAMPLE_RATES), help="Input sample rates to test")
+    parser.add_argument("--output", type=str, help="Write the results as a JSON report to this file")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines instead of a table")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    cases = asyncio.run(run_parity(args.seconds, args.sample_rate, args.input_rates))
+    for case in cases:
+        if args.json:
+            print(json.dumps(case))
+        else:
+            print(f"{case['name']:<22} SNR vs single_pass {case['snr_vs_single_pass_db']:5.1f} dB "
+                  f"(gain {case['gain_vs_single_pass_db']:+5.2f} dB, lag {case['lag_vs_single_pass']:+d})  "
+                  f"vs legacy {case['snr_vs_legacy_db']:5.1f} dB (gain {case['gain_vs_legacy_db']:+5.2f} dB, lag {case['lag_vs_legacy']:+d})  "
+                  f"numpy {case['numpy_ms']:7.1f} ms  single_pass {case['single_pass_ms']:7.1f} ms  legacy {case['legacy_ms']:7.1f} ms"
+                  f"{'' if case['ok'] else '  MISMATCH'}")
+    if args.output:
+        write_report(args.output, 'parity', {k: v for k, v in vars(args).items() if k not in ('output', 'json')}, cases)
+    failed = [case['name'] for case in cases if not case['ok']]
+    if failed:
+        logger.error(f"NumPy conditioning differs from FFmpeg for: {', '.join(failed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
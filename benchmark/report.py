@@ -0,0 +1,110 @@
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Report format version; bump it when result fields change meaning
+REPORT_VERSION = 1
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Linearly interpolated percentile of already sorted values."""
+    if not sorted_values:
+        return float('nan')
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize_latencies(seconds: Sequence[float]) -> Dict:
+    """Count, mean and percentiles of latency samples, in milliseconds."""
+    values = sorted(seconds)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3),
+        'min_ms': round(values[0] * 1000, 3),
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3)
+    }
+
+def process_rss_bytes(pid: Optional[int] = None) -> Dict:
+    """Current and peak resident set size of a process (this one by default), from /proc when available."""
+    path = f"/proc/{pid or 'self'}/status"
+    try:
+        with open(path, 'r') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return {
+            'rss_bytes': int(fields['VmRSS'].split()[0]) * 1024,
+            'peak_rss_bytes': int(fields['VmHWM'].split()[0]) * 1024
+        }
+    except (OSError, KeyError, ValueError):
+        if pid is not None:
+            return {}
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {'peak_rss_bytes': peak if sys.platform == 'darwin' else peak * 1024}
+
+def git_revision() -> Optional[str]:
+    """Short commit of the working tree, with -dirty when it has local changes."""
+    try:
+        result = subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], cwd=ROOT, capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout.strip() or None
+
+def environment() -> Dict:
+    """What a result was measured on, so reports from different versions or machines are told apart."""
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+def write_report(path: str, suite: str, settings: Dict, results: List[Dict]):
+    """Write a benchmark run as one JSON document; each result is keyed by its `name`."""
+    report = {
+        'report_version': REPORT_VERSION,
+        'suite': suite,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'settings': settings,
+        'results': results
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+        f.write('\n')
+
+def load_report(path: str) -> Dict:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def compare_reports(baseline: Dict, candidate: Dict) -> List[Dict]:
+    """Relative change of every numeric field in results present in both reports."""
+    baseline_results = {result['name']: result for result in baseline.get('results', [])}
+    changes = []
+    for result in candidate.get('results', []):
+        before = baseline_results.get(result['name'])
+        if before is None:
+            continue
+        for field, value in result.items():
+            old = before.get(field)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            change = (value - old) / old if old else None
+            changes.append({'name': result['name'], 'field': field, 'baseline': old, 'candidate': value, 'change': change})
+    return changes
@@ -0,0 +1,92 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+from benchmark.report import ROOT, write_report
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAIN_PATH = os.path.join(ROOT, '__main__.py')
+
+MODES = ('help', 'describe_photo', 'voice_mimic', 'batch', 'server')
+
+# Heavy modules whose presence after startup is reported for each mode
+TRACKED_MODULES = ('librosa', 'numpy', 'PIL.Image', 'fastapi', 'uvicorn', 'scipy')
+
+# Modules a mode must not load; an import added in the wrong place shows up here
+FORBIDDEN_MODULES = {
+    'help': ('librosa', 'numpy', 'PIL.Image', 'fastapi', 'uvicorn'),
+    'describe_photo': ('librosa', 'fastapi', 'uvicorn'),
+    'voice_mimic': ('librosa', 'fastapi', 'uvicorn'),
+    'batch': ('librosa', 'uvicorn'),
+    'server': ('librosa',)
+}
+
+def probe_script(mode: str) -> str:
+    """Code run in a fresh interpreter: load __main__ and the mode's entry point, then report loaded modules."""
+    load = '' if mode == 'help' else f"ns['load_entry_point']({mode!r}); "
+    return (
+        f"import json, runpy, sys; ns = runpy.run_path({MAIN_PATH!r}, run_name='startup_benchmark'); "
+        f"ns['parse_args']().format_help(); {load}"
+        f"print(json.dumps([m for m in {list(TRACKED_MODULES)!r} if m in sys.modules]))"
+    )
+
+def measure(mode: str, runs: int) -> Dict:
+    """Cold-start a fresh interpreter `runs` times for a mode and summarise the wall times."""
+    times: List[float] = []
+    loaded: List[str] = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-c', probe_script(mode)], cwd=ROOT, capture_output=True, text=True
+        )
+        elapsed = time.perf_counter() - started
+        if result.returncode != 0:
+            error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit status {result.returncode}"
+            return {'mode': mode, 'error': error}
+        times.append(elapsed)
+        loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    return {
+        'mode': mode,
+        'runs': runs,
+        'min_seconds': round(min(times), 4),
+        'median_seconds': round(statistics.median(times), 4),
+        'max_seconds': round(max(times), 4),
+        'loaded': loaded,
+        'unexpected': [m for m in loaded if m in FORBIDDEN_MODULES[mode]]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start time of each frontend mode")
+    parser.add_argument("--modes", nargs='+', choices=MODES, default=list(MODES), help="Modes to measure")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters started per mode")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines instead of a table")
+    parser.add_argument("--output", type=str, help="Write the results as a JSON report to this file")
+    args = parser.parse_args()
+
+    results = [measure(mode, args.runs) for mode in args.modes]
+    for result in results:
+        if args.json:
+            print(json.dumps(result))
+        elif 'error' in result:
+            print(f"{result['mode']:<16} failed: {result['error']}")
+        else:
+            print(f"{result['mode']:<16} median {result['median_seconds'] * 1000:8.1f} ms  "
+                  f"min {result['min_seconds'] * 1000:8.1f} ms  loaded: {', '.join(result['loaded']) or '-'}")
+    if args.output:
+        write_report(args.output, 'startup', {'modes': args.modes, 'runs': args.runs},
+                     [{'name': result['mode'], **result} for result in results])
+    unexpected = {r['mode']: r['unexpected'] for r in results if r.get('unexpected')}
+    if unexpected:
+        logger.error(f"Modes loaded modules they should not: {unexpected}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
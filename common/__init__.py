@@ -1,4 +1,21 @@
-from .file_utils import FileHandler, AudioProcessingError
-from .audio_utils import AudioProcessor
-from .image_utils import ImageProcessor, ImageProcessingError
-from .tcp_utils import send_request_to_server
\ No newline at end of file
+import importlib
+
+# Exports are imported from their submodule on first access (PEP 562), so importing one
+# utility does not load the heavy dependencies of the others
+_EXPORTS = {
+    'FileHandler': 'file_utils',
+    'AudioProcessingError': 'file_utils',
+    'AudioProcessor': 'audio_utils',
+    'ImageProcessor': 'image_utils',
+    'ImageProcessingError': 'image_utils',
+    'send_request_to_server': 'tcp_utils'
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
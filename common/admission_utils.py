@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from .config import config
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class AdmissionRejectedError(RuntimeError):
+    """Raised when a request cannot be admitted; carries the HTTP status and Retry-After to answer with."""
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class AdmissionTicket:
+    """Capacity held by an admitted request; release it (or leave its `with` block) when the request ends."""
+    def __init__(self, controller: Optional['AdmissionController'], cost: int):
+        self.controller = controller
+        self.cost = cost
+        self.admitted_at = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        if self.controller is not None:
+            self.controller._release(self.cost, time.monotonic() - self.admitted_at)
+
+    def __enter__(self) -> 'AdmissionTicket':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def __del__(self):
+        # A streaming response dropped before it started never enters its `with` block
+        self.release()
+
+def model_service_capacity(model_service_config: Dict) -> int:
+    """Total connection pool size across the model service endpoints configured in conf.yaml."""
+    default_pool = model_service_config.get('pool', {}) or {}
+    endpoints = model_service_config.get('endpoints') or [{}]
+    total = 0
+    for endpoint in endpoints:
+        pool = endpoint.get('pool', default_pool) if isinstance(endpoint, dict) else default_pool
+        total += max(1, int((pool or {}).get('size', default_pool.get('size', 4))))
+    return total
+
+class AdmissionController:
+    """Caps the model calls in flight and queues the requests that would exceed the cap.
+
+    Each request is admitted with a cost (the number of model calls it may run at once) before
+    any preprocessing is done for it, and holds that capacity until it finishes. Requests wait in
+    FIFO order, at most `max_queue` of them, each for at most `queue_timeout` seconds. A request
+    is rejected right away with 429 when the queue is full, and with 503 when its expected wait
+    (from recent request durations) already exceeds its deadline or the deadline passes.
+    """
+    def __init__(self, max_in_flight: int = 4, max_queue: int = 16, queue_timeout: float = 30.0):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[List] = deque()
+        self._duration_ewma: Optional[float] = None
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_deadline = 0
+
+    @classmethod
+    def from_config(cls, admission_config: Dict) -> 'AdmissionController':
+        """Build a controller from the `admission` section of conf.yaml.
+
+        Without `max_in_flight`, the cap is the model service's total connection pool size, so
+        requests never wait inside the pool where only the model call timeout applies.
+        """
+        max_in_flight = admission_config.get('max_in_flight')
+        if max_in_flight is None:
+            max_in_flight = model_service_capacity(config.get('model_service', {}) or {})
+        return cls(
+            max_in_flight=max_in_flight,
+            max_queue=admission_config.get('max_queue', 16),
+            queue_timeout=admission_config.get('queue_timeout', 30.0)
+        )
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait(self, cost: int) -> Optional[float]:
+        """Rough wait for a new request: capacity queued ahead of it, drained at the recent request rate."""
+        if self._duration_ewma is None:
+            return None
+        queued_cost = sum(entry[0] for entry in self._waiters)
+        return self._duration_ewma * (queued_cost + cost) / self.max_in_flight
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait before retrying."""
+        wait = self.expected_wait(1) or 1.0
+        return max(1, min(60, math.ceil(wait)))
+
+    def _reject(self, message: str, status_code: int) -> AdmissionRejectedError:
+        logger.warning(f"Rejecting request: {message} ({self.in_flight}/{self.max_in_flight} in flight, {self.queued} queued)")
+        return AdmissionRejectedError(message, status_code, self.retry_after())
+
+    async def acquire(self, cost: int = 1, timeout: Optional[float] = None) -> AdmissionTicket:
+        """Wait for `cost` units of capacity, or raise AdmissionRejectedError."""
+        cost = min(max(1, int(cost)), self.max_in_flight)
+        timeout = self.queue_timeout if timeout is None else timeout
+        if not self._waiters and self.in_flight + cost <= self.max_in_flight:
+            self.in_flight += cost
+            self.admitted += 1
+            return AdmissionTicket(self, cost)
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise self._reject("Model service queue is full; try again later", 429)
+        expected = self.expected_wait(cost)
+        if expected is not None and expected > timeout:
+            self.rejected_deadline += 1
+            raise self._reject(f"Model service is saturated (expected wait {expected:.0f}s); try again later", 503)
+
+        entry = [cost, asyncio.get_running_loop().create_future()]
+        self._waiters.append(entry)
+        try:
+            async with asyncio.timeout(timeout):
+                await entry[1]
+        except BaseException as e:
+            if entry[1].done() and not entry[1].cancelled():
+                # Capacity was granted just as the wait ended; hand it back
+                self._release(cost, None)
+            else:
+                entry[1].cancel()
+                self._waiters.remove(entry)
+                self._grant()
+            if isinstance(e, TimeoutError):
+                self.rejected_deadline += 1
+                raise self._reject(f"Timed out after {timeout}s waiting for the model service", 503) from None
+            raise
+        self.admitted += 1
+        return AdmissionTicket(self, cost)
+
+    def _grant(self):
+        """Admit queued requests in order while capacity allows."""
+        while self._waiters and self.in_flight + self._waiters[0][0] <= self.max_in_flight:
+            cost, future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.in_flight += cost
+            future.set_result(None)
+
+    def _release(self, cost: int, duration: Optional[float]):
+        self.in_flight -= cost
+        if duration is not None:
+            self._duration_ewma = duration if self._duration_ewma is None else 0.2 * duration + 0.8 * self._duration_ewma
+        self._grant()
+
+    def stats(self) -> Dict:
+        return {
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'queued': self.queued,
+            'admitted': self.admitted,
+            'rejected_queue_full': self.rejected_queue_full,
+            'rejected_deadline': self.rejected_deadline,
+            'request_seconds_ewma': round(self._duration_ewma, 3) if self._duration_ewma is not None else None
+        }
+
+_controller: Optional[AdmissionController] = None
+
+def get_admission_controller() -> Optional[AdmissionController]:
+    """Return the shared admission controller, or None when disabled in conf.yaml."""
+    global _controller
+    admission_config = config.get('admission', {}) or {}
+    if not admission_config.get('enabled', True):
+        return None
+    if _controller is None:
+        _controller = AdmissionController.from_config(admission_config)
+    return _controller
+
+async def admit_request(cost: int = 1) -> AdmissionTicket:
+    """Admit a request that may run `cost` model calls at once; raises AdmissionRejectedError when overloaded."""
+    controller = get_admission_controller()
+    if controller is None:
+        return AdmissionTicket(None, cost)
+    return await controller.acquire(cost)
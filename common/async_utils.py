@@ -0,0 +1,128 @@
+import asyncio
+import contextlib
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Tuple
+from common.config import config  # Import configuration
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def repeat_concurrency(requested) -> int:
+    """Resolve a request's repeat concurrency against the limits in conf.yaml."""
+    repeats_config = config.get('repeats', {}) or {}
+    max_concurrency = max(1, int(repeats_config.get('max_concurrency', 4)))
+    if requested is None:
+        requested = repeats_config.get('default_concurrency', 1)
+    return max(1, min(int(requested), max_concurrency))
+
+async def gather_bounded(count: int, worker: Callable[[int], Awaitable[Any]], limit: int,
+                         return_exceptions: bool = False) -> List[Any]:
+    """Run worker(0..count-1) with at most `limit` in flight; results keep their index order.
+
+    Without return_exceptions, the first failure cancels the workers still pending and is raised.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(index: int):
+        async with semaphore:
+            return await worker(index)
+
+    tasks = [asyncio.ensure_future(run(index)) for index in range(count)]
+    try:
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+class _StreamFailure:
+    def __init__(self, error: Exception):
+        self.error = error
+
+_STREAM_END = object()
+
+async def merge_bounded(count: int, stream: Callable[[int], AsyncIterator[Any]], limit: int) -> AsyncIterator[Tuple[int, Any]]:
+    """Iterate stream(0..count-1) with at most `limit` active; yield (index, item) as items arrive from any of them.
+
+    The first failure is raised after cancelling the streams still running, as are all streams
+    when the consumer stops iterating.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run(index: int):
+        try:
+            async with semaphore:
+                async with contextlib.aclosing(stream(index)) as items:
+                    async for item in items:
+                        await queue.put((index, item))
+        except Exception as e:
+            await queue.put((index, _StreamFailure(e)))
+        finally:
+            await queue.put((index, _STREAM_END))
+
+    tasks = [asyncio.ensure_future(run(index)) for index in range(count)]
+    try:
+        remaining = count
+        while remaining:
+            index, item = await queue.get()
+            if item is _STREAM_END:
+                remaining -= 1
+            elif isinstance(item, _StreamFailure):
+                raise item.error
+            else:
+                yield index, item
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution whose result every caller shares."""
+    registry: Dict[str, 'SingleFlight'] = {}
+
+    def __init__(self, name: str):
+        self.name = name
+        self.executions = 0
+        self.coalesced = 0
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        SingleFlight.registry[name] = self
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Await factory() unless an identical call is already running, in which case share its result."""
+        future = self._in_flight.get(key)
+        if future is not None and future.get_loop() is asyncio.get_running_loop():
+            self.coalesced += 1
+            logger.debug(f"Coalesced {self.name} request with one already in flight")
+        else:
+            self.executions += 1
+            future = asyncio.ensure_future(factory())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+        # Shield so one caller going away (e.g. a closed browser tab) does not cancel the others
+        return await asyncio.shield(future)
+
+    def _finish(self, key: Hashable, future: asyncio.Future):
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        if not future.cancelled():
+            future.exception()  # Mark retrieved even if every caller was cancelled
+
+    def stats(self) -> Dict:
+        return {'executions': self.executions, 'coalesced': self.coalesced, 'in_flight': self.in_flight}
+
+def coalescing_enabled() -> bool:
+    return bool((config.get('coalescing', {}) or {}).get('enabled', True))
+
+def coalescing_stats() -> Dict[str, Dict]:
+    """Counters for every SingleFlight group, keyed by name."""
+    return {name: flight.stats() for name, flight in SingleFlight.registry.items()}
@@ -1,21 +1,38 @@
 import os
+import asyncio
 import logging
 import subprocess
+import tempfile
+from typing import Dict, Optional, Tuple
 import numpy as np
-import librosa
-from .file_utils import FileHandler, AudioProcessingError
+from .config import config
+from .async_utils import SingleFlight, coalescing_enabled
+from .cache_utils import content_hash, get_audio_cache
+from .dsp_utils import HIGHPASS_HZ, LOWPASS_HZ, condition_wav
+from .executor_utils import get_worker_pool, run_blocking
+from .file_utils import FileHandler, AudioProcessingError, is_wav
+from .metrics_utils import time_stage
+from .upload_utils import IngestedUpload
+from .vad_utils import trim_settings, trim_silence
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+AUDIO_FILTERS = f"highpass=f={HIGHPASS_HZ}, lowpass=f={LOWPASS_HZ}"
+PIPELINE_MODES = ('numpy', 'single_pass', 'legacy')
+
+_audio_flight = SingleFlight('audio_preprocessing')
+
 class AudioProcessor:
     """Handles audio processing operations."""
     @staticmethod
     def process_audio(input_path: str, temp_dir: str) -> str:
         """Process input audio file with FFmpeg cleaning steps."""
         try:
-            FileHandler.log_audio_file_info(input_path, "input stage")
+            diagnostics = FileHandler.diagnostics_enabled()
+            if diagnostics:
+                FileHandler.log_audio_file_info(input_path, "input stage")
             tmp1_file = os.path.join(temp_dir, 'cleaned1.wav')
             tmp2_file = os.path.join(temp_dir, 'cleaned2.wav')
 
@@ -28,33 +45,210 @@ class AudioProcessor:
             if result1.returncode != 0:
                 raise AudioProcessingError(f"FFmpeg error detection failed: {result1.stderr}")
 
-            FileHandler.log_audio_file_info(tmp1_file, "after error detection pass")
+            if diagnostics:
+                FileHandler.log_audio_file_info(tmp1_file, "after error detection pass", wav_header=True)
 
             cmd2 = [
                 "/usr/bin/ffmpeg", "-y", "-i", tmp1_file,
-                "-af", "highpass=f=200, lowpass=f=3000", tmp2_file
+                "-af", AUDIO_FILTERS, tmp2_file
             ]
             logger.info(f"Running FFmpeg command: {' '.join(cmd2)}")
             result2 = subprocess.run(cmd2, capture_output=True, text=True)
             if result2.returncode != 0:
                 raise AudioProcessingError(f"FFmpeg filtering failed: {result2.stderr}")
 
-            FileHandler.log_audio_file_info(tmp2_file, "after filtering pass")
+            if diagnostics:
+                FileHandler.log_audio_file_info(tmp2_file, "after filtering pass", wav_header=True)
             return tmp2_file
         except Exception as e:
             logger.error(f"Audio processing error: {str(e)}")
             raise
 
+    @staticmethod
+    def validate_audio(audio: np.ndarray) -> np.ndarray:
+        """Check that decoded audio is mono and contains only finite samples."""
+        if len(audio.shape) != 1:
+            raise AudioProcessingError("Audio must be mono")
+        if not np.isfinite(audio).all():
+            raise AudioProcessingError("Audio contains invalid values")
+        return audio
+
     @staticmethod
     def load_and_validate_audio(file_path: str, sample_rate: int = 16000) -> np.ndarray:
         """Load and validate audio file."""
+        # librosa takes seconds to import and only this fallback uses it
+        import librosa
         try:
             audio, sr = librosa.load(file_path, sr=sample_rate, mono=True)
-            if len(audio.shape) != 1:
-                raise AudioProcessingError("Audio must be mono")
-            if not np.isfinite(audio).all():
-                raise AudioProcessingError("Audio contains invalid values")
-            return audio
+            return AudioProcessor.validate_audio(audio)
         except Exception as e:
             logger.error(f"Audio loading error: {str(e)}")
             raise
+
+    @staticmethod
+    async def process_audio_pipeline(upload: IngestedUpload, sample_rate: int = 16000) -> np.ndarray:
+        """Decode, filter and resample audio in a single FFmpeg process, without temp files.
+
+        The upload is streamed to stdin in chunks and mono float32 PCM at `sample_rate` is read from stdout.
+        The FFmpeg process takes a worker pool slot, so `workers.max_workers` and `max_queue` bound it too.
+        """
+        with time_stage('ffmpeg_pipeline'):
+            async with get_worker_pool().slot():
+                return await AudioProcessor._run_audio_pipeline(upload, sample_rate)
+
+    @staticmethod
+    async def _run_audio_pipeline(upload: IngestedUpload, sample_rate: int) -> np.ndarray:
+        cmd = [
+            "/usr/bin/ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-err_detect", "ignore_err", "-i", "pipe:0",
+            "-af", f"{AUDIO_FILTERS}, aresample={sample_rate}",
+            "-ac", "1", "-f", "f32le", "-c:a", "pcm_f32le", "pipe:1"
+        ]
+        logger.info(f"Running FFmpeg pipeline: {' '.join(cmd)}")
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+
+        async def feed():
+            try:
+                for chunk in upload.iter_chunks():
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # FFmpeg stopped reading; its exit status and stderr report why
+                pass
+            finally:
+                process.stdin.close()
+
+        try:
+            _, stdout, stderr = await asyncio.gather(feed(), process.stdout.read(), process.stderr.read())
+            await process.wait()
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+            raise
+        if process.returncode != 0:
+            raise AudioProcessingError(f"FFmpeg pipeline failed: {stderr.decode('utf-8', errors='replace')}")
+        if not stdout:
+            raise AudioProcessingError("FFmpeg pipeline produced no audio")
+        audio = AudioProcessor.validate_audio(np.frombuffer(stdout, dtype=np.float32))
+        if FileHandler.diagnostics_enabled():
+            logger.info(f"Audio pipeline: {upload.size} input bytes -> {len(audio)} samples "
+                        f"({len(audio) / sample_rate:.2f} seconds at {sample_rate} Hz)")
+        return audio
+
+    @staticmethod
+    def is_wav_upload(upload: IngestedUpload) -> bool:
+        """Whether the upload starts with a RIFF/WAVE header."""
+        upload.file.seek(0)
+        return is_wav(upload.file.read(12))
+
+    @staticmethod
+    async def condition_wav_upload(upload: IngestedUpload, sample_rate: int = 16000) -> np.ndarray:
+        """Band-pass, downmix and resample a WAV upload in process with NumPy (see common.dsp_utils)."""
+        with time_stage('numpy_conditioning'):
+            if get_worker_pool().kind == 'thread':
+                audio = await run_blocking(condition_wav, upload.file, sample_rate)
+            else:
+                # Worker processes cannot share the spooled upload; hand them a file
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    input_path = os.path.join(temp_dir, 'input.wav')
+                    await asyncio.to_thread(upload.copy_to, input_path)
+                    audio = await run_blocking(condition_wav, input_path, sample_rate)
+        if FileHandler.diagnostics_enabled():
+            logger.info(f"NumPy conditioning: {upload.size} input bytes -> {len(audio)} samples "
+                        f"({len(audio) / sample_rate:.2f} seconds at {sample_rate} Hz)")
+        return audio
+
+    @staticmethod
+    def pipeline_mode() -> str:
+        mode = (config.get('audio', {}) or {}).get('pipeline', 'numpy')
+        if mode not in PIPELINE_MODES:
+            raise AudioProcessingError(f"Unsupported audio pipeline: {mode}. Use 'numpy', 'single_pass' or 'legacy'.")
+        return mode
+
+    @staticmethod
+    def cache_key(upload_hash: str, sample_rate: int) -> str:
+        """Cache key for preprocessed audio: upload content plus every setting that affects the result."""
+        settings = f"{upload_hash}|{sample_rate}|{AUDIO_FILTERS}|{AudioProcessor.pipeline_mode()}"
+        return content_hash(settings.encode('utf-8'))
+
+    @staticmethod
+    async def load_audio(upload: IngestedUpload, sample_rate: int = 16000) -> np.ndarray:
+        """Clean, resample and validate uploaded audio.
+
+        With `audio.pipeline` 'numpy', WAV uploads are conditioned in process and anything else goes
+        to the single-pass FFmpeg pipeline. That falls back to the two-pass FFmpeg + librosa path
+        (via files in a temporary directory) when it fails; 'legacy' always uses the two-pass path.
+        """
+        mode = AudioProcessor.pipeline_mode()
+        if mode == 'numpy':
+            if AudioProcessor.is_wav_upload(upload):
+                try:
+                    return await AudioProcessor.condition_wav_upload(upload, sample_rate)
+                except AudioProcessingError as e:
+                    logger.warning(f"NumPy audio conditioning failed, falling back to FFmpeg: {str(e)}")
+            mode = 'single_pass'
+        if mode == 'single_pass':
+            try:
+                return await AudioProcessor.process_audio_pipeline(upload, sample_rate)
+            except AudioProcessingError as e:
+                logger.warning(f"Single-pass audio pipeline failed, falling back to two-pass processing: {str(e)}")
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_path = os.path.join(temp_dir, os.path.basename(upload.filename) or "input.wav")
+            # Plain file I/O, so it stays off the preprocessing pool (which may be a process pool)
+            await asyncio.to_thread(upload.copy_to, input_path)
+            with time_stage('ffmpeg_clean'):
+                cleaned_audio_path = await run_blocking(AudioProcessor.process_audio, input_path, temp_dir)
+            with time_stage('librosa_load'):
+                return await run_blocking(AudioProcessor.load_and_validate_audio, cleaned_audio_path, sample_rate=sample_rate)
+
+    @staticmethod
+    async def load_cached_audio(upload: IngestedUpload, sample_rate: int = 16000) -> np.ndarray:
+        """Like load_audio, but served from the reference-audio cache when the same upload was processed before.
+
+        The cache key uses the hash computed while the upload was ingested, so a cache hit never reads
+        the content again. Concurrent requests for the same upload and settings share one preprocessing run,
+        which reads from its own handle on the first request's upload so that it keeps working when that
+        request is cancelled.
+        """
+        audio_cache = get_audio_cache()
+        cache_key = AudioProcessor.cache_key(upload.sha256, sample_rate)
+        if audio_cache is not None:
+            audio = audio_cache.get(cache_key)
+            if audio is not None:
+                logger.info(f"Using cached reference audio {cache_key[:12]} ({len(audio)} samples)")
+                return audio
+
+        async def load(source: IngestedUpload) -> np.ndarray:
+            with source:
+                audio = await AudioProcessor.load_audio(source, sample_rate=sample_rate)
+            if audio_cache is not None:
+                await audio_cache.put(cache_key, audio)
+            return audio
+
+        if not coalescing_enabled():
+            return await load(upload.retain())
+        # The handle is taken when the run starts, before this caller can go away
+        return await _audio_flight.run(cache_key, lambda: load(upload.retain()))
+
+    @staticmethod
+    async def load_reference_audio(upload: IngestedUpload, sample_rate: int = 16000) -> Tuple[np.ndarray, Optional[Dict]]:
+        """load_cached_audio, then trim silence and cap the length per `audio_trim` in conf.yaml.
+
+        The cache holds the untrimmed audio, so changing the trim settings never needs preprocessing again.
+        Returns the audio to send and its trim statistics (None when trimming is disabled).
+        """
+        audio = await AudioProcessor.load_cached_audio(upload, sample_rate=sample_rate)
+        settings = trim_settings()
+        if not settings['enabled']:
+            return audio, None
+        with time_stage('silence_trim'):
+            audio, trim_stats = trim_silence(audio, sample_rate, settings)
+        logger.info(f"Reference audio trimmed from {trim_stats['input_seconds']}s to {trim_stats['output_seconds']}s "
+                    f"({trim_stats['voiced_seconds']}s voiced{', capped' if trim_stats['capped'] else ''})")
+        return audio, trim_stats
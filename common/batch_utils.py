@@ -0,0 +1,118 @@
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, List
+from .config import config
+from .metrics_utils import Histogram
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = Histogram(
+    'minicpmo_model_batch_size', 'Requests combined into each model service call by the micro-batcher',
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+
+SendOne = Callable[[List[Dict], Dict], Awaitable[Dict]]
+# Returns one response per request, in order; a request that failed on its own is an exception instance
+SendBatch = Callable[[List[List[Dict]], Dict], Awaitable[List[Any]]]
+
+def params_key(params: Dict) -> str:
+    """Requests can share a batched call only when their params are identical."""
+    return json.dumps(params, sort_keys=True, default=str)
+
+class MicroBatcher:
+    """Holds model requests for up to `window` seconds and sends those with identical params as one call.
+
+    A group is sent when its window ends or when it reaches `max_size` requests. A group of one
+    is sent as an ordinary request. Each caller gets its own response, or the exception for its
+    request (or for the whole call).
+    """
+    def __init__(self, send_one: SendOne, send_batch: SendBatch, window: float = 0.005, max_size: int = 8):
+        self.send_one = send_one
+        self.send_batch = send_batch
+        self.window = max(0.0, float(window))
+        self.max_size = max(1, int(max_size))
+        self.calls = 0
+        self.batched_calls = 0
+        self.requests = 0
+        self._pending: Dict[str, Dict] = {}
+        self._dispatching: set = set()
+
+    @classmethod
+    def from_config(cls, batching_config: Dict, send_one: SendOne, send_batch: SendBatch) -> 'MicroBatcher':
+        """Build a batcher from the `batching` section of conf.yaml."""
+        return cls(
+            send_one, send_batch,
+            window=float(batching_config.get('window_ms', 5)) / 1000,
+            max_size=batching_config.get('max_batch_size', 8)
+        )
+
+    async def submit(self, messages: List[Dict], params: Dict) -> Dict:
+        loop = asyncio.get_running_loop()
+        key = params_key(params)
+        group = self._pending.get(key)
+        if group is None or group['loop'] is not loop:
+            group = {'loop': loop, 'params': params, 'items': [], 'timer': loop.call_later(self.window, self._flush, key)}
+            self._pending[key] = group
+        future = loop.create_future()
+        group['items'].append((messages, future))
+        if len(group['items']) >= self.max_size:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key: str):
+        group = self._pending.pop(key, None)
+        if group is None:
+            return
+        group['timer'].cancel()
+        task = group['loop'].create_task(self._dispatch(group['params'], group['items']))
+        self._dispatching.add(task)
+        task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, params: Dict, items: List):
+        # Callers that went away while the group was collecting are left out
+        items = [(messages, future) for messages, future in items if not future.done()]
+        if not items:
+            return
+        self.calls += 1
+        self.requests += len(items)
+        BATCH_SIZE.observe(len(items))
+        try:
+            if len(items) == 1:
+                results = [await self.send_one(items[0][0], params)]
+            else:
+                self.batched_calls += 1
+                logger.debug(f"Sending {len(items)} requests as one batched model service call")
+                results = await self.send_batch([messages for messages, _ in items], params)
+        except asyncio.CancelledError:
+            for _, future in items:
+                future.cancel()
+            raise
+        except Exception as e:
+            results = [e] * len(items)
+        for (_, future), result in zip(items, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict:
+        return {
+            'window_seconds': self.window,
+            'max_size': self.max_size,
+            'requests': self.requests,
+            'calls': self.calls,
+            'batched_calls': self.batched_calls,
+            'mean_batch_size': round(self.requests / self.calls, 3) if self.calls else None,
+            'pending': sum(len(group['items']) for group in self._pending.values())
+        }
+
+def batching_config() -> Dict:
+    return config.get('batching', {}) or {}
+
+def batching_enabled() -> bool:
+    return bool(batching_config().get('enabled', False))
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import numpy as np
+from .config import config
+from .executor_utils import run_blocking
+from .wire_utils import map_binary
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def content_hash(data) -> str:
+    """SHA-256 hex digest of bytes-like content."""
+    return hashlib.sha256(data).hexdigest()
+
+class LRUCache:
+    """Least-recently-used cache bounded by total size in bytes and/or number of entries.
+
+    With `ttl`, entries also expire that many seconds after they were stored. `on_evict(key, value)`
+    is called for entries dropped by the size bounds or by expiry, but not for pop() or clear().
+    """
+    def __init__(self, max_bytes: Optional[int] = None, max_entries: Optional[int] = None,
+                 ttl: Optional[float] = None, on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[2] is not None and entry[2] <= time.monotonic():
+            self._expire(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int = 0):
+        """Insert a value; values larger than max_bytes are not cached."""
+        if self.max_bytes is not None and size > self.max_bytes:
+            logger.debug(f"Not caching {key}: {size} bytes exceeds cache limit of {self.max_bytes} bytes")
+            return
+        self.pop(key)
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (value, size, expires_at)
+        self.current_bytes += size
+        while self._entries and (
+            (self.max_bytes is not None and self.current_bytes > self.max_bytes)
+            or (self.max_entries is not None and len(self._entries) > self.max_entries)
+        ):
+            evicted_key, (evicted, evicted_size, _) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self.current_bytes -= entry[1]
+        return entry[0]
+
+    def _expire(self, key: Hashable):
+        value = self.pop(key)
+        self.expirations += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def purge_expired(self):
+        """Drop every expired entry now rather than when it is next looked up."""
+        if self.ttl is None:
+            return
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry[2] <= now]:
+            self._expire(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self) -> Dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.current_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+def request_fingerprint(messages: List[Dict], params: Dict) -> str:
+    """Canonical hash of a model service request.
+
+    Binary content (audio arrays, image bytes) is hashed in place rather than serialized, and
+    the remaining structure is hashed as JSON with sorted keys.
+    """
+    def digest(item):
+        hasher = hashlib.sha256()
+        if isinstance(item, np.ndarray):
+            hasher.update(f"{item.dtype.str}{item.shape}".encode('utf-8'))
+            item = np.ascontiguousarray(item)
+        hasher.update(memoryview(item).cast('B'))
+        return {'$sha256': hasher.hexdigest()}
+
+    canonical = json.dumps(
+        {'messages': map_binary(messages, digest), 'params': params},
+        sort_keys=True, separators=(',', ':'), default=str
+    )
+    return content_hash(canonical.encode('utf-8'))
+
+def detach_views(obj: Any) -> Any:
+    """Copy of obj with memoryviews replaced by bytes, so a kept value does not pin a whole receive buffer."""
+    return map_binary(obj, lambda item: bytes(item) if isinstance(item, memoryview) else item)
+
+def payload_size(obj: Any) -> int:
+    """Total size in bytes of the binary content (audio, images) in a message or response."""
+    total = 0
+    def add(item):
+        nonlocal total
+        total += item.nbytes if isinstance(item, (np.ndarray, memoryview)) else len(item)
+        return item
+    map_binary(obj, add)
+    return total
+
+def _save_npy(path: str, audio: np.ndarray, disk_dir: str, disk_max_bytes: Optional[int]):
+    """Atomically write an array to the disk tier and trim the tier to its size limit."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, audio)
+    os.replace(tmp_path, path)
+    if disk_max_bytes is None:
+        return
+    entries = []
+    for name in os.listdir(disk_dir):
+        if name.endswith('.npy'):
+            entry_path = os.path.join(disk_dir, name)
+            try:
+                stat = os.stat(entry_path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry_path in sorted(entries):
+        if total <= disk_max_bytes:
+            break
+        try:
+            os.remove(entry_path)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+class AudioCache:
+    """Cache of preprocessed reference audio, keyed by upload content and processing settings.
+
+    Arrays are kept in a byte-bounded in-memory LRU. With `disk_dir` set, they are also written
+    as .npy files and memory-mapped on a memory miss, so they survive restarts and memory eviction.
+    """
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, disk_dir: Optional[str] = None,
+                 disk_max_bytes: Optional[int] = None):
+        self.memory = LRUCache(max_bytes=max_bytes)
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_hits = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, cache_config: Dict) -> 'AudioCache':
+        """Build a cache from the `audio_cache` section of conf.yaml."""
+        return cls(
+            max_bytes=cache_config.get('max_bytes', 256 * 1024 * 1024),
+            disk_dir=cache_config.get('disk_dir') or None,
+            disk_max_bytes=cache_config.get('disk_max_bytes')
+        )
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        audio = self.memory.get(key)
+        if audio is not None or not self.disk_dir:
+            return audio
+        path = self._disk_path(key)
+        try:
+            audio = np.load(path, mmap_mode='r')
+            os.utime(path)  # Keep recently used files out of disk eviction
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        self.disk_hits += 1
+        return audio
+
+    async def put(self, key: str, audio: np.ndarray):
+        audio.setflags(write=False)
+        self.memory.put(key, audio, audio.nbytes)
+        if self.disk_dir:
+            try:
+                await run_blocking(_save_npy, self._disk_path(key), audio, self.disk_dir, self.disk_max_bytes)
+            except Exception as e:
+                logger.warning(f"Failed to write audio cache entry {key} to disk: {str(e)}")
+
+    def stats(self) -> Dict:
+        return {**self.memory.stats(), 'disk_hits': self.disk_hits}
+
+_audio_cache: Optional[AudioCache] = None
+
+def get_audio_cache() -> Optional[AudioCache]:
+    """Return the shared reference-audio cache, or None when disabled in conf.yaml."""
+    global _audio_cache
+    cache_config = config.get('audio_cache', {}) or {}
+    if not cache_config.get('enabled', True):
+        return None
+    if _audio_cache is None:
+        _audio_cache = AudioCache.from_config(cache_config)
+    return _audio_cache
+
+_image_cache: Optional[LRUCache] = None
+
+def get_image_cache() -> Optional[LRUCache]:
+    """Return the shared cache of prepared (resized and re-encoded) images, or None when disabled."""
+    global _image_cache
+    cache_config = config.get('image_cache', {}) or {}
+    if not cache_config.get('enabled', True):
+        return None
+    if _image_cache is None:
+        _image_cache = LRUCache(max_bytes=cache_config.get('max_bytes', 64 * 1024 * 1024))
+    return _image_cache
+
+_response_cache: Optional[LRUCache] = None
+
+def get_response_cache() -> Optional[LRUCache]:
+    """Return the shared cache of deterministic model service responses, or None when disabled (the default)."""
+    global _response_cache
+    cache_config = config.get('response_cache', {}) or {}
+    if not cache_config.get('enabled', False):
+        return None
+    if _response_cache is None:
+        _response_cache = LRUCache(
+            max_bytes=cache_config.get('max_bytes', 256 * 1024 * 1024),
+            max_entries=cache_config.get('max_entries', 256),
+            ttl=cache_config.get('ttl', 300.0)
+        )
+    return _response_cache
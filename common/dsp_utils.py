@@ -0,0 +1,249 @@
+import functools
+import logging
+import math
+import struct
+from typing import BinaryIO, Iterator, Tuple, Union
+import numpy as np
+from .file_utils import AudioProcessingError, read_wav_chunks
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Band limits of the conditioning filter, the same as the FFmpeg `highpass`/`lowpass` filters
+HIGHPASS_HZ = 200
+LOWPASS_HZ = 3000
+# FFmpeg's default biquad width: Q of a Butterworth second-order section
+BIQUAD_Q = 1 / math.sqrt(2)
+# Input frames decoded and filtered at a time; bounds memory for long files
+BLOCK_FRAMES = 65536
+# The band-pass impulse response is cut off once it has decayed below this (relative to its peak)
+IMPULSE_TOLERANCE = 1e-9
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+class WavReader:
+    """Reads the samples of a PCM or IEEE float WAV file in blocks, as mono float64.
+
+    Supports 8/16/24/32-bit integer and 32/64-bit float samples, including WAVE_FORMAT_EXTENSIBLE.
+    """
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        fmt, self.data_offset, self.data_size = read_wav_chunks(f)
+        format_tag, self.channels, self.sample_rate, _, self.block_align, self.bits = struct.unpack('<HHIIHH', fmt[:16])
+        if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+            # The sub-format GUID starts with the plain format tag
+            format_tag = struct.unpack('<H', fmt[24:26])[0]
+        if format_tag == WAVE_FORMAT_PCM and self.bits in (8, 16, 24, 32):
+            self.is_float = False
+        elif format_tag == WAVE_FORMAT_IEEE_FLOAT and self.bits in (32, 64):
+            self.is_float = True
+        else:
+            raise AudioProcessingError(f"Unsupported WAV encoding (format {format_tag}, {self.bits} bits)")
+        if self.channels < 1 or self.sample_rate < 1 or self.block_align != self.channels * self.bits // 8:
+            raise AudioProcessingError("WAV fmt chunk is inconsistent")
+        self.frames = self.data_size // self.block_align
+
+    def _to_float(self, raw: bytes) -> np.ndarray:
+        if self.bits == 8:
+            samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float64) - 128) / 128
+        elif self.bits == 24:
+            triplets = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            values = triplets[:, 0] | (triplets[:, 1] << 8) | (triplets[:, 2] << 16)
+            samples = (values - ((values & 0x800000) << 1)) / float(1 << 23)
+        elif self.is_float:
+            samples = np.frombuffer(raw, dtype=f'<f{self.bits // 8}').astype(np.float64)
+            if not np.isfinite(samples).all():
+                raise AudioProcessingError("Audio contains invalid values")
+        else:
+            samples = np.frombuffer(raw, dtype=f'<i{self.bits // 8}') / float(1 << (self.bits - 1))
+        return samples
+
+    def iter_blocks(self, block_frames: int = BLOCK_FRAMES) -> Iterator[np.ndarray]:
+        """Yield mono blocks of up to block_frames samples; channels are averaged."""
+        self.f.seek(self.data_offset)
+        remaining = self.frames
+        while remaining > 0:
+            frames = min(block_frames, remaining)
+            raw = self.f.read(frames * self.block_align)
+            frames = len(raw) // self.block_align
+            if frames == 0:
+                return
+            samples = self._to_float(raw[:frames * self.block_align])
+            if self.channels > 1:
+                # Adding channel columns beats a reduction along the short channel axis
+                interleaved = samples.reshape(frames, self.channels)
+                samples = interleaved[:, 0].copy()
+                for channel in range(1, self.channels):
+                    samples += interleaved[:, channel]
+                samples /= self.channels
+            remaining -= frames
+            yield samples
+
+def biquad_coefficients(kind: str, cutoff: float, sample_rate: int, q: float = BIQUAD_Q) -> Tuple[np.ndarray, np.ndarray]:
+    """Normalized (b, a) of a second-order 'highpass' or 'lowpass' section, as FFmpeg designs them."""
+    if not 0 < cutoff < sample_rate / 2:
+        raise AudioProcessingError(f"{kind} cutoff {cutoff} Hz is outside (0, {sample_rate / 2}) Hz")
+    w0 = 2 * math.pi * cutoff / sample_rate
+    alpha = math.sin(w0) / (2 * q)
+    cos_w0 = math.cos(w0)
+    if kind == 'highpass':
+        b = np.array([(1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2])
+    else:
+        b = np.array([(1 - cos_w0) / 2, 1 - cos_w0, (1 - cos_w0) / 2])
+    a = np.array([1 + alpha, -2 * cos_w0, 1 - alpha])
+    return b / a[0], a / a[0]
+
+@functools.lru_cache(maxsize=16)
+def bandpass_impulse_response(sample_rate: int) -> np.ndarray:
+    """Impulse response of the highpass + lowpass cascade, long enough to have decayed to IMPULSE_TOLERANCE.
+
+    Obtained by sampling the sections' frequency response on an FFT grid, so convolving with it
+    reproduces the recursive (IIR) filters, phase included, without a per-sample loop.
+    """
+    sections = [biquad_coefficients('highpass', HIGHPASS_HZ, sample_rate), biquad_coefficients('lowpass', LOWPASS_HZ, sample_rate)]
+    # Both sections have complex poles of radius sqrt(a2); the slower one sets the decay
+    radius = max(math.sqrt(a[2]) for _, a in sections)
+    length = int(math.ceil(math.log(IMPULSE_TOLERANCE) / math.log(radius))) + 1
+    n_fft = 1 << (4 * length - 1).bit_length()
+    z_inv = np.exp(-2j * np.pi * np.arange(n_fft // 2 + 1) / n_fft)
+    response = np.ones_like(z_inv)
+    for b, a in sections:
+        response *= np.polyval(b[::-1], z_inv) / np.polyval(a[::-1], z_inv)
+    return np.fft.irfft(response, n_fft)[:length]
+
+class BandPassFilter:
+    """Streaming FIR convolution by FFT overlap-add; output blocks line up with input blocks.
+
+    Each block is cut into segments that are transformed together as one 2-D FFT.
+    """
+    def __init__(self, sample_rate: int):
+        self.impulse = bandpass_impulse_response(sample_rate)
+        overlap = len(self.impulse) - 1
+        self.n_fft = 1 << (8 * len(self.impulse) - 1).bit_length()
+        self.segment = self.n_fft - overlap
+        self.spectrum = np.fft.rfft(self.impulse, self.n_fft)
+        self.tail = np.zeros(overlap)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        n, overlap, segment = len(block), len(self.tail), self.segment
+        segments = -(-n // segment)
+        padded = np.zeros(segments * segment)
+        padded[:n] = block
+        pieces = np.fft.irfft(np.fft.rfft(padded.reshape(segments, segment), self.n_fft, axis=1) * self.spectrum, self.n_fft, axis=1)
+        out = np.zeros((segments + 1) * segment)
+        out[:-segment] = pieces[:, :segment].ravel()
+        # Each segment's convolution tail spills into the start of the next one
+        spill = np.zeros((segments, segment))
+        spill[:, :overlap] = pieces[:, segment:segment + overlap]
+        out[segment:] += spill.ravel()
+        out[:overlap] += self.tail
+        self.tail = out[n:n + overlap].copy()
+        return out[:n]
+
+@functools.lru_cache(maxsize=16)
+def resampling_filter(up: int, down: int) -> Tuple[np.ndarray, int]:
+    """Kaiser-windowed sinc anti-aliasing filter split into `up` polyphase branches.
+
+    Designed like scipy.signal.resample_poly: 10 zero crossings per side at the lower of the two
+    Nyquist rates, beta 5. Returns weights of shape (up, taps) ordered oldest sample first, and
+    the filter delay in upsampled samples.
+    """
+    max_rate = max(up, down)
+    half_length = 10 * max_rate
+    n = np.arange(2 * half_length + 1) - half_length
+    h = np.sinc(n / max_rate) * np.kaiser(2 * half_length + 1, 5.0)
+    h *= up / h.sum()
+    taps = -(-len(h) // up)
+    h = np.concatenate([h, np.zeros(taps * up - len(h))])
+    # Branch p holds h[p], h[p + up], ...; reversed so a window of input samples can be dotted with it directly
+    branches = h.reshape(taps, up).T[:, ::-1]
+    return np.ascontiguousarray(branches), half_length
+
+class PolyphaseResampler:
+    """Streaming rational resampler (up/down) with zero-phase output alignment, like resample_poly."""
+    def __init__(self, input_rate: int, output_rate: int):
+        divisor = math.gcd(input_rate, output_rate)
+        self.up, self.down = output_rate // divisor, input_rate // divisor
+        self.branches, self.delay = resampling_filter(self.up, self.down)
+        self.taps = self.branches.shape[1]
+        # Input samples before the start read as zeros
+        self.buffer = np.zeros(self.taps)
+        self.buffer_start = -self.taps
+        self.next_output = 0
+        self.input_frames = 0
+
+    def _last_input(self, k: int) -> int:
+        """Index of the newest input sample output k depends on."""
+        return (k * self.down + self.delay) // self.up
+
+    def _produce(self, end: int) -> np.ndarray:
+        """Compute outputs next_output..end-1 from the buffered input."""
+        count = end - self.next_output
+        if count <= 0:
+            return np.zeros(0)
+        out = np.empty(count)
+        windows = np.lib.stride_tricks.sliding_window_view(self.buffer, self.taps)
+        # Outputs `up` apart share a polyphase branch and step `down` samples through the input
+        for i in range(min(self.up, count)):
+            t = (self.next_output + i) * self.down + self.delay
+            start = t // self.up - self.taps + 1 - self.buffer_start
+            rows = len(range(i, count, self.up))
+            out[i::self.up] = windows[start:start + (rows - 1) * self.down + 1:self.down] @ self.branches[t % self.up]
+        self.next_output = end
+        keep_from = self._last_input(end) - self.taps + 1 - self.buffer_start
+        self.buffer = self.buffer[keep_from:]
+        self.buffer_start += keep_from
+        return out
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if self.up == self.down:
+            return block
+        self.buffer = np.concatenate([self.buffer, block])
+        self.input_frames += len(block)
+        available = self.buffer_start + len(self.buffer)
+        # Outputs whose newest input sample has arrived
+        end = max(self.next_output, -(-(available * self.up - self.delay) // self.down))
+        return self._produce(end)
+
+    def finish(self) -> np.ndarray:
+        """Remaining outputs, treating the input as zero past its end; ceil(n * up / down) in total."""
+        if self.up == self.down:
+            return np.zeros(0)
+        total = -(-self.input_frames * self.up // self.down)
+        needed = self._last_input(total - 1) + 1 - (self.buffer_start + len(self.buffer)) if total else 0
+        if needed > 0:
+            self.buffer = np.concatenate([self.buffer, np.zeros(needed)])
+        return self._produce(total)
+
+def condition_wav(source: Union[str, BinaryIO], sample_rate: int = 16000, block_frames: int = BLOCK_FRAMES) -> np.ndarray:
+    """Band-pass, downmix and resample a WAV file to mono float32 at sample_rate, in bounded memory.
+
+    Equivalent to FFmpeg `highpass=f=200, lowpass=f=3000` followed by resampling, without a
+    subprocess or temporary files. Raises AudioProcessingError for input it cannot handle, so
+    callers can fall back to FFmpeg.
+    """
+    f = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        reader = WavReader(f)
+        band_pass = BandPassFilter(reader.sample_rate)
+        resampler = PolyphaseResampler(reader.sample_rate, sample_rate)
+        output = np.empty(-(-reader.frames * resampler.up // resampler.down), dtype=np.float32)
+        position = 0
+
+        def append(samples: np.ndarray):
+            nonlocal position
+            output[position:position + len(samples)] = samples
+            position += len(samples)
+
+        for block in reader.iter_blocks(block_frames):
+            append(resampler.process(band_pass.process(block)))
+        append(resampler.finish())
+    finally:
+        if isinstance(source, str):
+            f.close()
+    if position == 0:
+        raise AudioProcessingError("WAV file contains no audio")
+    return output[:position]
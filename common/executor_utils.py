@@ -0,0 +1,112 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from common.config import config  # Import configuration
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class WorkerPoolFullError(RuntimeError):
+    """Raised when the preprocessing queue is full and a job cannot be accepted."""
+    pass
+
+class WorkerPool:
+    """Runs blocking preprocessing (FFmpeg, ffprobe, librosa, PIL) off the event loop.
+
+    At most `max_workers` jobs run at once, counting both executor jobs and work held in a
+    `slot()` (such as an FFmpeg subprocess driven from the event loop).
+    """
+    KINDS = ('thread', 'process')
+
+    def __init__(self, kind: str = 'thread', max_workers: int = 4, max_queue: int = 32):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unsupported worker kind: {kind}. Use 'thread' or 'process'.")
+        self.kind = kind
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.in_flight = 0
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_config(cls, workers_config: Dict) -> 'WorkerPool':
+        """Build a pool from the `workers` section of conf.yaml."""
+        return cls(
+            kind=workers_config.get('kind', 'thread'),
+            max_workers=workers_config.get('max_workers', 4),
+            max_queue=workers_config.get('max_queue', 32)
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of accepted jobs waiting for a free worker."""
+        return max(0, self.in_flight - self.max_workers)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            logger.info(f"Starting {self.kind} worker pool with {self.max_workers} workers (queue depth {self.max_queue})")
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='preprocess')
+        return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        # A semaphore belongs to one event loop; the CLI may run several loops in turn
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_workers)
+            self._slots_loop = loop
+        return self._slots
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Hold one worker slot, waiting in the queue for it; raises WorkerPoolFullError when the queue is full."""
+        if self.in_flight >= self.max_workers + self.max_queue:
+            logger.warning(f"Worker pool full: {self.in_flight} jobs in flight, queue depth {self.queue_depth}")
+            raise WorkerPoolFullError("Preprocessing queue is full; try again later")
+        self.in_flight += 1
+        try:
+            async with self._get_slots():
+                yield
+        finally:
+            self.in_flight -= 1
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) in the pool. With a process pool, func and its arguments must be picklable."""
+        async with self.slot():
+            loop = asyncio.get_running_loop()
+            call = functools.partial(func, *args, **kwargs)
+            if self.kind == 'thread':
+                # Keep the caller's context (request ID for logging) in the worker thread
+                call = functools.partial(contextvars.copy_context().run, call)
+            return await loop.run_in_executor(self._get_executor(), call)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+_pool: Optional[WorkerPool] = None
+
+def get_worker_pool() -> WorkerPool:
+    """Return the shared preprocessing pool configured from conf.yaml."""
+    global _pool
+    if _pool is None:
+        _pool = WorkerPool.from_config(config.get('workers', {}) or {})
+    return _pool
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking preprocessing step in the shared worker pool."""
+    return await get_worker_pool().run(func, *args, **kwargs)
+
+def shutdown_worker_pool():
+    """Stop the shared worker pool (call on shutdown)."""
+    if _pool is not None:
+        _pool.shutdown()
@@ -1,8 +1,11 @@
 import json
 import logging
 import os
+import random
+import struct
 import subprocess
-from typing import Dict
+from typing import BinaryIO, Dict, Tuple
+from .config import config
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -11,8 +14,90 @@ logger = logging.getLogger(__name__)
 class AudioProcessingError(Exception):
     pass
 
+DIAGNOSTICS_LEVELS = ('off', 'sampled', 'full')
+
+def is_wav(header: bytes) -> bool:
+    return len(header) >= 12 and header[:4] == b'RIFF' and header[8:12] == b'WAVE'
+
+def read_wav_chunks(f: BinaryIO) -> Tuple[bytes, int, int]:
+    """Walk the RIFF chunks of a WAV file; returns the fmt chunk and the offset and size of the data chunk.
+
+    Chunks are word-aligned (odd sizes are padded) and the whole fmt chunk is returned, so callers can
+    read WAVE_FORMAT_EXTENSIBLE fields. The data size is clamped to the end of the file.
+    """
+    f.seek(0)
+    if not is_wav(f.read(12)):
+        raise AudioProcessingError("Not a RIFF/WAVE file")
+    fmt = None
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            raise AudioProcessingError("WAV file is missing its fmt or data chunk")
+        chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+        if chunk_id == b'fmt ':
+            fmt = f.read(chunk_size + (chunk_size & 1))[:chunk_size]
+            if len(fmt) < 16:
+                raise AudioProcessingError("WAV fmt chunk is truncated")
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise AudioProcessingError("WAV data chunk precedes its fmt chunk")
+            data_offset = f.tell()
+            available = f.seek(0, os.SEEK_END) - data_offset
+            # Writers that cannot seek back leave the size unset; use the rest of the file
+            data_size = min(chunk_size, available) if chunk_size not in (0, 0xFFFFFFFF) else available
+            return fmt, data_offset, data_size
+        else:
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
 class FileHandler:
     """Handles file-related operations like info retrieval and logging."""
+    @staticmethod
+    def diagnostics_enabled() -> bool:
+        """Decide whether to log audio diagnostics for a request, per `audio.diagnostics` in conf.yaml."""
+        audio_config = config.get('audio', {}) or {}
+        level = audio_config.get('diagnostics', 'off')
+        if level not in DIAGNOSTICS_LEVELS:
+            logger.warning(f"Unknown audio diagnostics level {level!r}; diagnostics disabled")
+            return False
+        if level == 'sampled':
+            return random.random() < float(audio_config.get('diagnostics_sample_rate', 0.01))
+        return level == 'full'
+
+    @staticmethod
+    def read_wav_info(file_path: str) -> Dict:
+        """Read audio file information from a WAV header without spawning ffprobe."""
+        try:
+            file_size = os.path.getsize(file_path)
+            with open(file_path, 'rb') as f:
+                fmt, _, data_size = read_wav_chunks(f)
+
+            _, channels, sample_rate, byte_rate, _, _ = struct.unpack('<HHIIHH', fmt[:16])
+            return {
+                'file_path': file_path,
+                'file_size_bytes': file_size,
+                'duration_seconds': data_size / byte_rate if byte_rate else 0.0,
+                'sample_rate': sample_rate,
+                'channels': channels,
+                'bit_rate': byte_rate * 8,
+                'format_name': 'wav'
+            }
+        except AudioProcessingError:
+            raise
+        except Exception as e:
+            raise AudioProcessingError(f"Failed to read WAV header: {str(e)}")
+
+    @staticmethod
+    def pcm_to_wav(pcm, sample_rate: int, channels: int = 1, sample_width: int = 2) -> bytes:
+        """Wrap raw little-endian PCM samples in a minimal WAV header."""
+        byte_rate = sample_rate * channels * sample_width
+        header = struct.pack(
+            '<4sI4s4sIHHIIHH4sI',
+            b'RIFF', 36 + len(pcm), b'WAVE',
+            b'fmt ', 16, 1, channels, sample_rate, byte_rate, channels * sample_width, sample_width * 8,
+            b'data', len(pcm)
+        )
+        return header + bytes(pcm)
+
     @staticmethod
     def get_audio_file_info(file_path: str) -> Dict:
         """Retrieve audio file information using ffprobe."""
@@ -47,10 +132,17 @@ class FileHandler:
             raise AudioProcessingError(f"Failed to get audio file info: {str(e)}")
 
     @staticmethod
-    def log_audio_file_info(file_path: str, stage: str):
-        """Log audio file information for a given processing stage."""
+    def log_audio_file_info(file_path: str, stage: str, wav_header: bool = False):
+        """Log audio file information for a given processing stage.
+
+        With `wav_header`, the file is one we wrote ourselves and its WAV header is read directly
+        instead of running ffprobe. Failures are logged and never interrupt processing.
+        """
         try:
-            info = FileHandler.get_audio_file_info(file_path)
+            if wav_header:
+                info = FileHandler.read_wav_info(file_path)
+            else:
+                info = FileHandler.get_audio_file_info(file_path)
             logger.info(f"Audio file info at {stage}:")
             logger.info(f"  Path: {info['file_path']}")
             logger.info(f"  Size: {info['file_size_bytes']} bytes")
@@ -60,5 +152,4 @@ class FileHandler:
             logger.info(f"  Bit Rate: {info['bit_rate']} bps")
             logger.info(f"  Format: {info['format_name']}")
         except AudioProcessingError as e:
-            logger.error(f"Failed to log audio file info at {stage}: {str(e)}")
-            raise
\ No newline at end of file
+            logger.warning(f"Failed to log audio file info at {stage}: {str(e)}")
@@ -0,0 +1,124 @@
+import contextvars
+import hashlib
+import logging
+import random
+import uuid
+from typing import Any, Dict, Optional
+import numpy as np
+from .config import config
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = '%(levelname)s:%(name)s:[%(request_id)s] %(message)s'
+REQUEST_ID_HEADER = b'x-request-id'
+# Strings longer than this are summarized in payload summaries instead of being logged
+MAX_STRING_CHARS = 200
+MAX_DEPTH = 6
+
+# Correlation ID and verbose-logging decision of the request being handled; asyncio tasks inherit both
+_request_id: contextvars.ContextVar = contextvars.ContextVar('request_id', default='-')
+_verbose: contextvars.ContextVar = contextvars.ContextVar('verbose_logging', default=True)
+
+def logging_config() -> Dict:
+    return config.get('logging', {}) or {}
+
+def current_request_id() -> str:
+    return _request_id.get()
+
+def begin_request(request_id: Optional[str] = None) -> str:
+    """Tag log records in the current context with a correlation ID and decide whether its verbose events are logged.
+
+    Verbose events are logged for a `logging.verbose_sample_rate` fraction of requests. Outside a
+    request (the CLI modes), they are always logged.
+    """
+    request_id = request_id or uuid.uuid4().hex[:16]
+    _request_id.set(request_id)
+    _verbose.set(random.random() < float(logging_config().get('verbose_sample_rate', 0.01)))
+    return request_id
+
+def verbose_enabled(log: logging.Logger) -> bool:
+    """Whether verbose events should be logged: always at DEBUG, for sampled requests at INFO."""
+    return log.isEnabledFor(logging.DEBUG) or (_verbose.get() and log.isEnabledFor(logging.INFO))
+
+def log_verbose(log: logging.Logger, msg: str, *args):
+    """Log a per-request detail (parameters, messages, responses) at INFO if verbose_enabled.
+
+    Pass payloads as %-style arguments, wrapped in PayloadSummary, so nothing is formatted or
+    serialized for requests that are not logged.
+    """
+    if verbose_enabled(log):
+        log.info(msg, *args)
+
+def short_hash(data) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+def summarize(value: Any, depth: int = 0) -> Any:
+    """A small, JSON-like stand-in for a payload: binary data and long strings become sizes and hashes."""
+    if isinstance(value, np.ndarray):
+        return f"<{value.dtype}{list(value.shape)} sha256:{short_hash(np.ascontiguousarray(value))}>"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes sha256:{short_hash(value)}>"
+    if isinstance(value, str):
+        if len(value) <= MAX_STRING_CHARS:
+            return value
+        return f"<{len(value)} chars sha256:{short_hash(value.encode('utf-8', errors='replace'))}> {value[:40]!r}..."
+    if depth >= MAX_DEPTH:
+        return f"<{type(value).__name__}>"
+    if isinstance(value, dict):
+        return {key: summarize(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [summarize(item, depth + 1) for item in value]
+    return value
+
+class PayloadSummary:
+    """Log argument that summarizes a payload only when the record is actually formatted."""
+    __slots__ = ('value',)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        return str(summarize(self.value))
+
+_record_factory = logging.getLogRecordFactory()
+
+def _record_with_request_id(*args, **kwargs) -> logging.LogRecord:
+    record = _record_factory(*args, **kwargs)
+    record.request_id = _request_id.get()
+    return record
+
+def configure_logging():
+    """Add the request ID to every log record and set the root level and format from `logging` in conf.yaml."""
+    logging.setLogRecordFactory(_record_with_request_id)
+    settings = logging_config()
+    root = logging.getLogger()
+    root.setLevel(str(settings.get('level', 'INFO')).upper())
+    formatter = logging.Formatter(settings.get('format', LOG_FORMAT))
+    for handler in root.handlers:
+        handler.setFormatter(formatter)
+
+class RequestIdMiddleware:
+    """Give each HTTP request a correlation ID for its log records, echoed in the X-Request-ID response header.
+
+    A well-formed X-Request-ID sent by the client (or a proxy in front of the server) is reused.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        supplied = dict(scope['headers']).get(REQUEST_ID_HEADER, b'').decode('latin-1')
+        valid = 0 < len(supplied) <= 64 and all(c.isalnum() or c in '-_.' for c in supplied)
+        request_id = begin_request(supplied if valid else None)
+
+        async def send_with_request_id(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', []), (REQUEST_ID_HEADER, request_id.encode('latin-1'))]
+            await send(message)
+
+        await self.app(scope, receive, send_with_request_id)
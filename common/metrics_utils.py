@@ -0,0 +1,228 @@
+import bisect
+import contextvars
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from .config import config
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds; model round trips may take up to the 300 s model service timeout
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Bytes, 1 KiB to 256 MiB in steps of 4x
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))
+
+def metrics_enabled() -> bool:
+    return (config.get('metrics', {}) or {}).get('enabled', True)
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+class Metric:
+    """Base for metrics with a fixed set of label names; samples are kept per label-value tuple."""
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, Tuple[str, ...], Tuple[str, ...], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labelnames, labelvalues, value in self.samples():
+            lines.append(f"{name}{_format_labels(labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, self.labelnames, key, value
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the enclosed block as in progress."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, self.labelnames, key, value
+
+class Histogram(Metric):
+    """Bucketed distribution, rendered with cumulative `le` buckets so Prometheus can compute quantiles."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label tuple: [count per bucket (last one is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the enclosed block, whether or not it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: ([*counts], total) for key, (counts, total) in self._values.items()}
+        bucket_labels = (*self.labelnames, 'le')
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", bucket_labels, (*key, _format_value(bound)), cumulative
+            yield f"{self.name}_sum", self.labelnames, key, total
+            yield f"{self.name}_count", self.labelnames, key, cumulative
+
+REGISTRY: List[Metric] = []
+
+STAGE_SECONDS = Histogram(
+    'minicpmo_stage_seconds',
+    'Time spent in each processing stage (upload_read, numpy_conditioning, ffmpeg_pipeline, ffmpeg_clean, librosa_load, silence_trim, '
+    'image_encode, message_encode, message_decode, model_pool_wait, model_round_trip, model_stream)',
+    ['stage']
+)
+PAYLOAD_BYTES = Histogram(
+    'minicpmo_payload_bytes',
+    'Size of uploads and of messages exchanged with the model service',
+    ['kind'], buckets=SIZE_BUCKETS
+)
+HTTP_REQUESTS = Counter('minicpmo_http_requests_total', 'HTTP requests by endpoint and status code', ['endpoint', 'method', 'status'])
+HTTP_REQUEST_SECONDS = Histogram('minicpmo_http_request_seconds', 'HTTP request duration, including streamed responses', ['endpoint'])
+HTTP_IN_FLIGHT = Gauge('minicpmo_http_requests_in_flight', 'HTTP requests being handled')
+STREAM_ERRORS = Counter('minicpmo_stream_errors_total', 'Streamed responses that ended with an error event', ['endpoint'])
+MODEL_IN_FLIGHT = Gauge('minicpmo_model_calls_in_flight', 'Model service calls in flight by replica', ['endpoint'])
+MODEL_ERRORS = Counter('minicpmo_model_errors_total', 'Failed model service calls by kind (connection, timeout, server)', ['kind'])
+
+def time_stage(stage: str):
+    """Context manager observing the duration of a processing stage."""
+    return STAGE_SECONDS.time(stage=stage)
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+# The ASGI scope of the HTTP request being handled, so code deep in a request can label by endpoint
+_current_scope: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar('current_scope', default=None)
+
+def endpoint_label(scope: Optional[Dict]) -> str:
+    """Route template of a request (e.g. /outputs/{token}), keeping label cardinality bounded."""
+    if scope is None:
+        return 'none'
+    route = scope.get('route')
+    if route is not None and getattr(route, 'path_format', None):
+        return route.path_format
+    if 'endpoint' in scope:
+        # A mounted app such as /static; label it by its mount point
+        return scope.get('root_path') or scope.get('path', 'unknown')
+    return 'unmatched'
+
+def current_endpoint() -> str:
+    return endpoint_label(_current_scope.get())
+
+class MetricsMiddleware:
+    """Count HTTP requests by endpoint and status, and time them until the response body is complete."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = {'code': 500}
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        token = _current_scope.set(scope)
+        started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # Routing has filled in the matched route by now
+            endpoint = endpoint_label(scope)
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+            HTTP_REQUESTS.inc(endpoint=endpoint, method=scope['method'], status=str(status['code']))
+            _current_scope.reset(token)
@@ -0,0 +1,115 @@
+import base64
+import logging
+import os
+import secrets
+from typing import Dict, Optional, Tuple, Union
+from .cache_utils import LRUCache
+from .config import config
+from .executor_utils import run_blocking
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+OUTPUT_SUFFIX = '.out'
+
+def _write_file(path: str, data: bytes):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class OutputStore:
+    """Short-lived storage for generated files, served by token from /outputs/{token}.
+
+    Outputs are held in a byte-bounded in-memory LRU and expire `ttl` seconds after they are
+    stored. With `disk_dir` set, outputs of at least `spill_bytes` are written there instead of
+    being kept in memory; the disk tier is bounded by `disk_max_bytes`.
+    """
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024, ttl: float = 600.0,
+                 disk_dir: Optional[str] = None, disk_max_bytes: Optional[int] = None,
+                 spill_bytes: int = 1024 * 1024):
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.spill_bytes = spill_bytes
+        self.memory = LRUCache(max_bytes=max_bytes, ttl=ttl)
+        self.disk = LRUCache(max_bytes=disk_max_bytes, ttl=ttl, on_evict=lambda token, entry: _remove_file(entry[0]))
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            # Tokens do not survive a restart, so files left by a previous run can never be served
+            for name in os.listdir(disk_dir):
+                if name.endswith(OUTPUT_SUFFIX):
+                    _remove_file(os.path.join(disk_dir, name))
+
+    @classmethod
+    def from_config(cls, outputs_config: Dict) -> 'OutputStore':
+        """Build a store from the `outputs` section of conf.yaml."""
+        return cls(
+            max_bytes=outputs_config.get('max_bytes', 128 * 1024 * 1024),
+            ttl=outputs_config.get('ttl', 600.0),
+            disk_dir=outputs_config.get('disk_dir') or None,
+            disk_max_bytes=outputs_config.get('disk_max_bytes'),
+            spill_bytes=outputs_config.get('spill_bytes', 1024 * 1024)
+        )
+
+    async def put(self, data: Union[bytes, bytearray, memoryview], media_type: str) -> Optional[str]:
+        """Store an output and return its token, or None if it is too large to keep in memory."""
+        # Copy, so that a view into a larger response buffer does not keep the whole buffer alive
+        data = bytes(data)
+        token = secrets.token_urlsafe(16)
+        self.disk.purge_expired()
+        if self.disk_dir and len(data) >= self.spill_bytes:
+            path = os.path.join(self.disk_dir, f"{token}{OUTPUT_SUFFIX}")
+            try:
+                await run_blocking(_write_file, path, data)
+                self.disk.put(token, (path, media_type), len(data))
+                if token in self.disk:
+                    return token
+                _remove_file(path)
+                logger.warning(f"Output of {len(data)} bytes exceeds the disk limit, keeping it in memory")
+            except Exception as e:
+                logger.warning(f"Failed to spill output {token} to disk, keeping it in memory: {str(e)}")
+        self.memory.put(token, (data, media_type), len(data))
+        if token not in self.memory:
+            logger.warning(f"Output of {len(data)} bytes exceeds the output store limit and was not stored")
+            return None
+        return token
+
+    def get(self, token: str) -> Optional[Tuple[Union[bytes, str], str]]:
+        """Return (data, media_type) for in-memory outputs, (path, media_type) for spilled ones, or None."""
+        entry = self.memory.get(token)
+        if entry is None and self.disk_dir:
+            entry = self.disk.get(token)
+        return entry
+
+    def stats(self) -> Dict:
+        return {'memory': self.memory.stats(), 'disk': self.disk.stats()}
+
+_output_store: Optional[OutputStore] = None
+
+def get_output_store() -> Optional[OutputStore]:
+    """Return the shared output store, or None when disabled in conf.yaml."""
+    global _output_store
+    outputs_config = config.get('outputs', {}) or {}
+    if not outputs_config.get('enabled', True):
+        return None
+    if _output_store is None:
+        _output_store = OutputStore.from_config(outputs_config)
+    return _output_store
+
+def output_url(token: str) -> str:
+    return f"/outputs/{token}"
+
+async def publish_output(data: Union[bytes, bytearray, memoryview], media_type: str) -> str:
+    """URL for a generated file: an /outputs/ link, or a data URI when the output store is disabled or full."""
+    store = get_output_store()
+    token = await store.put(data, media_type) if store is not None else None
+    if token is None:
+        return f"data:{media_type};base64,{base64.b64encode(data).decode('utf-8')}"
+    return output_url(token)
@@ -0,0 +1,33 @@
+import json
+import logging
+from typing import AsyncIterator, Dict, Tuple
+from starlette.responses import StreamingResponse
+from .metrics_utils import STREAM_ERRORS, current_endpoint
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Disable caching and proxy buffering (nginx) so events reach the browser as soon as they are sent
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def sse_event(event: str, data: Dict) -> str:
+    """Format one server-sent event with a JSON data line."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def sse_response(events: AsyncIterator[Tuple[str, Dict]]) -> StreamingResponse:
+    """Stream (event, data) pairs as text/event-stream.
+
+    The HTTP status is already sent when the first event goes out, so a failure while
+    streaming is reported to the client as a final `error` event.
+    """
+    async def stream():
+        try:
+            async for event, data in events:
+                yield sse_event(event, data)
+        except Exception as e:
+            STREAM_ERRORS.inc(endpoint=current_endpoint())
+            logger.error(f"Error while streaming results: {str(e)}")
+            yield sse_event('error', {'detail': str(e)})
+
+    return StreamingResponse(stream(), media_type='text/event-stream', headers=SSE_HEADERS)
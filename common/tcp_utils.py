@@ -1,68 +1,659 @@
-import json
 import logging
 import asyncio
+import random
 import socket
-import base64
-import numpy as np
-from typing import Dict, List
+import time
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Union
 import os
 from common.config import config  # Import configuration
+from common.wire_utils import WIRE_FORMATS, WireProtocolError, read_message, write_message
+from common.async_utils import SingleFlight, coalescing_enabled
+from common.batch_utils import MicroBatcher, batching_config, batching_enabled
+from common.cache_utils import detach_views, get_response_cache, payload_size, request_fingerprint
+from common.log_utils import PayloadSummary
+from common.metrics_utils import MODEL_ERRORS, MODEL_IN_FLIGHT, STAGE_SECONDS, time_stage
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def send_request_to_server(messages: List[Dict], params: Dict) -> Dict:
-    """Send a request to the model service asynchronously."""
-    model_service_config = config.get('model_service', {})
-    host = model_service_config.get('host', 'localhost')
-    port = model_service_config.get('port', 9999)
-    timeout = model_service_config.get('timeout', 300.0)
-    
-    try:
-        logger.info(f"Connecting to model service at {host}:{port}")
-        async with asyncio.timeout(timeout):
-            reader, writer = await asyncio.open_connection(host, port)
-        
-        # Prepare request
-        for msg in messages:
-            for i, item in enumerate(msg['content']):
-                if isinstance(item, np.ndarray):
-                    msg['content'][i] = f"base64:{base64.b64encode(item.tobytes()).decode('utf-8')}"
-
-        request = {'messages': messages, 'params': params}
-        logger.debug(f"Sending request: {json.dumps(request, default=str)[:200]}...")
-        writer.write(json.dumps(request).encode('utf-8'))
-        await writer.drain()
-
-        # Receive response
-        data = b""
+class ModelServiceError(RuntimeError):
+    """The model service answered with an error."""
+
+class ModelServiceTimeoutError(RuntimeError):
+    """The model service did not answer within the configured timeout."""
+
+# Failures that mean a replica could not be reached or dropped the connection, as opposed to
+# errors it reported; requests failing this way can be retried on another replica
+CONNECTION_ERRORS = (OSError, EOFError, WireProtocolError)
+
+class PooledConnection:
+    """A keep-alive connection to the model service."""
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, loop: asyncio.AbstractEventLoop):
+        self.reader = reader
+        self.writer = writer
+        self.loop = loop
+        self.last_used = time.monotonic()
+        self.uses = 0
+
+    def is_healthy(self) -> bool:
+        """Check that the server has not closed or broken the connection while it was idle."""
+        if self.writer.is_closing() or self.reader.at_eof():
+            return False
+        if self.reader.exception() is not None:
+            return False
+        return self.loop is asyncio.get_running_loop()
+
+    def idle_for(self) -> float:
+        return time.monotonic() - self.last_used
+
+    def close(self):
+        try:
+            self.writer.close()
+        except RuntimeError:
+            # The loop that owned this connection is already closed
+            pass
+
+class ModelServiceClient:
+    """Pooled TCP client for the model service with keep-alive connections."""
+    def __init__(self, host: str = 'localhost', port: int = 9999, timeout: float = 300.0,
+                 pool_size: int = 4, idle_timeout: float = 60.0, keep_alive: bool = True,
+                 wire_format: str = 'json'):
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError(f"Unsupported wire_format: {wire_format}. Use one of {', '.join(WIRE_FORMATS)}.")
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.pool_size = max(1, int(pool_size))
+        self.idle_timeout = idle_timeout
+        self.keep_alive = keep_alive
+        self.wire_format = wire_format
+        # In 'auto' mode, None until the model service has shown which wire format it answers in
+        self._peer_format: Optional[str] = None
+        self._idle: List[PooledConnection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_config(cls, model_service_config: Dict) -> 'ModelServiceClient':
+        """Build a client from the `model_service` section of conf.yaml."""
+        pool_config = model_service_config.get('pool', {}) or {}
+        return cls(
+            host=model_service_config.get('host', 'localhost'),
+            port=model_service_config.get('port', 9999),
+            timeout=model_service_config.get('timeout', 300.0),
+            pool_size=pool_config.get('size', 4),
+            idle_timeout=pool_config.get('idle_timeout', 60.0),
+            keep_alive=pool_config.get('keep_alive', True),
+            wire_format=model_service_config.get('wire_format', 'json')
+        )
+
+    def _bind_loop(self):
+        """Reset pool state when used from a new event loop (e.g. successive asyncio.run calls)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
+            self._slots = asyncio.Semaphore(self.pool_size)
+            self._loop = loop
+
+    def _evict_idle(self):
+        """Close idle connections that exceeded the idle timeout or are no longer usable."""
+        keep = []
+        for conn in self._idle:
+            if conn.idle_for() > self.idle_timeout or not conn.is_healthy():
+                logger.debug(f"Evicting idle connection to {self.host}:{self.port} after {conn.idle_for():.1f}s")
+                conn.close()
+            else:
+                keep.append(conn)
+        self._idle = keep
+
+    async def _connect(self) -> PooledConnection:
+        logger.info(f"Connecting to model service at {self.host}:{self.port}")
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        sock = writer.get_extra_info('socket')
+        if sock is not None and self.keep_alive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        return PooledConnection(reader, writer, asyncio.get_running_loop())
+
+    async def _checkout(self) -> PooledConnection:
+        """Return a healthy idle connection, or open a new one."""
+        self._evict_idle()
+        while self._idle:
+            conn = self._idle.pop()
+            if conn.is_healthy():
+                return conn
+            conn.close()
+        return await self._connect()
+
+    def _checkin(self, conn: PooledConnection, reusable: bool):
+        conn.last_used = time.monotonic()
+        conn.uses += 1
+        if reusable and self.keep_alive and conn.is_healthy():
+            self._idle.append(conn)
+        else:
+            conn.close()
+        self._evict_idle()
+
+    def _request_format(self) -> str:
+        if self.wire_format == 'auto':
+            return self._peer_format or 'json'
+        return self.wire_format
+
+    def _write_request(self, conn: PooledConnection, request: Dict) -> bool:
+        """Queue a request on the connection; returns whether it negotiates the wire format."""
+        negotiating = self.wire_format == 'auto' and self._peer_format is None
+        if negotiating:
+            # Offer binary formats; servers that only speak bare JSON ignore the hint
+            request = {**request, 'accept_formats': ['multipart', 'framed']}
+        write_message(conn.writer, request, self._request_format())
+        return negotiating
+
+    async def _read_response(self, conn: PooledConnection, negotiating: bool) -> Dict:
+        response, response_format = await read_message(conn.reader)
+        if negotiating:
+            self._peer_format = response_format
+            logger.info(f"Model service at {self.host}:{self.port} uses the {response_format} wire format")
+        return response
+
+    async def _exchange(self, conn: PooledConnection, request: Dict) -> Dict:
+        """Write one request on the connection and read back one response."""
+        with time_stage('model_round_trip'):
+            negotiating = self._write_request(conn, request)
+            await conn.writer.drain()
+            return await self._read_response(conn, negotiating)
+
+    async def send_request(self, messages: List[Dict], params: Dict) -> Dict:
+        """Send a request to the model service over a pooled connection."""
+        return await self._send({'messages': messages, 'params': params})
+
+    async def send_batch_request(self, batch: List[List[Dict]], params: Dict) -> List[Union[Dict, ModelServiceError]]:
+        """Send several requests that share `params` as one call and return their responses in order.
+
+        The batched form is {'batch': [{'messages': ...}, ...], 'params': ...}, answered with
+        {'status': 'success', 'batch': [response, ...]}. Entries the model service answered with
+        an error are returned as ModelServiceError instances.
+        """
+        response = await self._send({'batch': [{'messages': messages} for messages in batch], 'params': params})
+        responses = response.get('batch')
+        if not isinstance(responses, list) or len(responses) != len(batch):
+            raise ModelServiceError(f"Model service did not answer the batched request: {PayloadSummary(response)}")
+        return [ModelServiceError(f"Server error: {r['error']}") if 'error' in r else r for r in responses]
+
+    async def _send(self, request: Dict) -> Dict:
+        self._bind_loop()
+
+        # Binary content (audio arrays, image bytes) is encoded by write_message for the wire format in use
+        logger.debug("Sending request: %s", PayloadSummary(request))
+
+        MODEL_IN_FLIGHT.inc(endpoint=self.endpoint)
+        try:
+            async with asyncio.timeout(self.timeout):
+                waiting_since = time.perf_counter()
+                async with self._slots:
+                    STAGE_SECONDS.observe(time.perf_counter() - waiting_since, stage='model_pool_wait')
+                    conn = await self._checkout()
+                    try:
+                        response = await self._exchange(conn, request)
+                    except (ConnectionResetError, BrokenPipeError) as e:
+                        conn.close()
+                        if conn.uses == 0:
+                            raise
+                        # The server dropped a reused keep-alive connection; retry once on a fresh one
+                        logger.info(f"Reused connection to {self.host}:{self.port} was stale ({e}); reconnecting")
+                        conn = await self._connect()
+                        try:
+                            response = await self._exchange(conn, request)
+                        except BaseException:
+                            conn.close()
+                            raise
+                    except BaseException:
+                        conn.close()
+                        raise
+                    self._checkin(conn, reusable=True)
+
+            logger.debug("Received response: %s", PayloadSummary(response))
+
+            if 'error' in response:
+                logger.error(f"Model service error: {response['error']}")
+                raise ModelServiceError(f"Server error: {response['error']}")
+
+            return response
+        except asyncio.TimeoutError:
+            MODEL_ERRORS.inc(kind='timeout')
+            logger.error(f"Request to model service at {self.host}:{self.port} timed out after {self.timeout} seconds")
+            raise ModelServiceTimeoutError(f"Model service timeout after {self.timeout} seconds")
+        except Exception as e:
+            MODEL_ERRORS.inc(kind='server' if isinstance(e, ModelServiceError) else 'connection')
+            logger.error(f"Error communicating with model service at {self.host}:{self.port}: {str(e)}")
+            raise
+        finally:
+            MODEL_IN_FLIGHT.dec(endpoint=self.endpoint)
+
+    async def stream_request(self, messages: List[Dict], params: Dict) -> AsyncIterator[Dict]:
+        """Send a streaming request and yield the model service's messages as they arrive.
+
+        The request carries `stream: true` in its params. A streaming model service answers with
+        any number of partial messages (`status: "partial"`, holding a text delta or a chunk of
+        PCM audio for one prompt) followed by an ordinary final response, which is yielded last.
+        A service without streaming support just sends the final response. `timeout` applies to
+        the wait for each message rather than to the whole stream.
+        """
+        self._bind_loop()
+        request = {'messages': messages, 'params': {**params, 'stream': True}}
+
+        MODEL_IN_FLIGHT.inc(endpoint=self.endpoint)
+        started = time.perf_counter()
+        try:
+            async with self._slots:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage='model_pool_wait')
+                conn = await asyncio.wait_for(self._checkout(), self.timeout)
+                received = 0
+                finished = False
+                try:
+                    while not finished:
+                        try:
+                            if received == 0:
+                                negotiating = self._write_request(conn, request)
+                                await conn.writer.drain()
+                            else:
+                                negotiating = False
+                            message = await asyncio.wait_for(self._read_response(conn, negotiating), self.timeout)
+                        except (ConnectionResetError, BrokenPipeError) as e:
+                            if received or conn.uses == 0:
+                                raise
+                            # The server dropped a reused keep-alive connection before answering; retry once
+                            logger.info(f"Reused connection to {self.host}:{self.port} was stale ({e}); reconnecting")
+                            conn.close()
+                            conn = await asyncio.wait_for(self._connect(), self.timeout)
+                            continue
+                        except asyncio.TimeoutError:
+                            MODEL_ERRORS.inc(kind='timeout')
+                            logger.error(f"Stream from model service at {self.host}:{self.port} stalled for {self.timeout} seconds")
+                            raise ModelServiceTimeoutError(f"Model service timeout after {self.timeout} seconds")
+
+                        received += 1
+                        finished = message.get('status') != 'partial'
+                        if finished and 'error' in message:
+                            MODEL_ERRORS.inc(kind='server')
+                            logger.error(f"Model service error: {message['error']}")
+                            raise ModelServiceError(f"Server error: {message['error']}")
+                        yield message
+                finally:
+                    # A stream abandoned half-way leaves unread messages on the connection
+                    if finished:
+                        self._checkin(conn, reusable=True)
+                    else:
+                        conn.close()
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='model_stream')
+        except CONNECTION_ERRORS:
+            MODEL_ERRORS.inc(kind='connection')
+            raise
+        finally:
+            MODEL_IN_FLIGHT.dec(endpoint=self.endpoint)
+
+    async def close(self):
+        """Close all idle connections."""
+        for conn in self._idle:
+            conn.close()
+            try:
+                await conn.writer.wait_closed()
+            except Exception:
+                pass
+        self._idle.clear()
+
+    @property
+    def endpoint(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    def stats(self) -> Dict:
+        return {'endpoint': self.endpoint, 'idle_connections': len(self._idle)}
+
+class Backend:
+    """Balancer-side view of one model service replica: load, latency and passive health."""
+    def __init__(self, client: ModelServiceClient):
+        self.client = client
+        self.outstanding = 0
+        self.latency_ewma: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def is_ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    def record_latency(self, seconds: float, alpha: float):
+        if self.latency_ewma is None:
+            self.latency_ewma = seconds
+        else:
+            self.latency_ewma = alpha * seconds + (1 - alpha) * self.latency_ewma
+
+    def record_success(self):
+        if self.ejections:
+            logger.info(f"Model service replica {self.client.endpoint} recovered")
+        self.consecutive_failures = 0
+        self.ejections = 0
+
+    def record_failure(self, failure_threshold: int, ejection_seconds: float, max_ejection_seconds: float):
+        """Count a connection failure or timeout; eject the replica once failures run consecutively.
+
+        The ejection period doubles each time a replica fails again right after coming back.
+        """
+        self.failures += 1
+        self.consecutive_failures += 1
+        # Requests already in flight when the replica was ejected do not extend the ejection
+        if self.consecutive_failures >= failure_threshold and not self.is_ejected(time.monotonic()):
+            self.ejections += 1
+            period = min(max_ejection_seconds, ejection_seconds * 2 ** (self.ejections - 1))
+            self.ejected_until = time.monotonic() + period
+            logger.warning(f"Ejecting model service replica {self.client.endpoint} for {period:.1f}s "
+                           f"after {self.consecutive_failures} consecutive failures")
+
+    def stats(self, now: float) -> Dict:
+        return {
+            **self.client.stats(),
+            'outstanding': self.outstanding,
+            'latency_ewma_ms': round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            'requests': self.requests,
+            'failures': self.failures,
+            'ejected_for': round(self.ejected_until - now, 1) if self.is_ejected(now) else 0
+        }
+
+class BalancedModelServiceClient:
+    """Spreads requests over several model service replicas, each with its own connection pool.
+
+    A replica is picked by fewest outstanding requests (`least_outstanding`) or by latency EWMA
+    weighted by outstanding requests (`ewma`). Replicas that fail to connect, drop connections or
+    time out `failure_threshold` times in a row are ejected with exponential backoff; errors a
+    replica reports in its response do not count against it. Requests that could not reach a
+    replica are retried on another one. With `hedge_delay` set, a request still unanswered after
+    that many seconds is also sent to a second replica and the first answer wins.
+    """
+    POLICIES = ('least_outstanding', 'ewma')
+
+    def __init__(self, clients: List[ModelServiceClient], policy: str = 'least_outstanding',
+                 ewma_alpha: float = 0.3, failure_threshold: int = 3, ejection_seconds: float = 5.0,
+                 max_ejection_seconds: float = 120.0, hedge_delay: Optional[float] = None,
+                 max_hedges: int = 1):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unsupported balancer policy: {policy}. Use one of {', '.join(self.POLICIES)}.")
+        if not clients:
+            raise ValueError("At least one model service endpoint is required")
+        self.backends = [Backend(client) for client in clients]
+        self.policy = policy
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.ejection_seconds = ejection_seconds
+        self.max_ejection_seconds = max_ejection_seconds
+        self.hedge_delay = hedge_delay
+        self.max_hedges = max(0, int(max_hedges))
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    @classmethod
+    def from_config(cls, model_service_config: Dict) -> 'BalancedModelServiceClient':
+        """Build a balancer over the `endpoints` of the `model_service` section of conf.yaml."""
+        balancer_config = model_service_config.get('balancer', {}) or {}
+        clients = []
+        for endpoint in model_service_config['endpoints']:
+            if isinstance(endpoint, str):
+                host, _, port = endpoint.rpartition(':')
+                endpoint = {'host': host, 'port': int(port)}
+            clients.append(ModelServiceClient.from_config({**model_service_config, **endpoint}))
+        return cls(
+            clients,
+            policy=balancer_config.get('policy', 'least_outstanding'),
+            ewma_alpha=balancer_config.get('ewma_alpha', 0.3),
+            failure_threshold=balancer_config.get('failure_threshold', 3),
+            ejection_seconds=balancer_config.get('ejection_seconds', 5.0),
+            max_ejection_seconds=balancer_config.get('max_ejection_seconds', 120.0),
+            hedge_delay=balancer_config.get('hedge_delay'),
+            max_hedges=balancer_config.get('max_hedges', 1)
+        )
+
+    def _load(self, backend: Backend) -> float:
+        if self.policy == 'ewma':
+            # Replicas without a measurement yet score 0, so they are tried early
+            return (backend.latency_ewma or 0.0) * (backend.outstanding + 1)
+        return backend.outstanding
+
+    def _select(self, exclude: List[Backend]) -> Optional[Backend]:
+        """Pick the least loaded replica not yet tried, skipping ejected ones.
+
+        If every replica is ejected, the first attempt goes to the one whose ejection ends
+        soonest rather than failing outright; retries only go to healthy replicas.
+        """
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b not in exclude]
+        healthy = [b for b in candidates if not b.is_ejected(now)]
+        if not healthy:
+            if exclude or not candidates:
+                return None
+            return min(candidates, key=lambda b: b.ejected_until)
+        lowest = min(self._load(b) for b in healthy)
+        return random.choice([b for b in healthy if self._load(b) == lowest])
+
+    def _record_failure(self, backend: Backend):
+        backend.record_failure(self.failure_threshold, self.ejection_seconds, self.max_ejection_seconds)
+
+    async def _send_to(self, backend: Backend, call: Callable[[ModelServiceClient], Awaitable[Any]]) -> Any:
+        backend.outstanding += 1
+        backend.requests += 1
+        started = time.monotonic()
+        try:
+            response = await call(backend.client)
+        except ModelServiceError:
+            backend.record_success()
+            raise
+        except (ModelServiceTimeoutError, *CONNECTION_ERRORS):
+            self._record_failure(backend)
+            raise
+        finally:
+            backend.outstanding -= 1
+        backend.record_latency(time.monotonic() - started, self.ewma_alpha)
+        backend.record_success()
+        return response
+
+    async def send_request(self, messages: List[Dict], params: Dict) -> Dict:
+        """Send a request to the best replica, retrying elsewhere on connection failure and hedging if enabled."""
+        return await self._dispatch(lambda client: client.send_request(messages, params))
+
+    async def send_batch_request(self, batch: List[List[Dict]], params: Dict) -> List[Union[Dict, ModelServiceError]]:
+        """Send a batched request (see ModelServiceClient.send_batch_request) to the best replica, as send_request does."""
+        return await self._dispatch(lambda client: client.send_batch_request(batch, params))
+
+    async def _dispatch(self, call: Callable[[ModelServiceClient], Awaitable[Any]]) -> Any:
+        tried: List[Backend] = []
+        hedged: List[Backend] = []
+        attempts: Dict[asyncio.Task, Backend] = {}
+        can_hedge = self.hedge_delay is not None and self.max_hedges > 0
+        last_error: Optional[BaseException] = None
+        try:
+            while True:
+                if not attempts:
+                    backend = self._select(tried)
+                    if backend is None:
+                        raise last_error
+                    tried.append(backend)
+                    attempts[asyncio.create_task(self._send_to(backend, call))] = backend
+
+                done, _ = await asyncio.wait(
+                    attempts, timeout=self.hedge_delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    backend = self._select(tried)
+                    if backend is None:
+                        # No other healthy replica to hedge to; keep waiting on the outstanding attempts
+                        can_hedge = False
+                        continue
+                    logger.info(f"Hedging request to {backend.client.endpoint} after {self.hedge_delay}s without an answer")
+                    self.hedges_sent += 1
+                    hedged.append(backend)
+                    can_hedge = len(hedged) < self.max_hedges
+                    tried.append(backend)
+                    attempts[asyncio.create_task(self._send_to(backend, call))] = backend
+                    continue
+
+                for task in done:
+                    backend = attempts.pop(task)
+                    if task.exception() is None:
+                        if backend in hedged:
+                            self.hedges_won += 1
+                        return task.result()
+                    last_error = task.exception()
+                    if isinstance(last_error, CONNECTION_ERRORS):
+                        logger.warning(f"Model service replica {backend.client.endpoint} failed ({last_error!r}); trying another")
+                    elif not attempts:
+                        raise last_error
+        finally:
+            for task in attempts:
+                task.cancel()
+            if attempts:
+                await asyncio.gather(*attempts, return_exceptions=True)
+
+    async def stream_request(self, messages: List[Dict], params: Dict) -> AsyncIterator[Dict]:
+        """Stream a request from the best replica; see ModelServiceClient.stream_request.
+
+        A replica that cannot be reached before the first message is skipped for another one.
+        Streams are never hedged.
+        """
+        tried: List[Backend] = []
+        last_error: Optional[BaseException] = None
         while True:
-            chunk = await reader.read(65536)
-            data += chunk
+            backend = self._select(tried)
+            if backend is None:
+                raise last_error
+            tried.append(backend)
+            backend.outstanding += 1
+            backend.requests += 1
+            received = 0
             try:
-                json.loads(data.decode('utf-8'))
-                break
-            except json.JSONDecodeError:
-                if not chunk:
-                    logger.error("Incomplete JSON response from server")
-                    raise ValueError("Incomplete JSON response from server")
-                continue
-
-        writer.close()
-        await writer.wait_closed()
-
-        response = json.loads(data.decode('utf-8'))
-        logger.debug(f"Received response: {json.dumps(response, default=str)[:200]}...")
-        
-        if 'error' in response:
-            logger.error(f"Model service error: {response['error']}")
-            raise RuntimeError(f"Server error: {response['error']}")
-        
+                async with aclosing(backend.client.stream_request(messages, params)) as stream:
+                    async for message in stream:
+                        received += 1
+                        yield message
+                backend.record_success()
+                return
+            except ModelServiceError:
+                backend.record_success()
+                raise
+            except ModelServiceTimeoutError:
+                self._record_failure(backend)
+                raise
+            except CONNECTION_ERRORS as e:
+                self._record_failure(backend)
+                if received:
+                    raise
+                logger.warning(f"Model service replica {backend.client.endpoint} failed ({e!r}); trying another")
+                last_error = e
+            finally:
+                backend.outstanding -= 1
+
+    async def close(self):
+        for backend in self.backends:
+            await backend.client.close()
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        return {
+            'policy': self.policy,
+            'hedges_sent': self.hedges_sent,
+            'hedges_won': self.hedges_won,
+            'backends': [backend.stats(now) for backend in self.backends]
+        }
+
+_client: Optional[Union[ModelServiceClient, BalancedModelServiceClient]] = None
+_request_flight = SingleFlight('model_requests')
+
+def get_model_service_client() -> Union[ModelServiceClient, BalancedModelServiceClient]:
+    """Return the shared pooled client configured from conf.yaml, balanced when it lists several endpoints."""
+    global _client
+    if _client is None:
+        model_service_config = config.get('model_service', {}) or {}
+        if model_service_config.get('endpoints'):
+            _client = BalancedModelServiceClient.from_config(model_service_config)
+        else:
+            _client = ModelServiceClient.from_config(model_service_config)
+    return _client
+
+_batcher: Optional[MicroBatcher] = None
+
+def get_micro_batcher() -> Optional[MicroBatcher]:
+    """Return the shared micro-batcher, or None when `batching.enabled` is off (the default)."""
+    global _batcher
+    if not batching_enabled():
+        return None
+    if _batcher is None:
+        _batcher = MicroBatcher.from_config(
+            batching_config(),
+            lambda messages, params: get_model_service_client().send_request(messages, params),
+            lambda batch, params: get_model_service_client().send_batch_request(batch, params)
+        )
+    return _batcher
+
+async def call_model_service(messages: List[Dict], params: Dict) -> Dict:
+    """One model service call, combined with concurrent calls of identical params when batching is enabled."""
+    batcher = get_micro_batcher()
+    if batcher is None:
+        return await get_model_service_client().send_request(messages, params)
+    return await batcher.submit(messages, params)
+
+async def close_model_service_client():
+    """Close the shared client's idle connections (call on shutdown)."""
+    if _client is not None:
+        await _client.close()
+
+def is_deterministic(params: Dict) -> bool:
+    """Whether the model service returns the same output for the same request."""
+    return params.get('sampling') is False or params.get('temperature') == 0
+
+async def send_request_to_server(messages: List[Dict], params: Dict, use_cache: bool = True, variant: int = 0) -> Dict:
+    """Send a request to the model service asynchronously.
+
+    When the response cache is enabled, deterministic requests (sampling off or temperature 0)
+    are answered from it. Identical requests already in flight share one model call; `variant`
+    (e.g. the repeat index) keeps requests that must produce separate samples apart.
+    Pass use_cache=False to always get a fresh response of one's own. With `batching.enabled`,
+    model calls with identical params made within `batching.window_ms` are sent as one batched call.
+    """
+    response_cache = get_response_cache()
+    cacheable = response_cache is not None and use_cache and is_deterministic(params)
+    if not use_cache or not (cacheable or coalescing_enabled()):
+        return await call_model_service(messages, params)
+
+    cache_key = request_fingerprint(messages, params)
+    if cacheable:
+        response = response_cache.get(cache_key)
+        if response is not None:
+            logger.info(f"Response cache hit for request {cache_key[:12]}")
+            return response
+
+    async def send() -> Dict:
+        response = await call_model_service(messages, params)
+        if cacheable and response.get('status') == 'success':
+            cached = detach_views(response)
+            response_cache.put(cache_key, cached, size=payload_size(cached))
         return response
-    except asyncio.TimeoutError:
-        logger.error(f"Request to model service at {host}:{port} timed out after {timeout} seconds")
-        raise RuntimeError(f"Model service timeout after {timeout} seconds")
-    except Exception as e:
-        logger.error(f"Error communicating with model service at {host}:{port}: {str(e)}")
-        raise
\ No newline at end of file
+
+    if not coalescing_enabled():
+        return await send()
+    return await _request_flight.run((cache_key, variant), send)
+
+def stream_request_to_server(messages: List[Dict], params: Dict) -> AsyncIterator[Dict]:
+    """Stream a request's output from the model service; see ModelServiceClient.stream_request.
+
+    Streamed requests always produce fresh output and bypass the response cache and coalescing.
+    Iterate inside contextlib.aclosing() so an abandoned stream releases its connection promptly.
+    """
+    return get_model_service_client().stream_request(messages, params)
+
+async def send_one_shot_request(messages: List[Dict], params: Dict) -> Dict:
+    """Send a single request through the shared pooled client and release its connections (for CLI runs)."""
+    try:
+        return await send_request_to_server(messages, params)
+    finally:
+        await close_model_service_client()
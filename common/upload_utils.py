@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+from .config import config
+from .metrics_utils import PAYLOAD_BYTES, time_stage
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMITS = {
+    'audio': 50 * 1024 * 1024,
+    'image': 20 * 1024 * 1024
+}
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds its configured size cap."""
+    def __init__(self, limit: int, kind: str = 'upload'):
+        super().__init__(f"The {kind} exceeds the limit of {limit} bytes")
+        self.limit = limit
+
+def uploads_config() -> Dict:
+    return config.get('uploads', {}) or {}
+
+def upload_limit(kind: str) -> int:
+    """Size cap in bytes for an 'audio' or 'image' upload, per `uploads` in conf.yaml."""
+    return int(uploads_config().get(f'max_{kind}_bytes', DEFAULT_LIMITS[kind]))
+
+def chunk_bytes() -> int:
+    return int(uploads_config().get('chunk_bytes', 1024 * 1024))
+
+class IngestedUpload:
+    """Uploaded content held in a seekable file, with its size and SHA-256 computed while it was read.
+
+    For web uploads the file is the SpooledTemporaryFile that Starlette received the part into,
+    which stays in memory up to `uploads.spool_memory_bytes` and moves to an anonymous temp file beyond that.
+    """
+    def __init__(self, file: BinaryIO, size: int, sha256: str, filename: str = "input"):
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+        self.closed = False
+        self._handles = [1]  # Shared by every handle on the same file
+
+    def retain(self) -> 'IngestedUpload':
+        """Another handle on the same content; the file is closed once every handle has been closed.
+
+        Work that may outlive the caller (a shared preprocessing run) holds its own handle.
+        """
+        handle = IngestedUpload(self.file, self.size, self.sha256, self.filename)
+        handle._handles = self._handles
+        self._handles[0] += 1
+        return handle
+
+    def iter_chunks(self, size: Optional[int] = None) -> Iterator[bytes]:
+        """Yield the content from the start in chunks."""
+        size = size or chunk_bytes()
+        self.file.seek(0)
+        while True:
+            chunk = self.file.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+    def copy_to(self, path: str):
+        """Write the content to a file (for tools that need a path)."""
+        self.file.seek(0)
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(self.file, f, chunk_bytes())
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._handles[0] -= 1
+        if self._handles[0] <= 0:
+            self.file.close()
+
+    def __enter__(self) -> 'IngestedUpload':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _measure(file: BinaryIO, max_bytes: Optional[int], kind: str) -> Tuple[int, str]:
+    """Size and SHA-256 of a file's content, read in chunks; stops as soon as it exceeds max_bytes."""
+    file.seek(0)
+    hasher = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: file.read(chunk_bytes()), b''):
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            raise UploadTooLargeError(max_bytes, kind)
+        hasher.update(chunk)
+    return size, hasher.hexdigest()
+
+async def ingest_upload(upload, max_bytes: int, kind: str = 'upload') -> IngestedUpload:
+    """Measure and hash a FastAPI UploadFile where Starlette spooled it, without copying it.
+
+    Takes ownership of the spool: FastAPI closes the form's files when the endpoint returns, which
+    is before a streaming response has used them. The returned upload must be closed by the caller.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLargeError(max_bytes, kind)
+    spool = upload.file
+    with time_stage('upload_read'):
+        # A spool larger than spool_memory_bytes is on disk, so hash it off the event loop
+        size, sha256 = await asyncio.to_thread(_measure, spool, max_bytes, kind)
+    upload.file = io.BytesIO()
+    PAYLOAD_BYTES.observe(size, kind=f"{kind}_upload")
+    return IngestedUpload(spool, size, sha256, upload.filename or "input")
+
+def ingest_path(path: str, max_bytes: Optional[int] = None, kind: str = 'upload') -> IngestedUpload:
+    """Open a local file as an IngestedUpload, hashing it in one streaming pass without copying it."""
+    size = os.path.getsize(path)
+    if max_bytes is not None and size > max_bytes:
+        raise UploadTooLargeError(max_bytes, kind)
+    f = open(path, 'rb')
+    try:
+        size, sha256 = _measure(f, max_bytes, kind)
+    except BaseException:
+        f.close()
+        raise
+    return IngestedUpload(f, size, sha256, path)
+
+def configure_spooling():
+    """Have Starlette keep multipart parts in memory up to `uploads.spool_memory_bytes` (call before serving)."""
+    from starlette.formparsers import MultiPartParser
+    MultiPartParser.spool_max_size = int(uploads_config().get('spool_memory_bytes', 1024 * 1024))
+
+class RequestSizeLimitMiddleware:
+    """Reject requests whose body exceeds `uploads.max_request_bytes` with 413.
+
+    A request declaring a larger Content-Length is refused before its body is received and parsed.
+    Bodies without one (chunked transfer encoding) are counted as they are received, and the request
+    fails with 413 as soon as the count passes the limit, whatever response the app would have sent.
+    """
+    def __init__(self, app, max_bytes: Optional[int] = None):
+        self.app = app
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            uploads_config().get('max_request_bytes', max(DEFAULT_LIMITS.values()) + 1024 * 1024)
+        )
+
+    async def reject(self, scope, send, reason: str):
+        logger.warning(f"Rejecting {scope['path']}: {reason}")
+        body = json.dumps({'detail': f"Request body exceeds the limit of {self.max_bytes} bytes"}).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        for name, value in scope['headers']:
+            if name == b'content-length' and value.isdigit() and int(value) > self.max_bytes:
+                await self.reject(scope, send, f"Content-Length {int(value)} exceeds {self.max_bytes} bytes")
+                return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise UploadTooLargeError(self.max_bytes, 'request body')
+            return message
+
+        async def limited_send(message):
+            nonlocal started
+            if exceeded and not started:
+                return  # The app's own error response is replaced by the 413 below
+            started = started or message['type'] == 'http.response.start'
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except UploadTooLargeError:
+            if not exceeded:
+                raise
+        if exceeded and not started:
+            await self.reject(scope, send, f"body exceeded {self.max_bytes} bytes while it was received")
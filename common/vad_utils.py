@@ -0,0 +1,76 @@
+import logging
+from typing import Dict, Optional, Tuple
+import numpy as np
+from .config import config
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRIM_SETTINGS = {
+    'enabled': True,
+    'frame_ms': 20,
+    'threshold_db': -40.0,
+    'floor_db': -60.0,
+    'padding_ms': 150,
+    'max_seconds': 0
+}
+
+def trim_settings() -> Dict:
+    """`audio_trim` settings from conf.yaml over the defaults."""
+    return {**DEFAULT_TRIM_SETTINGS, **(config.get('audio_trim', {}) or {})}
+
+def frame_levels(audio: np.ndarray, frame_length: int) -> np.ndarray:
+    """Mean-square level in dBFS of each frame; a partial last frame is zero-padded."""
+    n_frames = -(-len(audio) // frame_length)
+    frames = np.zeros(n_frames * frame_length, dtype=np.float32)
+    frames[:len(audio)] = audio
+    frames = frames.reshape(n_frames, frame_length)
+    power = np.einsum('ij,ij->i', frames, frames, dtype=np.float64) / frame_length
+    return 10 * np.log10(np.maximum(power, 1e-12))
+
+def best_window(voiced: np.ndarray, start: int, end: int, width: int) -> int:
+    """First frame of the `width`-frame window in [start, end) holding the most voiced frames (earliest on ties)."""
+    counts = np.concatenate(([0], np.cumsum(voiced[start:end], dtype=np.int64)))
+    return start + int(np.argmax(counts[width:] - counts[:-width]))
+
+def trim_silence(audio: np.ndarray, sample_rate: int, settings: Optional[Dict] = None) -> Tuple[np.ndarray, Dict]:
+    """Cut leading and trailing silence from mono audio and cap its length.
+
+    Frames are voiced when their level is within `threshold_db` of the loudest frame and above
+    `floor_db`. The clip keeps `padding_ms` around the first and last voiced frames. With
+    `max_seconds`, a longer clip is cut to the window of that length with the most voiced frames.
+    Returns a view of the kept samples and trim statistics; audio without any voiced frame is
+    returned whole.
+    """
+    settings = settings or trim_settings()
+    frame_length = max(1, int(sample_rate * settings['frame_ms'] / 1000))
+    stats = {'input_seconds': round(len(audio) / sample_rate, 3), 'voiced_seconds': 0.0}
+    untrimmed = {'output_seconds': stats['input_seconds'], 'leading_trimmed_seconds': 0.0,
+                 'trailing_trimmed_seconds': 0.0, 'capped': False}
+    if len(audio) < frame_length:
+        return audio, {**stats, **untrimmed}
+
+    levels = frame_levels(audio, frame_length)
+    voiced = levels >= max(levels.max() + settings['threshold_db'], settings['floor_db'])
+    voiced_indices = np.flatnonzero(voiced)
+    stats['voiced_seconds'] = round(len(voiced_indices) * frame_length / sample_rate, 3)
+    if not len(voiced_indices):
+        logger.info(f"No voiced audio found in {stats['input_seconds']}s reference clip; sending it untrimmed")
+        return audio, {**stats, **untrimmed}
+
+    padding = int(settings['padding_ms'] * sample_rate / 1000) // frame_length
+    start = max(0, int(voiced_indices[0]) - padding)
+    end = min(len(levels), int(voiced_indices[-1]) + 1 + padding)
+    max_frames = int(float(settings['max_seconds'] or 0) * sample_rate) // frame_length
+    capped = bool(max_frames and end - start > max_frames)
+    if capped:
+        start = best_window(voiced, start, end, max_frames)
+        end = start + max_frames
+
+    first_sample, last_sample = start * frame_length, min(len(audio), end * frame_length)
+    stats['output_seconds'] = round((last_sample - first_sample) / sample_rate, 3)
+    stats['leading_trimmed_seconds'] = round(first_sample / sample_rate, 3)
+    stats['trailing_trimmed_seconds'] = round((len(audio) - last_sample) / sample_rate, 3)
+    stats['capped'] = capped
+    return audio[first_sample:last_sample], stats
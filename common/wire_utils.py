@@ -0,0 +1,225 @@
+import base64
+import json
+import logging
+import re
+import struct
+import asyncio
+import numpy as np
+from typing import Any, Dict, List, Tuple, Union
+from .metrics_utils import PAYLOAD_BYTES, time_stage
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Wire formats:
+#   json      - a bare JSON document; binary content is sent as "base64:..." strings.
+#   framed    - 'MCPF' magic and a 64-bit payload length, followed by the JSON payload.
+#   multipart - 'MCPM' magic, JSON header length and attachment count, a table of 64-bit
+#               attachment lengths, the JSON header, then the raw attachments. Binary content
+#               in the header is replaced by {"$attachment": index} placeholders.
+# A bare JSON document always starts with '{', so the receiver can tell the formats apart
+# from the first byte on the wire.
+FRAME_MAGIC = b'MCPF'
+MULTIPART_MAGIC = b'MCPM'
+FRAME_HEADER = struct.Struct('!4sQ')
+MULTIPART_HEADER = struct.Struct('!4sII')
+ATTACHMENT_LENGTH = struct.Struct('!Q')
+WIRE_FORMATS = ('json', 'framed', 'multipart', 'auto')
+ATTACHMENT_KEY = '$attachment'
+READ_CHUNK_SIZE = 1 << 20
+MAX_FRAME_BYTES = 1 << 32
+# Braces and whole string literals (which may contain braces) in a bare JSON document
+JSON_TOKEN = re.compile(rb'[^"{}]+|"[^"\\]*(?:\\.[^"\\]*)*"|[{}]', re.DOTALL)
+
+BinaryData = Union[bytes, bytearray, memoryview]
+
+class WireProtocolError(ValueError):
+    pass
+
+def map_binary(obj: Any, replace) -> Any:
+    """Return a copy of obj with every ndarray or bytes-like value passed through replace()."""
+    if isinstance(obj, (np.ndarray, bytes, bytearray, memoryview)):
+        return replace(obj)
+    if isinstance(obj, dict):
+        return {key: map_binary(value, replace) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [map_binary(item, replace) for item in obj]
+    return obj
+
+def _as_buffer(item: Union[np.ndarray, BinaryData]) -> memoryview:
+    """Byte view of binary content without copying contiguous arrays."""
+    if isinstance(item, np.ndarray):
+        return memoryview(np.ascontiguousarray(item)).cast('B')
+    return memoryview(item).cast('B')
+
+def _to_base64(item: Union[np.ndarray, BinaryData]) -> str:
+    return f"base64:{base64.b64encode(_as_buffer(item)).decode('utf-8')}"
+
+def encode_json(obj: Dict) -> bytes:
+    """Serialize a message as a bare JSON document, base64-encoding binary content."""
+    return json.dumps(map_binary(obj, _to_base64)).encode('utf-8')
+
+def encode_multipart(obj: Dict) -> List[BinaryData]:
+    """Serialize a message as multipart segments; attachments are views of the original buffers."""
+    attachments: List[memoryview] = []
+
+    def to_placeholder(item):
+        placeholder = {ATTACHMENT_KEY: len(attachments)}
+        if isinstance(item, np.ndarray):
+            placeholder['dtype'] = item.dtype.str
+            placeholder['shape'] = list(item.shape)
+        attachments.append(_as_buffer(item))
+        return placeholder
+
+    header = json.dumps(map_binary(obj, to_placeholder)).encode('utf-8')
+    lengths = b''.join(ATTACHMENT_LENGTH.pack(len(a)) for a in attachments)
+    return [MULTIPART_HEADER.pack(MULTIPART_MAGIC, len(header), len(attachments)) + lengths, header, *attachments]
+
+def encode_message(obj: Dict, wire_format: str) -> List[BinaryData]:
+    """Serialize a message into the segments to write for the given wire format."""
+    if wire_format == 'multipart':
+        return encode_multipart(obj)
+    payload = encode_json(obj)
+    if wire_format == 'framed':
+        return [FRAME_HEADER.pack(FRAME_MAGIC, len(payload)), payload]
+    return [payload]
+
+def write_message(writer: asyncio.StreamWriter, obj: Dict, wire_format: str):
+    """Queue a message on the writer in the requested wire format."""
+    with time_stage('message_encode'):
+        segments = encode_message(obj, wire_format)
+    for segment in segments:
+        writer.write(segment)
+    PAYLOAD_BYTES.observe(sum(len(segment) for segment in segments), kind='message_sent')
+
+def attachment_bytes(value: Any):
+    """Binary content of a response `files` entry, whether sent as an attachment or as a base64 string."""
+    if isinstance(value, dict):
+        value = value.get('data')
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return value
+    if isinstance(value, str) and value.startswith('base64:'):
+        return base64.b64decode(value[7:])
+    return None
+
+async def read_into(reader: asyncio.StreamReader, view: memoryview):
+    """Fill a preallocated buffer from the stream."""
+    pos = 0
+    size = len(view)
+    while pos < size:
+        chunk = await reader.read(min(size - pos, READ_CHUNK_SIZE))
+        if not chunk:
+            raise WireProtocolError(f"Connection closed after {pos} of {size} expected bytes")
+        view[pos:pos + len(chunk)] = chunk
+        pos += len(chunk)
+
+def _allocate(length: int) -> bytearray:
+    if length > MAX_FRAME_BYTES:
+        raise WireProtocolError(f"Message of {length} bytes exceeds limit of {MAX_FRAME_BYTES} bytes")
+    return bytearray(length)
+
+async def read_frame_payload(reader: asyncio.StreamReader, header: bytes) -> bytearray:
+    """Read the payload of a framed message whose header was already received."""
+    _, length = FRAME_HEADER.unpack(header)
+    buffer = _allocate(length)
+    await read_into(reader, memoryview(buffer))
+    return buffer
+
+async def read_multipart(reader: asyncio.StreamReader, header: bytes) -> Any:
+    """Read a multipart message whose fixed header was already received."""
+    _, header_length, count = MULTIPART_HEADER.unpack(header)
+    table = await reader.readexactly(ATTACHMENT_LENGTH.size * count)
+    lengths = [length for (length,) in ATTACHMENT_LENGTH.iter_unpack(table)]
+
+    buffer = _allocate(header_length + sum(lengths))
+    view = memoryview(buffer)
+    await read_into(reader, view)
+
+    attachments = []
+    offset = header_length
+    for length in lengths:
+        attachments.append(view[offset:offset + length])
+        offset += length
+
+    def resolve(obj):
+        if isinstance(obj, dict):
+            if ATTACHMENT_KEY in obj:
+                index = obj[ATTACHMENT_KEY]
+                if not isinstance(index, int) or not 0 <= index < len(attachments):
+                    raise WireProtocolError(f"Invalid attachment reference: {index}")
+                if 'dtype' in obj:
+                    return np.frombuffer(attachments[index], dtype=np.dtype(obj['dtype'])).reshape(obj.get('shape', -1))
+                return attachments[index]
+            return {key: resolve(value) for key, value in obj.items()}
+        if isinstance(obj, list):
+            return [resolve(item) for item in obj]
+        return obj
+
+    with time_stage('message_decode'):
+        message = resolve(json.loads(buffer[:header_length]))
+    PAYLOAD_BYTES.observe(len(buffer), kind='message_received')
+    return message
+
+async def read_json_document(reader: asyncio.StreamReader, prefix: bytes = b"") -> Any:
+    """Read a bare JSON document (legacy wire format) from the stream.
+
+    Reads up to each closing brace and tracks nesting outside string literals, so a document
+    followed directly by the next one on the stream is never over-read.
+    """
+    data = bytearray(prefix)
+    depth, opened, scanned = 0, False, 0
+    while True:
+        try:
+            data += await reader.readuntil(b'}')
+        except asyncio.LimitOverrunError as e:
+            # No brace within the reader's buffer limit (e.g. a long base64 string); take what was scanned
+            data += await reader.readexactly(e.consumed)
+            continue
+        except asyncio.IncompleteReadError as e:
+            data += e.partial
+            if not data:
+                raise ConnectionResetError("Connection closed before any data was received")
+            logger.error("Incomplete JSON response from server")
+            raise ValueError("Incomplete JSON response from server")
+
+        while scanned < len(data):
+            token = JSON_TOKEN.match(data, scanned)
+            if token is None:
+                break  # A string literal continues past the data read so far
+            scanned = token.end()
+            if token.group() == b'{':
+                depth += 1
+                opened = True
+            elif token.group() == b'}':
+                depth -= 1
+        if opened and depth <= 0:
+            break
+
+    with time_stage('message_decode'):
+        message = json.loads(data)
+    PAYLOAD_BYTES.observe(len(data), kind='message_received')
+    return message
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[Any, str]:
+    """Read one message in any wire format; returns the message and the format it arrived in."""
+    first = await reader.read(1)
+    if not first:
+        raise ConnectionResetError("Connection closed before any data was received")
+    if first == b'{' or first.isspace():
+        return await read_json_document(reader, first), 'json'
+
+    try:
+        header = first + await reader.readexactly(FRAME_HEADER.size - 1)
+    except asyncio.IncompleteReadError:
+        raise WireProtocolError("Connection closed inside a message header")
+    magic = header[:4]
+    if magic == FRAME_MAGIC:
+        payload = await read_frame_payload(reader, header)
+        with time_stage('message_decode'):
+            message = json.loads(payload)
+        PAYLOAD_BYTES.observe(len(payload), kind='message_received')
+        return message, 'framed'
+    if magic == MULTIPART_MAGIC:
+        return await read_multipart(reader, header), 'multipart'
+    raise WireProtocolError(f"Unexpected message magic: {magic!r}")
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from common.image_utils import ImageProcessor, ImageProcessingError
+from common.tcp_utils import send_one_shot_request
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def run_describe_photo_cli(args):
+    """Run photo description CLI logic."""
+    params = {
+        'temperature': args.temperature,
+        'max_new_tokens': args.max_new_tokens
+    }
+
+    logger.info("Configuration parameters:")
+    for key, value in params.items():
+        logger.info(f"  {key}: {value}")
+
+    try:
+        input_file_path = args.image_file
+        if not os.path.exists(input_file_path):
+            raise ImageProcessingError(f"Image file not found: {input_file_path}")
+
+        image_data = ImageProcessor.prepare_image(input_file_path)
+
+        messages = [{'role': 'user', 'content': ["Describe the image.", image_data]}]
+        for prompt in args.prompts:
+            messages.append({'role': 'user', 'content': [prompt]})
+
+        logger.info("Messages to be sent to server:")
+        for msg in messages:
+            logger.info(f"  Role: {msg['role']}")
+            logger.info(f"  Content: {[f'<{len(c)} bytes>' if isinstance(c, bytes) else c[:100] + '...' if len(c) > 100 else c for c in msg['content']]}")
+
+        response = asyncio.run(send_one_shot_request(messages, params))
+        
+        if response.get('status') != 'success':
+            raise RuntimeError(f"Server processing failed: {response}")
+
+        if 'response' not in response:
+            raise RuntimeError("No response data received")
+
+        descriptions = response['response'] if isinstance(response['response'], list) else [response['response']]
+        results = []
+        for i, (prompt, desc) in enumerate(zip(args.prompts, descriptions)):
+            output_path = f"output_{i}.txt"
+            with open(output_path, 'w') as f:
+                f.write(f"# Prompt: {prompt}\n# Timestamp: {datetime.now().isoformat()}\n\n{desc}")
+            results.append({
+                'prompt': prompt,
+                'description': desc,
+                'output_path': output_path
+            })
+
+        logger.info("Processing complete:")
+        for result in results:
+            logger.info(f"  Prompt: {result['prompt']}")
+            logger.info(f"  Description: {result['description'][:100]}...")
+            logger.info(f"  Saved to: {result['output_path']}")
+
+    except Exception as e:
+        logger.error(f"Error in CLI execution: {str(e)}")
+        raise
@@ -1,12 +1,19 @@
 import json
 import logging
-import tempfile
-from typing import Dict, List
+from contextlib import aclosing
+from functools import partial
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from starlette.responses import JSONResponse
 from pydantic import BaseModel, field_validator
+from common.admission_utils import AdmissionRejectedError, admit_request
+from common.async_utils import gather_bounded, merge_bounded, repeat_concurrency
 from common.image_utils import ImageProcessor
-from common.tcp_utils import send_request_to_server
+from common.executor_utils import WorkerPoolFullError
+from common.log_utils import PayloadSummary, log_verbose
+from common.sse_utils import sse_response
+from common.tcp_utils import send_request_to_server, stream_request_to_server
+from common.upload_utils import UploadTooLargeError, ingest_upload, upload_limit
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +26,9 @@ class RequestPayload(BaseModel):
     temperature: float = 0.3
     max_new_tokens: int = 128
     repeats: int = 1
+    concurrency: Optional[int] = None
+    fresh_samples: bool = False
+    incremental: bool = False
 
     @field_validator('prompts')
     @classmethod
@@ -34,6 +44,114 @@ class RequestPayload(BaseModel):
             raise ValueError("repeats must be at least 1")
         return v
 
+    @field_validator('concurrency')
+    @classmethod
+    def check_concurrency(cls, v):
+        if v is not None and v < 1:
+            raise ValueError("concurrency must be at least 1")
+        return v
+
+def parse_payload(payload: str) -> RequestPayload:
+    """Parse and validate the JSON form field; invalid payloads are a 400."""
+    try:
+        return RequestPayload(**json.loads(payload))
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON payload: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Invalid JSON payload: {str(e)}")
+    except ValueError as e:
+        logger.error(f"Payload validation error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+def build_params(request_data: RequestPayload) -> Dict:
+    params = {
+        'temperature': request_data.temperature,
+        'max_new_tokens': request_data.max_new_tokens
+    }
+
+    log_verbose(logger, "Configuration parameters: %s (repeats: %d)", params, request_data.repeats)
+    return params
+
+def build_messages(request_data: RequestPayload, image_data: bytes) -> List[Dict]:
+    messages = [{'role': 'user', 'content': ["Describe the image.", image_data]}]
+    for prompt in request_data.prompts:
+        messages.append({'role': 'user', 'content': [prompt]})
+
+    # Binary content is logged as its size and hash, and only for sampled requests
+    log_verbose(logger, "Messages to be sent to server: %s", PayloadSummary(messages))
+    return messages
+
+async def run_repeat(request_data: RequestPayload, messages: List[Dict], params: Dict, repeat: int) -> List[Dict]:
+    """Send one repeat to the model service; raises if the repeat fails."""
+    logger.info(f"Processing repeat {repeat + 1}/{request_data.repeats}")
+    # Send request to server
+    try:
+        response = await send_request_to_server(
+            messages, params, use_cache=not request_data.fresh_samples, variant=repeat
+        )
+    except Exception as e:
+        logger.error(f"Failed to connect to model service on repeat {repeat + 1}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Model service error: {str(e)}")
+
+    log_verbose(logger, "Received response from model service (repeat %d): %s", repeat + 1, PayloadSummary(response))
+
+    if response.get('status') != 'success':
+        logger.error("Model service failed on repeat %d: %s", repeat + 1, PayloadSummary(response))
+        raise RuntimeError(f"Server processing failed: {response}")
+
+    if 'response' not in response:
+        logger.error(f"No response data received from model service (repeat {repeat + 1})")
+        raise RuntimeError("No response data received")
+
+    return extract_descriptions(request_data, response['response'], repeat)
+
+def extract_descriptions(request_data: RequestPayload, descriptions, repeat: int) -> List[Dict]:
+    descriptions = descriptions if isinstance(descriptions, list) else [descriptions]
+    return [
+        {'prompt': prompt, 'description': desc, 'repeat': repeat}
+        for prompt, desc in zip(request_data.prompts, descriptions)
+    ]
+
+async def stream_repeat(request_data: RequestPayload, messages: List[Dict], params: Dict,
+                        repeat: int) -> AsyncIterator[Tuple[str, Any]]:
+    """Relay one repeat's text while the model service is still generating it.
+
+    Yields a ('chunk', ...) event per text delta, then ('result', descriptions). The final
+    descriptions come from the model service's final response, or are joined from the deltas
+    when it omits them. Raises if the repeat fails.
+    """
+    logger.info(f"Streaming repeat {repeat + 1}/{request_data.repeats}")
+    deltas: Dict[int, List[str]] = {}
+    response = {}
+    try:
+        async with aclosing(stream_request_to_server(messages, params)) as stream:
+            async for message in stream:
+                if message.get('status') != 'partial':
+                    response = message
+                    continue
+                prompt = message.get('prompt', 0)
+                text = message.get('text')
+                if not isinstance(text, str) or not isinstance(prompt, int) or not 0 <= prompt < len(request_data.prompts):
+                    continue
+                deltas.setdefault(prompt, []).append(text)
+                yield 'chunk', {'prompt': prompt, 'text': text}
+    except Exception as e:
+        logger.error(f"Streaming from model service failed on repeat {repeat + 1}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Model service error: {str(e)}")
+
+    if response.get('status') != 'success':
+        logger.error("Model service failed on repeat %d: %s", repeat + 1, PayloadSummary(response))
+        raise RuntimeError(f"Server processing failed: {response}")
+
+    if 'response' in response:
+        yield 'result', extract_descriptions(request_data, response['response'], repeat)
+    elif deltas:
+        yield 'result', extract_descriptions(
+            request_data, [''.join(deltas.get(i, [])) for i in range(len(request_data.prompts))], repeat
+        )
+    else:
+        logger.error(f"No response data received from model service (repeat {repeat + 1})")
+        raise RuntimeError("No response data received")
+
 @router.post("/process_photo")
 async def process_photo(
     image_file: UploadFile = File(...),
@@ -41,78 +159,122 @@ async def process_photo(
 ):
     """Handle photo description requests."""
     try:
-        # Parse payload
-        try:
-            request_data = RequestPayload(**json.loads(payload))
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON payload: {str(e)}")
-            raise HTTPException(status_code=400, detail=f"Invalid JSON payload: {str(e)}")
-        except ValueError as e:
-            logger.error(f"Payload validation error: {str(e)}")
-            raise HTTPException(status_code=400, detail=str(e))
-
-        params = {
-            'temperature': request_data.temperature,
-            'max_new_tokens': request_data.max_new_tokens
-        }
+        request_data = parse_payload(payload)
+        params = build_params(request_data)
+        concurrency = repeat_concurrency(request_data.concurrency)
+
+        # Wait for model service capacity before spending any preprocessing on the request
+        with await admit_request(concurrency):
+            # Spool the upload, capping its size and hashing it on the way; repeated images are served
+            # from the cache without touching PIL. The prepared bytes are sent as a binary attachment
+            # or base64 depending on the wire format.
+            with await ingest_upload(image_file, upload_limit('image'), 'image') as upload:
+                image_data = await ImageProcessor.load_cached_image(upload)
+            messages = build_messages(request_data, image_data)
 
-        # Log parameters
-        logger.info("Configuration parameters:")
-        for key, value in params.items():
-            logger.info(f"  {key}: {value}")
-        logger.info(f"  repeats: {request_data.repeats}")
-
-        # Save uploaded image file temporarily
-        with tempfile.TemporaryDirectory() as temp_dir:
-            input_file_path = os.path.join(temp_dir, image_file.filename)
-            with open(input_file_path, 'wb') as f:
-                f.write(await image_file.read())
-
-            # Process image
-            image_base64 = ImageProcessor.process_image(input_file_path)
-
-            # Prepare messages
-            messages = [{'role': 'user', 'content': ["Describe the image.", image_base64]}]
-            for prompt in request_data.prompts:
-                messages.append({'role': 'user', 'content': [prompt]})
-
-            # Log messages
-            logger.info("Messages to be sent to server:")
-            for msg in messages:
-                logger.info(f"  Role: {msg['role']}")
-                logger.info(f"  Content: {[c[:100] + '...' if len(c) > 100 else c for c in msg['content']]}")
-
-            results = []
-            for repeat in range(request_data.repeats):
-                logger.info(f"Processing repeat {repeat + 1}/{request_data.repeats}")
-                # Send request to server
-                try:
-                    response = await send_request_to_server(messages, params)
-                except Exception as e:
-                    logger.error(f"Failed to connect to model service on repeat {repeat + 1}: {str(e)}")
-                    raise HTTPException(status_code=500, detail=f"Model service error: {str(e)}")
-                
-                logger.info(f"Received response from model service (repeat {repeat + 1}): {response}")
-
-                if response.get('status') != 'success':
-                    logger.error(f"Model service failed on repeat {repeat + 1}: {response}")
-                    raise RuntimeError(f"Server processing failed: {response}")
-
-                if 'response' not in response:
-                    logger.error(f"No response data received from model service (repeat {repeat + 1})")
-                    raise RuntimeError("No response data received")
-
-                descriptions = response['response'] if isinstance(response['response'], list) else [response['response']]
-                for i, (prompt, desc) in enumerate(zip(request_data.prompts, descriptions)):
-                    results.push({'prompt': prompt, 'description': desc})
-
-            # Return browser-readable payload
-            return JSONResponse({
-                'status': 'success',
-                'descriptions': results,
-                'metadata': {'prompts': request_data.prompts, 'repeats': request_data.repeats}
-            })
+            logger.info(f"Running {request_data.repeats} repeat(s) with concurrency {concurrency}")
+            repeat_results = await gather_bounded(
+                request_data.repeats, partial(run_repeat, request_data, messages, params), concurrency
+            )
+        results = [result for results_for_repeat in repeat_results for result in results_for_repeat]
 
+        # Return browser-readable payload
+        return JSONResponse({
+            'status': 'success',
+            'descriptions': results,
+            'metadata': {'prompts': request_data.prompts, 'repeats': request_data.repeats, 'concurrency': concurrency}
+        })
+
+    except UploadTooLargeError as e:
+        logger.error(f"Rejecting upload: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except AdmissionRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={'Retry-After': str(e.retry_after)})
+    except WorkerPoolFullError as e:
+        logger.error(f"Rejecting request: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '1'})
     except Exception as e:
         logger.error(f"Error in processing request: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/process_photo/stream")
+async def process_photo_stream(
+    image_file: UploadFile = File(...),
+    payload: str = Form(...)
+):
+    """Handle photo description requests, streaming each repeat's descriptions as server-sent events.
+
+    Emits `progress` events for the preprocessing stages and a `result` event per repeat as soon as
+    the model service answers it. With `incremental`, text deltas are also relayed as `chunk` events
+    while they are generated. A failed repeat is reported in its `result` event instead of
+    discarding the repeats already shown; the final event is `done`, or `error` if every repeat failed.
+    """
+    request_data = parse_payload(payload)
+    params = build_params(request_data)
+    concurrency = repeat_concurrency(request_data.concurrency)
+    # Admit and spool the upload before responding, so rejections get a proper status code;
+    # the form is closed once streaming starts
+    try:
+        ticket = await admit_request(concurrency)
+    except AdmissionRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={'Retry-After': str(e.retry_after)})
+    try:
+        upload = await ingest_upload(image_file, upload_limit('image'), 'image')
+    except UploadTooLargeError as e:
+        ticket.release()
+        logger.error(f"Rejecting upload: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except BaseException:
+        ticket.release()
+        raise
+
+    async def events():
+        # The model service capacity is held until the stream ends
+        with ticket:
+            async with aclosing(job_events()) as job:
+                async for event in job:
+                    yield event
+
+    async def job_events():
+        yield 'progress', {'stage': 'uploaded', 'bytes': upload.size}
+        yield 'progress', {'stage': 'preprocessing'}
+        with upload:
+            image_data = await ImageProcessor.load_cached_image(upload)
+        yield 'progress', {'stage': 'preprocessed', 'bytes': len(image_data)}
+        messages = build_messages(request_data, image_data)
+
+        async def repeat_events(repeat: int):
+            try:
+                if request_data.incremental:
+                    async for event in stream_repeat(request_data, messages, params, repeat):
+                        yield event
+                else:
+                    yield 'result', await run_repeat(request_data, messages, params, repeat)
+            except Exception as e:
+                yield 'failed', e.detail if isinstance(e, HTTPException) else str(e)
+
+        logger.info(f"Streaming {request_data.repeats} repeat(s) with concurrency {concurrency}")
+        yield 'progress', {'stage': 'generating', 'repeats': request_data.repeats, 'concurrency': concurrency}
+        completed = 0
+        failed = 0
+        async for repeat, (event, data) in merge_bounded(request_data.repeats, repeat_events, concurrency):
+            if event == 'chunk':
+                yield 'chunk', {'repeat': repeat, **data}
+                continue
+            completed += 1
+            result = {'repeat': repeat, 'descriptions': [], 'completed': completed, 'total': request_data.repeats}
+            if event == 'failed':
+                failed += 1
+                result['error'] = data
+            else:
+                result['descriptions'] = data
+            yield 'result', result
+
+        if failed == request_data.repeats:
+            raise RuntimeError("Every repeat failed; check model service logs")
+        yield 'done', {
+            'status': 'success',
+            'metadata': {'prompts': request_data.prompts, 'repeats': request_data.repeats, 'concurrency': concurrency, 'failed': failed}
+        }
+
+    return sse_response(events())
@@ -0,0 +1 @@
+# Empty file to make outputs a package
\ No newline at end of file
@@ -0,0 +1,57 @@
+import logging
+import re
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import FileResponse
+from starlette.responses import Response
+from common.output_utils import get_output_store
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)$')
+
+def range_response(data: bytes, media_type: str, range_header: Optional[str], headers: dict) -> Response:
+    """Serve in-memory bytes, honouring a single-range `Range` header as FileResponse does for files."""
+    size = len(data)
+    headers = {**headers, 'Accept-Ranges': 'bytes'}
+    match = RANGE_PATTERN.match(range_header.strip()) if range_header else None
+    if match is None:
+        # No range, or a multi-range request: send the whole output
+        return Response(data, media_type=media_type, headers=headers)
+
+    start, end = match.groups()
+    if start:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    elif end:
+        # Suffix range: the last `end` bytes
+        start = max(0, size - int(end))
+        end = size - 1
+    else:
+        start, end = size, -1
+    if start >= size or start > end:
+        return Response(status_code=416, headers={**headers, 'Content-Range': f"bytes */{size}"})
+    headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+    return Response(data[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+
+@router.api_route("/{token}", methods=["GET", "HEAD"])
+async def get_output(token: str, range_header: Optional[str] = Header(None, alias='range')):
+    """Serve a generated output; supports Range requests so media elements can load progressively.
+
+    HEAD lets the voice page check whether a link kept in its history has expired.
+    """
+    store = get_output_store()
+    entry = store.get(token) if store is not None else None
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Output not found or expired")
+
+    content, media_type = entry
+    # Outputs never change once stored, so the token doubles as a validator
+    headers = {'Cache-Control': f"private, max-age={int(store.ttl)}", 'ETag': f'"{token}"'}
+    if isinstance(content, str):
+        return FileResponse(content, media_type=media_type, headers=headers)
+    return range_response(content, media_type, range_header, headers)
@@ -171,6 +171,56 @@ function splitText(text, targetCount) {
     return chunks.length > 0 ? chunks : [text];
 }
 
+// Read a text/event-stream response body, calling onEvent(event, data) for each event as it arrives
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    const dispatch = (block) => {
+        let event = 'message';
+        const dataLines = [];
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trim());
+            }
+        });
+        if (dataLines.length) {
+            onEvent(event, JSON.parse(dataLines.join('\n')));
+        }
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            dispatch(buffer.slice(0, boundary));
+            buffer = buffer.slice(boundary + 2);
+        }
+    }
+    if (buffer.trim()) {
+        dispatch(buffer);
+    }
+}
+
+// Human-readable status line for a streamed `progress` or `result` event
+function progressText(event, data) {
+    if (event === 'result') {
+        return `Received ${data.completed}/${data.total} repeat(s)`;
+    }
+    switch (data.stage) {
+        case 'uploaded': return 'Uploaded, waiting for preprocessing...';
+        case 'preprocessing': return 'Preprocessing...';
+        case 'preprocessed': return 'Preprocessed, sending to model...';
+        case 'generating': return `Generating ${data.repeats} repeat(s)...`;
+        default: return data.stage || '';
+    }
+}
+
 function initializeCommon(textAreasDivId, fileInputId, fileInputElementId, sendButtonId, fileAccept, viewName) {
     const textAreasDiv = document.getElementById(textAreasDivId);
     const fileInput = document.getElementById(fileInputId);
@@ -521,6 +571,14 @@ function initializeCommon(textAreasDivId, fileInputId, fileInputElementId, sendB
         });
     };
 
+    window.updateHistoryItem = (id, data) => {
+        const item = historyItems.find(i => i.id === id);
+        if (item) {
+            Object.assign(item, data);
+            window.updateHistory();
+        }
+    };
+
     window.updatePendingStatus = (id, data) => {
         const item = historyItems.find(i => i.id === id);
         if (item) {
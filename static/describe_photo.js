@@ -29,6 +29,7 @@ window.initView = function(viewName) {
                 <strong>User:</strong>
                 <p>Prompts: ${item.prompts.join(', ')}</p>
                 <p>Image: ${item.imageFile}</p>
+                ${item.progress ? `<p class="progress-text">${item.progress}</p>` : ''}
                 ${settingsHtml}
             `;
         } else {
@@ -96,18 +97,20 @@ window.initView = function(viewName) {
             prompts: prompts,
             temperature: globalSettings.temperature,
             max_new_tokens: globalSettings.max_new_tokens,
-            repeats: viewSettings.repeats
+            repeats: viewSettings.repeats,
+            concurrency: viewSettings.repeats,
+            incremental: true
         });
         formData.append('payload', payload);
 
-        console.log('Sending request to:', '/describe-photo/process_photo');
+        console.log('Sending request to:', '/describe-photo/process_photo/stream');
         console.log('FormData contents:', {
             image_file: imageFileInput.files[0].name,
             payload: payload
         });
 
         try {
-            const response = await fetch('/describe-photo/process_photo', {
+            const response = await fetch('/describe-photo/process_photo/stream', {
                 method: 'POST',
                 body: formData
             });
@@ -117,30 +120,54 @@ window.initView = function(viewName) {
                 console.log('Raw response:', text);
                 throw new Error(`Server responded with ${response.status}: ${response.statusText}`);
             }
-            let data;
-            try {
-                data = await response.json();
-            } catch (e) {
-                const text = await response.text();
-                console.log('Failed to parse JSON, raw response:', text);
-                throw new Error('Failed to parse server response as JSON');
-            }
-            console.log('Response from /describe-photo/process_photo:', data);
 
-            if (!data || data.status !== 'success') {
-                throw new Error(data?.error || 'Server processing failed');
+            // Show text as it is generated, then each repeat's final descriptions
+            const liveText = {};
+            let streamError = null;
+            let finished = false;
+            await readEventStream(response, (event, data) => {
+                console.log('Stream event:', event, data);
+                if (event === 'progress' || event === 'result') {
+                    window.updateHistoryItem(messageId, { progress: progressText(event, data) });
+                }
+                if (event === 'chunk') {
+                    const id = `${messageId}-${data.repeat}-${data.prompt}`;
+                    if (!(id in liveText)) {
+                        liveText[id] = '';
+                        window.addHistoryItem({ id, type: 'response', description: '' });
+                    }
+                    liveText[id] += data.text;
+                    window.updateHistoryItem(id, { description: liveText[id] });
+                } else if (event === 'result') {
+                    if (data.error) {
+                        window.addHistoryItem({
+                            id: `${messageId}-${data.repeat}-error`,
+                            type: 'response',
+                            description: `Repeat ${data.repeat + 1} failed: ${data.error}`
+                        });
+                    }
+                    data.descriptions.forEach((desc, index) => {
+                        const id = `${messageId}-${data.repeat}-${index}`;
+                        if (id in liveText) {
+                            window.updateHistoryItem(id, { description: desc.description });
+                        } else {
+                            window.addHistoryItem({ id, type: 'response', description: desc.description });
+                        }
+                    });
+                } else if (event === 'error') {
+                    streamError = data.detail || 'Server processing failed';
+                } else if (event === 'done') {
+                    finished = true;
+                }
+            });
+            if (streamError) {
+                throw new Error(streamError);
             }
-            if (!data.descriptions) {
-                throw new Error('No descriptions in response');
+            if (!finished) {
+                throw new Error('Connection closed before all results were received');
             }
-
-            data.descriptions.forEach((desc, index) => {
-                window.addHistoryItem({
-                    id: `${messageId}-${index}`,
-                    type: 'response',
-                    description: desc.description
-                });
-            });
+            window.updateHistoryItem(messageId, { progress: '' });
+            saveHistory('describe_photo');
         } catch (error) {
             console.error('Fetch error:', error);
             console.log('Error details:', {
@@ -148,7 +175,7 @@ window.initView = function(viewName) {
                 stack: error.stack
             });
             alert(`Error: ${error.message}`);
-            window.updatePendingStatus(messageId, { text: `Error: ${error.message}` });
+            window.updatePendingStatus(messageId, { progress: `Error: ${error.message}` });
         } finally {
             sendButton.disabled = false;
             if (!viewSettings.keep_text) {
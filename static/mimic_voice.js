@@ -1,607 +1,317 @@
-const MAX_HISTORY = 10;
-let historyItems = [];
-let currentView = null;
+window.initView = function(viewName) {
+    if (viewName !== 'voice_mimic') return;
 
-// View configuration
-const VIEWS = [
-    { name: 'voice_mimic', displayName: 'Voice Mimic', html: 'mimic_voice.html', js: 'mimic_voice.js' },
-    { name: 'describe_photo', displayName: 'Describe Photo', html: 'describe_photo.html', js: 'describe_photo.js' }
-];
+    initializeCommon('text-areas', 'file-input', 'audio-file', 'send-button', 'audio/*', 'voice_mimic');
 
-// Default settings
-const DEFAULT_GLOBAL_SETTINGS = {
-    temperature: 0.3,
-    max_new_tokens: 128
-};
-
-const DEFAULT_VIEW_SETTINGS = {
-    voice_mimic: {
-        repeats: 1,
-        target_char_count: 500,
-        keep_audio_file: false,
-        keep_text: false,
-        expert_panel_visible: false,
-        mimick_prompt: "As a professional voice actor, mimic the voice style, pitch, tone, and speech patterns from reference file for the next message.",
-        say_this_prompt: "Say this"
-    },
-    describe_photo: {
-        repeats: 1,
-        keep_image_file: false,
-        keep_text: false,
-        expert_panel_visible: false
-    }
-};
-
-function initTabs() {
-    const tabsContainer = document.getElementById('tabs');
-    tabsContainer.innerHTML = '';
-    VIEWS.forEach(view => {
-        const tab = document.createElement('div');
-        tab.className = 'tab';
-        tab.dataset.view = view.name;
-        tab.textContent = view.displayName;
-        tab.addEventListener('click', () => loadView(view.name));
-        tabsContainer.appendChild(tab);
+    // Log DOM state for debugging
+    console.log('DOM state:', {
+        textAreas: document.querySelectorAll('.text-area').length,
+        fileInput: !!document.getElementById('file-input'),
+        audioFileInput: !!document.getElementById('audio-file'),
+        sendButton: !!document.getElementById('send-button')
     });
-    // Default to voice_mimic
-    loadView('voice_mimic');
-}
-
-async function loadView(viewName) {
-    if (currentView === viewName) return;
-    currentView = viewName;
 
-    // Update tab active state
-    document.querySelectorAll('.tab').forEach(tab => {
-        tab.classList.toggle('active', tab.dataset.view === viewName);
-    });
-
-    // Load view HTML
-    const view = VIEWS.find(v => v.name === viewName);
-    if (!view) {
-        console.error(`View ${viewName} not found`);
-        return;
-    }
+    // Inline (data URI) audio is kept in memory only; history items are persisted in a cookie, which cannot hold it
+    const audioSources = new Map();
+    // Output store links expire after outputs.ttl and do not survive a restart, so links restored
+    // from the cookie are checked (once per page load) before an audio element is shown for them
+    const outputStatus = new Map();
+    const checkOutput = (item) => {
+        outputStatus.set(item.audioUrl, 'checking');
+        fetch(item.audioUrl, { method: 'HEAD' })
+            .then(response => response.ok)
+            .catch(() => false)
+            .then(available => {
+                outputStatus.set(item.audioUrl, available ? 'available' : 'expired');
+                if (!available) {
+                    delete item.audioUrl;
+                    saveHistory('voice_mimic');
+                }
+                window.updateHistory();
+            });
+    };
+    const audioQueue = [];
+    let queueIndex = -1;
+    const audio = new Audio();
+
+    const playPauseButton = document.getElementById('play-pause-button');
+    const stopButton = document.getElementById('stop-button');
+    const progressBar = document.getElementById('audio-progress');
+    const timeDisplay = document.getElementById('audio-time');
+    const queuePosition = document.getElementById('queue-position');
+    const queueDiv = document.getElementById('audio-queue');
+
+    const formatTime = (seconds) => {
+        if (!isFinite(seconds)) return '0:00';
+        const minutes = Math.floor(seconds / 60);
+        return `${minutes}:${String(Math.floor(seconds % 60)).padStart(2, '0')}`;
+    };
 
-    const viewContent = document.getElementById('view-content');
-    try {
-        const response = await fetch(`/static/${view.html}`);
-        viewContent.innerHTML = await response.text();
-        console.log(`Loaded ${view.html}, DOM state:`, {
-            viewContentChildren: viewContent.childElementCount,
-            fileInput: !!viewContent.querySelector('#file-input'),
-            fileInputElement: !!viewContent.querySelector(`#${viewName === 'voice_mimic' ? 'audio-file' : 'image-file'}`)
+    const updatePlayer = () => {
+        queuePosition.textContent = `${queueIndex + 1}/${audioQueue.length}`;
+        playPauseButton.textContent = audio.paused ? 'Play' : 'Pause';
+        queueDiv.innerHTML = '';
+        audioQueue.forEach((entry, index) => {
+            const div = document.createElement('div');
+            div.className = `queue-item ${index === queueIndex ? 'active' : ''}`;
+            div.textContent = entry.text;
+            div.addEventListener('click', () => playAt(index));
+            queueDiv.appendChild(div);
         });
-    } catch (error) {
-        console.error(`Failed to load ${view.html}:`, error);
-        viewContent.innerHTML = `<p>Error loading view</p>`;
-        return;
-    }
-
-    // Load view-specific JS
-    const existingScript = document.querySelector(`script[src="/static/${view.js}"]`);
-    if (existingScript) {
-        existingScript.remove();
-    }
-    const script = document.createElement('script');
-    script.src = `/static/${view.js}`;
-    script.onload = () => {
-        if (window.initView) {
-            window.initView(viewName);
-        }
     };
-    document.body.appendChild(script);
-}
-
-// Cookie management
-function loadGlobalSettings() {
-    const settings = Cookies.get('settings_global');
-    return settings ? JSON.parse(settings) : { ...DEFAULT_GLOBAL_SETTINGS };
-}
 
-function saveGlobalSettings(settings) {
-    Cookies.set('settings_global', JSON.stringify(settings), { expires: 365 });
-}
-
-function loadViewSettings(viewName) {
-    const settings = Cookies.get(`settings_${viewName}`);
-    const defaultSettings = { ...DEFAULT_VIEW_SETTINGS[viewName] };
-    const loadedSettings = settings ? JSON.parse(settings) : {};
-    // Ensure all fields, including prompts, have defaults
-    const result = {
-        ...defaultSettings,
-        ...loadedSettings,
-        mimick_prompt: loadedSettings.mimick_prompt || defaultSettings.mimick_prompt,
-        say_this_prompt: loadedSettings.say_this_prompt || defaultSettings.say_this_prompt
+    const playAt = (index) => {
+        if (index < 0 || index >= audioQueue.length) return;
+        queueIndex = index;
+        audio.src = audioQueue[index].src;
+        audio.play().catch(error => console.error('Playback failed:', error));
+        updatePlayer();
     };
-    console.log(`Loaded view settings for ${viewName}:`, result);
-    return result;
-}
-
-function saveViewSettings(viewName, settings) {
-    // Ensure prompts are not undefined
-    settings.mimick_prompt = settings.mimick_prompt || DEFAULT_VIEW_SETTINGS[viewName].mimick_prompt;
-    settings.say_this_prompt = settings.say_this_prompt || DEFAULT_VIEW_SETTINGS[viewName].say_this_prompt;
-    Cookies.set(`settings_${viewName}`, JSON.stringify(settings), { expires: 365 });
-    console.log(`Saved view settings for ${viewName}:`, settings);
-}
 
-function loadHistory(viewName) {
-    const history = Cookies.get(`history_${viewName}`);
-    historyItems = history ? JSON.parse(history) : [];
-    if (historyItems.length > MAX_HISTORY) {
-        historyItems = historyItems.slice(-MAX_HISTORY);
-    }
-}
-
-function saveHistory(viewName) {
-    Cookies.set(`history_${viewName}`, JSON.stringify(historyItems), { expires: 365 });
-}
-
-function loadFile(viewName) {
-    const file = Cookies.get(`file_${viewName}`);
-    return file ? JSON.parse(file) : null;
-}
-
-function saveFile(viewName, file) {
-    if (file) {
-        Cookies.set(`file_${viewName}`, JSON.stringify({ name: file.name }), { expires: 365 });
-    } else {
-        Cookies.remove(`file_${viewName}`);
-    }
-}
-
-function loadText(viewName) {
-    const text = Cookies.get(`text_${viewName}`);
-    return text ? JSON.parse(text) : [];
-}
-
-function saveText(viewName, texts) {
-    Cookies.set(`text_${viewName}`, JSON.stringify(texts), { expires: 365 });
-    console.log(`Saved text for ${viewName}:`, texts);
-}
-
-// Text splitting logic (Voice Mimic only)
-function splitText(text, targetCount) {
-    const chunks = [];
-    let currentChunk = '';
-    const sentences = text.split(/(?<=[.!?])\s+/).filter(s => s.trim());
-    
-    for (const sentence of sentences) {
-        if (currentChunk.length + sentence.length <= targetCount) {
-            currentChunk += (currentChunk ? ' ' : '') + sentence;
+    // Queue a clip; start playing right away if nothing else is playing
+    const enqueueAudio = (text, src) => {
+        audioQueue.push({ text, src });
+        if (audio.paused && (queueIndex === -1 || audio.ended)) {
+            playAt(audioQueue.length - 1);
         } else {
-            if (currentChunk) chunks.push(currentChunk);
-            currentChunk = sentence;
-        }
-    }
-    if (currentChunk) chunks.push(currentChunk);
-    
-    // Handle paragraphs if no sentences exceed target
-    if (chunks.length === 1 && chunks[0].length > targetCount) {
-        chunks.length = 0;
-        const paragraphs = text.split(/\n+/).filter(p => p.trim());
-        for (const paragraph of paragraphs) {
-            if (currentChunk.length + paragraph.length <= targetCount) {
-                currentChunk += (currentChunk ? '\n' : '') + paragraph;
-            } else {
-                if (currentChunk) chunks.push(currentChunk);
-                currentChunk = paragraph;
-            }
+            updatePlayer();
         }
-        if (currentChunk) chunks.push(currentChunk);
-    }
-    
-    return chunks.length > 0 ? chunks : [text];
-}
-
-function initializeCommon(textAreasDivId, fileInputId, fileInputElementId, sendButtonId, fileAccept, viewName) {
-    const textAreasDiv = document.getElementById(textAreasDivId);
-    const fileInput = document.getElementById(fileInputId);
-    const fileInputElement = document.getElementById(fileInputElementId);
-    const sendButton = document.getElementById(sendButtonId);
-    const expertButton = document.getElementById('expert-button');
-    const expertPanel = document.getElementById('expert-panel');
-    const clearFileButton = document.getElementById('clear-file');
-    const resetButton = document.getElementById('reset-settings');
-
-    // Load settings and history
-    const globalSettings = loadGlobalSettings();
-    const viewSettings = loadViewSettings(viewName);
-    loadHistory(viewName);
-
-    // Load saved file if keep_audio_file or keep_image_file is true
-    const savedFile = loadFile(viewName);
-    if (savedFile && viewSettings[viewName === 'voice_mimic' ? 'keep_audio_file' : 'keep_image_file']) {
-        let fileNameSpan = fileInput.querySelector('.file-name');
-        if (!fileNameSpan) {
-            fileNameSpan = document.createElement('span');
-            fileNameSpan.className = 'file-name';
-            fileInput.insertBefore(fileNameSpan, fileInput.firstChild);
-        }
-        fileNameSpan.textContent = `Selected: ${savedFile.name}`;
-        let reselectSpan = fileInput.querySelector('.file-reselect');
-        if (!reselectSpan) {
-            reselectSpan = document.createElement('span');
-            reselectSpan.className = 'file-reselect';
-            reselectSpan.textContent = 'Please re-select the file to send';
-            fileInput.appendChild(reselectSpan);
-        }
-    }
+    };
 
-    // Restore text fields if keep_text is true
-    if (viewSettings.keep_text) {
-        const savedTexts = loadText(viewName);
-        if (savedTexts.length > 0) {
-            textAreasDiv.innerHTML = ''; // Clear default textarea
-            savedTexts.forEach(text => {
-                window.addTextArea();
-                textAreasDiv.lastChild.querySelector('.text-area').value = text;
-            });
+    audio.addEventListener('ended', () => {
+        if (queueIndex + 1 < audioQueue.length) {
+            playAt(queueIndex + 1);
+        } else {
+            updatePlayer();
         }
-    }
-
-    // Restore expert panel visibility
-    if (viewSettings.expert_panel_visible) {
-        expertPanel.classList.add('active');
-    }
-
-    // Log initial DOM state
-    console.log('initializeCommon called, DOM state:', {
-        textAreasDiv: !!textAreasDiv,
-        fileInput: !!fileInput,
-        fileInputElement: !!fileInputElement,
-        sendButton: !!sendButton,
-        expertButton: !!expertButton,
-        expertPanel: !!expertPanel,
-        clearFileButton: !!clearFileButton,
-        resetButton: !!resetButton
     });
-
-    // Expert panel toggle
-    expertButton.addEventListener('click', () => {
-        expertPanel.classList.toggle('active');
-        viewSettings.expert_panel_visible = expertPanel.classList.contains('active');
-        saveViewSettings(viewName, viewSettings);
+    audio.addEventListener('timeupdate', () => {
+        progressBar.value = audio.duration ? (audio.currentTime / audio.duration) * 100 : 0;
+        timeDisplay.textContent = `${formatTime(audio.currentTime)} / ${formatTime(audio.duration)}`;
     });
-
-    // Initialize global settings
-    document.getElementById('temperature').value = globalSettings.temperature;
-    document.getElementById('max_new_tokens').value = globalSettings.max_new_tokens;
-
-    // Initialize view-specific settings
-    document.getElementById('repeats').value = viewSettings.repeats;
-    document.getElementById('keep_text').checked = viewSettings.keep_text;
-    if (viewName === 'voice_mimic') {
-        document.getElementById('target_char_count').value = viewSettings.target_char_count;
-        document.getElementById('keep_audio_file').checked = viewSettings.keep_audio_file;
-        // Initialize prompt fields with defaults if undefined
-        document.getElementById('mimick_prompt').value = viewSettings.mimick_prompt || DEFAULT_VIEW_SETTINGS.voice_mimic.mimick_prompt;
-        document.getElementById('say_this_prompt').value = viewSettings.say_this_prompt || DEFAULT_VIEW_SETTINGS.voice_mimic.say_this_prompt;
-        document.getElementById('split-text-button').addEventListener('click', () => {
-            const textarea = textAreasDiv.querySelector('.text-area');
-            const text = textarea.value;
-            const chunks = splitText(text, viewSettings.target_char_count);
-            if (chunks.length > 1) {
-                textarea.value = chunks[0];
-                chunks.slice(1).forEach(chunk => {
-                    window.addTextArea();
-                    textAreasDiv.lastChild.querySelector('.text-area').value = chunk;
-                });
-            }
-        });
-    } else {
-        document.getElementById('keep_image_file').checked = viewSettings.keep_image_file;
-    }
-
-    // Save text fields when changed if keep_text is true
-    function saveTextFields() {
-        if (viewSettings.keep_text) {
-            const texts = Array.from(textAreasDiv.querySelectorAll('.text-area')).map(ta => ta.value);
-            saveText(viewName, texts);
-        }
-    }
-
-    textAreasDiv.addEventListener('input', (e) => {
-        if (e.target.classList.contains('text-area')) {
-            saveTextFields();
+    audio.addEventListener('play', updatePlayer);
+    audio.addEventListener('pause', updatePlayer);
+
+    playPauseButton.addEventListener('click', () => {
+        if (queueIndex === -1) {
+            playAt(0);
+        } else if (audio.paused) {
+            audio.play().catch(error => console.error('Playback failed:', error));
+        } else {
+            audio.pause();
         }
     });
-
-    // Handle dynamic text area addition/removal
-    textAreasDiv.addEventListener('click', (e) => {
-        if (e.target.classList.contains('remove-text')) {
-            saveTextFields();
-        }
+    stopButton.addEventListener('click', () => {
+        audio.pause();
+        audio.currentTime = 0;
+        updatePlayer();
     });
-
-    // Reset settings
-    resetButton.addEventListener('click', () => {
-        const defaultGlobal = { ...DEFAULT_GLOBAL_SETTINGS };
-        const defaultView = { ...DEFAULT_VIEW_SETTINGS[viewName] };
-        saveGlobalSettings(defaultGlobal);
-        saveViewSettings(viewName, defaultView);
-        document.getElementById('temperature').value = defaultGlobal.temperature;
-        document.getElementById('max_new_tokens').value = defaultGlobal.max_new_tokens;
-        document.getElementById('repeats').value = defaultView.repeats;
-        document.getElementById('keep_text').checked = defaultView.keep_text;
-        if (viewName === 'voice_mimic') {
-            document.getElementById('target_char_count').value = defaultView.target_char_count;
-            document.getElementById('keep_audio_file').checked = defaultView.keep_audio_file;
-            document.getElementById('mimick_prompt').value = defaultView.mimick_prompt;
-            document.getElementById('say_this_prompt').value = defaultView.say_this_prompt;
-        } else {
-            document.getElementById('keep_image_file').checked = defaultView.keep_image_file;
-        }
-        if (!defaultView.expert_panel_visible) {
-            expertPanel.classList.remove('active');
+    progressBar.addEventListener('input', () => {
+        if (audio.duration) {
+            audio.currentTime = (progressBar.value / 100) * audio.duration;
         }
-        // Clear saved text if keep_text is reset to false
-        if (!defaultView.keep_text) {
-            Cookies.remove(`text_${viewName}`);
-            textAreasDiv.innerHTML = '<div class="text-area-container"><textarea class="text-area" placeholder="Enter prompt"></textarea></div>';
-        }
-    });
-
-    // Save global settings on change
-    ['temperature', 'max_new_tokens'].forEach(id => {
-        document.getElementById(id).addEventListener('input', () => {
-            globalSettings[id] = parseFloat(document.getElementById(id).value) || DEFAULT_GLOBAL_SETTINGS[id];
-            saveGlobalSettings(globalSettings);
-        });
     });
 
-    // Save view-specific settings on change
-    document.getElementById('repeats').addEventListener('input', () => {
-        viewSettings.repeats = parseInt(document.getElementById('repeats').value) || DEFAULT_VIEW_SETTINGS[viewName].repeats;
-        saveViewSettings(viewName, viewSettings);
-    });
-    document.getElementById('keep_text').addEventListener('change', () => {
-        viewSettings.keep_text = document.getElementById('keep_text').checked;
-        saveViewSettings(viewName, viewSettings);
-        if (!viewSettings.keep_text) {
-            Cookies.remove(`text_${viewName}`);
+    window.renderHistoryItem = (item) => {
+        if (item.type === 'user') {
+            let settingsHtml = '';
+            if (item.settings) {
+                const global = item.settings.global || {};
+                const view = item.settings.view || {};
+                settingsHtml = `
+                    <div class="settings-display">
+                        Settings: Temperature=${global.temperature || '0.3'}, Max Tokens=${global.max_new_tokens || '128'},
+                        Repeats=${view.repeats || '1'}, Keep Audio=${view.keep_audio_file ? 'Yes' : 'No'},
+                        Keep Text=${view.keep_text ? 'Yes' : 'No'}
+                    </div>
+                `;
+            }
+            return `
+                <strong>User:</strong>
+                <p>Texts: ${item.texts.join(', ')}</p>
+                <p>Audio: ${item.audioFile}</p>
+                ${item.progress ? `<p class="progress-text">${item.progress}</p>` : ''}
+                ${settingsHtml}
+            `;
         } else {
-            saveTextFields();
-        }
-    });
-    if (viewName === 'voice_mimic') {
-        document.getElementById('target_char_count').addEventListener('input', () => {
-            viewSettings.target_char_count = parseInt(document.getElementById('target_char_count').value) || DEFAULT_VIEW_SETTINGS.voice_mimic.target_char_count;
-            saveViewSettings(viewName, viewSettings);
-        });
-        document.getElementById('keep_audio_file').addEventListener('change', () => {
-            viewSettings.keep_audio_file = document.getElementById('keep_audio_file').checked;
-            saveViewSettings(viewName, viewSettings);
-            if (!viewSettings.keep_audio_file) {
-                saveFile(viewName, null);
-                let fileNameSpan = fileInput.querySelector('.file-name');
-                if (fileNameSpan) {
-                    fileNameSpan.textContent = `Click or drag an audio file here`;
-                }
-                let reselectSpan = fileInput.querySelector('.file-reselect');
-                if (reselectSpan) {
-                    reselectSpan.remove();
-                }
+            if (item.audioUrl && !outputStatus.has(item.audioUrl)) {
+                checkOutput(item);
             }
-        });
-        document.getElementById('mimick_prompt').addEventListener('input', () => {
-            viewSettings.mimick_prompt = document.getElementById('mimick_prompt').value || DEFAULT_VIEW_SETTINGS.voice_mimic.mimick_prompt;
-            saveViewSettings(viewName, viewSettings);
-        });
-        document.getElementById('say_this_prompt').addEventListener('input', () => {
-            viewSettings.say_this_prompt = document.getElementById('say_this_prompt').value || DEFAULT_VIEW_SETTINGS.voice_mimic.say_this_prompt;
-            saveViewSettings(viewName, viewSettings);
-        });
-    } else {
-        document.getElementById('keep_image_file').addEventListener('change', () => {
-            viewSettings.keep_image_file = document.getElementById('keep_image_file').checked;
-            saveViewSettings(viewName, viewSettings);
-            if (!viewSettings.keep_image_file) {
-                saveFile(viewName, null);
-                let fileNameSpan = fileInput.querySelector('.file-name');
-                if (fileNameSpan) {
-                    fileNameSpan.textContent = `Click or drag an image file here`;
-                }
-                let reselectSpan = fileInput.querySelector('.file-reselect');
-                if (reselectSpan) {
-                    reselectSpan.remove();
-                }
+            const checking = item.audioUrl && outputStatus.get(item.audioUrl) === 'checking';
+            const src = checking ? null : (item.audioUrl || audioSources.get(item.id));
+            let audioHtml = '';
+            if (checking) {
+                audioHtml = '<p>Checking audio...</p>';
+            } else if (src) {
+                audioHtml = `<audio controls preload="metadata" src="${src}"></audio>`;
+            } else if (!item.error) {
+                audioHtml = '<p>Audio is no longer available</p>';
             }
+            return `
+                <strong>Response:</strong>
+                <p class="response-text">${item.text || ''}</p>
+                ${audioHtml}
+            `;
+        }
+    };
+    window.updateHistory();
+
+    window.sendRequest = async () => {
+        const textAreas = document.querySelectorAll('.text-area');
+        const audioFileInput = document.getElementById('audio-file');
+        const sendButton = document.getElementById('send-button');
+        const fileInput = document.getElementById('file-input');
+
+        console.log('sendRequest called, input state:', {
+            textAreasCount: textAreas.length,
+            audioFileInputExists: !!audioFileInput,
+            audioFileSelected: audioFileInput ? audioFileInput.files.length : 0
         });
-    }
 
-    // Add text area
-    window.addTextArea = () => {
-        const container = document.createElement('div');
-        container.className = 'text-area-container';
-        const textarea = document.createElement('textarea');
-        textarea.className = 'text-area';
-        textarea.placeholder = 'Enter prompt';
-        const removeButton = document.createElement('button');
-        removeButton.className = 'remove-text';
-        removeButton.textContent = '×';
-        removeButton.addEventListener('click', () => container.remove());
-        container.appendChild(textarea);
-        container.appendChild(removeButton);
-        textAreasDiv.appendChild(container);
-        attachTextAreaEvents(textarea);
-        saveTextFields();
-    };
+        const texts = Array.from(textAreas)
+            .map(ta => ta.value.trim())
+            .filter(t => t);
+        if (!texts.length) {
+            alert('Please enter at least one text to say.');
+            return;
+        }
+        if (!audioFileInput) {
+            console.error('Audio file input element not found');
+            alert('Error: Audio file input not found. Please check the page structure.');
+            return;
+        }
+        if (!audioFileInput.files.length) {
+            console.error('No audio file selected');
+            alert('Please select a reference audio file.');
+            return;
+        }
 
-    // Attach key events to text areas
-    function attachTextAreaEvents(textarea) {
-        textarea.addEventListener('keydown', (e) => {
-            if (e.key === 'Enter' && e.shiftKey) {
-                e.preventDefault();
-                window.addTextArea();
-            } else if (e.key === 'Enter' && !e.shiftKey) {
-                e.preventDefault();
-                window.sendRequest();
+        sendButton.disabled = true;
+
+        const messageId = Date.now();
+        // Include settings in history item
+        const globalSettings = loadGlobalSettings();
+        const viewSettings = loadViewSettings('voice_mimic');
+        window.addHistoryItem({
+            id: messageId,
+            type: 'user',
+            texts: texts,
+            audioFile: audioFileInput.files[0].name,
+            settings: {
+                global: { temperature: globalSettings.temperature, max_new_tokens: globalSettings.max_new_tokens },
+                view: {
+                    repeats: viewSettings.repeats,
+                    keep_audio_file: viewSettings.keep_audio_file,
+                    keep_text: viewSettings.keep_text
+                }
             }
         });
-    }
 
-    // Initialize existing text areas
-    textAreasDiv.querySelectorAll('.text-area').forEach(attachTextAreaEvents);
-
-    // File input click
-    fileInput.addEventListener('click', () => {
-        if (fileInputElement) {
-            fileInputElement.click();
-        } else {
-            console.error('File input element not found for click event');
-        }
-    });
+        const formData = new FormData();
+        formData.append('audio_file', audioFileInput.files[0]);
+        const payload = JSON.stringify({
+            input_mimick_text: texts.map(text => `${viewSettings.say_this_prompt} "${text}"`),
+            temperature: globalSettings.temperature,
+            max_new_tokens: globalSettings.max_new_tokens,
+            repeats: viewSettings.repeats,
+            concurrency: viewSettings.repeats,
+            incremental: true,
+            mimick_prompt: viewSettings.mimick_prompt
+        });
+        formData.append('payload', payload);
 
-    // File input change
-    fileInputElement.addEventListener('change', () => {
-        console.log('File input changed, DOM state:', {
-            fileInputElementExists: !!fileInputElement,
-            filesCount: fileInputElement ? fileInputElement.files.length : 0
+        console.log('Sending request to:', '/voice-mimic/process_audio/stream');
+        console.log('FormData contents:', {
+            audio_file: audioFileInput.files[0].name,
+            payload: payload
         });
-        if (fileInputElement.files.length) {
-            let fileNameSpan = fileInput.querySelector('.file-name');
-            if (!fileNameSpan) {
-                fileNameSpan = document.createElement('span');
-                fileNameSpan.className = 'file-name';
-                fileInput.insertBefore(fileNameSpan, fileInput.firstChild);
-            }
-            fileNameSpan.textContent = `Selected: ${fileInputElement.files[0].name}`;
-            let reselectSpan = fileInput.querySelector('.file-reselect');
-            if (reselectSpan) {
-                reselectSpan.remove();
-            }
-            if (viewSettings[viewName === 'voice_mimic' ? 'keep_audio_file' : 'keep_image_file']) {
-                saveFile(viewName, fileInputElement.files[0]);
-            }
-            if (window.onFileChange) {
-                window.onFileChange(fileInputElement.files[0]);
-            }
-        } else {
-            let fileNameSpan = fileInput.querySelector('.file-name');
-            if (fileNameSpan) {
-                fileNameSpan.textContent = `Click or drag a ${viewName === 'voice_mimic' ? 'audio' : 'image'} file here`;
+
+        try {
+            const response = await fetch('/voice-mimic/process_audio/stream', {
+                method: 'POST',
+                body: formData
+            });
+            console.log('Response status:', response.status, response.statusText);
+            if (!response.ok) {
+                const text = await response.text();
+                console.log('Raw response:', text);
+                throw new Error(`Server responded with ${response.status}: ${response.statusText}`);
             }
-            let reselectSpan = fileInput.querySelector('.file-reselect');
-            if (reselectSpan) {
-                reselectSpan.remove();
+
+            // Play audio chunks as they are generated; repeats that were not streamed are queued whole
+            const streamedRepeats = new Set();
+            let streamError = null;
+            let finished = false;
+            await readEventStream(response, (event, data) => {
+                console.log('Stream event:', event, { ...data, files: data.files ? data.files.length : undefined, audio_url: undefined });
+                if (event === 'progress' || event === 'result') {
+                    window.updateHistoryItem(messageId, { progress: progressText(event, data) });
+                }
+                if (event === 'chunk') {
+                    streamedRepeats.add(data.repeat);
+                    enqueueAudio(data.text, data.audio_url);
+                } else if (event === 'result') {
+                    if (!data.files.length) {
+                        window.addHistoryItem({
+                            id: `${messageId}-${data.repeat}-error`,
+                            type: 'response',
+                            text: `Repeat ${data.repeat + 1} returned no audio`,
+                            error: true
+                        });
+                    }
+                    data.files.forEach((file, index) => {
+                        const id = `${messageId}-${data.repeat}-${index}`;
+                        // Output store links are short enough to keep in history; inline audio is not
+                        if (file.audio_url.startsWith('data:')) {
+                            audioSources.set(id, file.audio_url);
+                            window.addHistoryItem({ id, type: 'response', text: file.text });
+                        } else {
+                            // Just stored, so there is no need to check it
+                            outputStatus.set(file.audio_url, 'available');
+                            window.addHistoryItem({ id, type: 'response', text: file.text, audioUrl: file.audio_url });
+                        }
+                        if (!streamedRepeats.has(data.repeat)) {
+                            enqueueAudio(file.text, file.audio_url);
+                        }
+                    });
+                } else if (event === 'error') {
+                    streamError = data.detail || 'Server processing failed';
+                } else if (event === 'done') {
+                    finished = true;
+                }
+            });
+            if (streamError) {
+                throw new Error(streamError);
             }
-            saveFile(viewName, null);
-            if (window.onFileClear) {
-                window.onFileClear();
+            if (!finished) {
+                throw new Error('Connection closed before all results were received');
             }
-        }
-    });
-
-    // Drag and drop
-    fileInput.addEventListener('dragover', (e) => {
-        e.preventDefault();
-        fileInput.classList.add('dragover');
-    });
-    fileInput.addEventListener('dragleave', () => {
-        fileInput.classList.remove('dragover');
-    });
-    fileInput.addEventListener('drop', (e) => {
-        e.preventDefault();
-        fileInput.classList.remove('dragover');
-        if (fileInputElement) {
-            fileInputElement.files = e.dataTransfer.files;
-            console.log('Drag and drop, DOM state:', {
-                fileInputElementExists: !!fileInputElement,
-                filesCount: fileInputElement.files.length,
-                inputElement: !!fileInput.querySelector(`#${fileInputElementId}`)
+            window.updateHistoryItem(messageId, { progress: '' });
+            saveHistory('voice_mimic');
+        } catch (error) {
+            console.error('Fetch error:', error);
+            console.log('Error details:', {
+                message: error.message,
+                stack: error.stack
             });
-            if (fileInputElement.files.length) {
+            alert(`Error: ${error.message}`);
+            window.updatePendingStatus(messageId, { progress: `Error: ${error.message}` });
+        } finally {
+            sendButton.disabled = false;
+            if (!viewSettings.keep_text) {
+                window.cleanupTextFields();
+            }
+            if (audioFileInput && !viewSettings.keep_audio_file) {
+                audioFileInput.value = '';
                 let fileNameSpan = fileInput.querySelector('.file-name');
-                if (!fileNameSpan) {
-                    fileNameSpan = document.createElement('span');
-                    fileNameSpan.className = 'file-name';
-                    fileInput.insertBefore(fileNameSpan, fileInput.firstChild);
+                if (fileNameSpan) {
+                    fileNameSpan.textContent = 'Click or drag an audio file here';
                 }
-                fileNameSpan.textContent = `Selected: ${fileInputElement.files[0].name}`;
                 let reselectSpan = fileInput.querySelector('.file-reselect');
                 if (reselectSpan) {
                     reselectSpan.remove();
                 }
-                if (viewSettings[viewName === 'voice_mimic' ? 'keep_audio_file' : 'keep_image_file']) {
-                    saveFile(viewName, fileInputElement.files[0]);
-                }
-                if (window.onFileChange) {
-                    window.onFileChange(fileInputElement.files[0]);
-                }
-            }
-        } else {
-            console.error('File input element not found for drop event');
-        }
-    });
-
-    // Clear file
-    clearFileButton.addEventListener('click', () => {
-        if (fileInputElement) {
-            fileInputElement.value = '';
-            let fileNameSpan = fileInput.querySelector('.file-name');
-            if (fileNameSpan) {
-                fileNameSpan.textContent = `Click or drag a ${viewName === 'voice_mimic' ? 'audio' : 'image'} file here`;
-            }
-            let reselectSpan = fileInput.querySelector('.file-reselect');
-            if (reselectSpan) {
-                reselectSpan.remove();
-            }
-            saveFile(viewName, null);
-            if (window.onFileClear) {
-                window.onFileClear();
             }
         }
-    });
-
-    // Clean up text fields after send
-    window.cleanupTextFields = () => {
-        const containers = textAreasDiv.querySelectorAll('.text-area-container');
-        if (containers.length > 1) {
-            Array.from(containers).slice(1).forEach(container => container.remove());
-        }
-        const firstTextarea = textAreasDiv.querySelector('.text-area');
-        if (firstTextarea) {
-            firstTextarea.value = '';
-        }
-        saveTextFields();
-    };
-
-    // History management
-    window.addHistoryItem = (item) => {
-        historyItems.push(item);
-        if (historyItems.length > MAX_HISTORY) {
-            historyItems.shift();
-        }
-        window.updateHistory();
-        saveHistory(viewName);
-    };
-
-    window.updateHistory = () => {
-        const historyDiv = document.getElementById('history');
-        if (!historyDiv) return;
-        historyDiv.innerHTML = '';
-        historyItems.forEach(item => {
-            const div = document.createElement('div');
-            div.className = `history-item ${item.type} ${item.pending ? 'pending' : ''}`;
-            div.dataset.id = item.id;
-            div.innerHTML = window.renderHistoryItem ? window.renderHistoryItem(item) : '';
-            historyDiv.prepend(div);
-        });
-    };
-
-    window.updatePendingStatus = (id, data) => {
-        const item = historyItems.find(i => i.id === id);
-        if (item) {
-            item.pending = false;
-            Object.assign(item, data);
-            window.updateHistory();
-            saveHistory(viewName);
-        }
     };
-}
-
-document.addEventListener('DOMContentLoaded', () => {
-    initTabs();
-});
\ No newline at end of file
+};
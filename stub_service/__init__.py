@@ -0,0 +1 @@
+# Empty file to make stub_service a package
\ No newline at end of file
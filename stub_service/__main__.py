@@ -0,0 +1,31 @@
+import argparse
+import asyncio
+from common.config import config
+from stub_service.server import StubModelService
+
+def parse_args():
+    model_service_config = config.get('model_service', {})
+    parser = argparse.ArgumentParser(description="Local stand-in for the MiniCPM-o model service")
+    parser.add_argument("--host", type=str, default=model_service_config.get('host', 'localhost'), help="Host to listen on")
+    parser.add_argument("--port", type=int, default=model_service_config.get('port', 9999), help="Port to listen on")
+    parser.add_argument("--audio_seconds", type=float, default=0.5, help="Duration of generated audio per prompt")
+    parser.add_argument("--chunk_delay", type=float, default=0.05, help="Seconds between partial messages of streamed responses")
+    parser.add_argument("--response_delay", type=float, default=0.0, help="Seconds to wait before answering each request (simulates a slow replica)")
+    parser.add_argument("--response_jitter", type=float, default=0.0, help="Random extra delay of up to this many seconds per request")
+    parser.add_argument("--description_words", type=int, default=0, help="Pad text responses to this many words (controls response size)")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests answered with an error response")
+    parser.add_argument("--drop_rate", type=float, default=0.0, help="Fraction of requests whose connection is closed without an answer")
+    parser.add_argument("--batch_item_delay", type=float, default=0.0, help="Extra seconds per additional request in a batched call")
+    parser.add_argument("--seed", type=int, help="Seed for the injected jitter and failures")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    service = StubModelService(args.host, args.port, audio_seconds=args.audio_seconds, chunk_delay=args.chunk_delay,
+                               response_delay=args.response_delay, response_jitter=args.response_jitter,
+                               description_words=args.description_words, error_rate=args.error_rate,
+                               drop_rate=args.drop_rate, batch_item_delay=args.batch_item_delay, seed=args.seed)
+    asyncio.run(service.serve_forever())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import array
+import io
+import logging
+import math
+import random
+import sys
+import asyncio
+import wave
+from typing import Dict, Iterator, List, Optional
+from common.wire_utils import WIRE_FORMATS, read_message, write_message, WireProtocolError
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def make_pcm(seconds: float, sample_rate: int = 24000, frequency: float = 220.0) -> bytes:
+    """Generate mono 16-bit little-endian PCM samples of a sine tone."""
+    n_samples = int(seconds * sample_rate)
+    samples = array.array('h', (
+        int(8000 * math.sin(2 * math.pi * frequency * i / sample_rate)) for i in range(n_samples)
+    ))
+    if sys.byteorder != 'little':
+        samples.byteswap()
+    return samples.tobytes()
+
+def make_wav(seconds: float, sample_rate: int = 24000, frequency: float = 220.0) -> bytes:
+    """Generate a mono 16-bit PCM WAV file containing a sine tone."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(make_pcm(seconds, sample_rate, frequency))
+    return buffer.getvalue()
+
+class StubModelService:
+    """Local stand-in for the model service, for development without a GPU backend.
+
+    Accepts requests in any wire format and answers in the same one, or in the first
+    format listed in the request's `accept_formats`. Connections are kept open so that
+    pooled clients can reuse them. Requests with `stream: true` in their params are answered
+    with partial messages (word-by-word text, audio in `chunk_seconds` pieces) spaced
+    `chunk_delay` seconds apart, followed by the final response. `response_delay` holds back
+    every response, to stand in for a slow replica.
+
+    For benchmarks, `response_jitter` adds a random extra delay of up to that many seconds,
+    `description_words` pads text responses to that length, `error_rate` answers that fraction
+    of requests with an error response and `drop_rate` closes the connection without answering.
+
+    Batched requests ({'batch': [{'messages': ...}, ...], 'params': ...}) are answered with
+    {'status': 'success', 'batch': [response, ...]}. Like a GPU backend running the requests as
+    one batch, they wait `response_delay` once, plus `batch_item_delay` for each request after the first.
+    """
+    def __init__(self, host: str = 'localhost', port: int = 9999,
+                 audio_seconds: float = 0.5, audio_sample_rate: int = 24000,
+                 chunk_seconds: float = 0.1, chunk_delay: float = 0.05, response_delay: float = 0.0,
+                 response_jitter: float = 0.0, description_words: int = 0,
+                 error_rate: float = 0.0, drop_rate: float = 0.0, batch_item_delay: float = 0.0,
+                 seed: Optional[int] = None):
+        self.host = host
+        self.port = port
+        self.audio_seconds = audio_seconds
+        self.audio_sample_rate = audio_sample_rate
+        self.chunk_seconds = chunk_seconds
+        self.chunk_delay = chunk_delay
+        self.response_delay = response_delay
+        self.response_jitter = response_jitter
+        self.description_words = description_words
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.batch_item_delay = batch_item_delay
+        self._random = random.Random(seed)
+        self.requests_served = 0
+        self.batches_served = 0
+        self.errors_injected = 0
+        self.connections_dropped = 0
+        self._server = None
+        self._wav = None
+
+    def _prompts(self, messages: List[Dict]) -> List[str]:
+        """Text prompts that follow the first (reference audio or image) message."""
+        prompts = []
+        for msg in messages[1:]:
+            prompts.append(' '.join(c for c in msg.get('content', []) if isinstance(c, str)))
+        return prompts
+
+    def build_response(self, request: Dict) -> Dict:
+        """Build a response shaped like the model service's for the given request."""
+        messages = request.get('messages')
+        params = request.get('params', {})
+        if not isinstance(messages, list) or not messages:
+            return {'error': "Request must contain a non-empty 'messages' list"}
+
+        prompts = self._prompts(messages)
+        if params.get('generate_audio'):
+            if self._wav is None:
+                self._wav = make_wav(self.audio_seconds, self.audio_sample_rate)
+            audio = {'data': self._wav}
+            files = {f'output_audio_path_{i}': audio for i in range(len(prompts))}
+            files['output_audio_path'] = audio
+            return {'status': 'success', 'response': prompts, 'files': files}
+
+        return {'status': 'success', 'response': [self.describe(p) for p in prompts]}
+
+    def build_batch_response(self, request: Dict) -> Dict:
+        """Answer each entry of a batched request as if it had been sent on its own."""
+        batch = request.get('batch')
+        if not isinstance(batch, list) or not batch:
+            return {'error': "Batched request must contain a non-empty 'batch' list"}
+        params = request.get('params', {})
+        return {
+            'status': 'success',
+            'batch': [self.build_response({**entry, 'params': params}) if isinstance(entry, dict)
+                      else {'error': 'Batch entries must be JSON objects'} for entry in batch]
+        }
+
+    def describe(self, prompt: str) -> str:
+        """Canned description, padded to `description_words` words when set."""
+        description = f"Stub description for prompt: {prompt}"
+        padding = self.description_words - len(description.split(' '))
+        if padding > 0:
+            description += ' ' + ' '.join(f"word{i}" for i in range(padding))
+        return description
+
+    def stream_messages(self, request: Dict) -> Iterator[Dict]:
+        """Partial messages for a streaming request, followed by the final response."""
+        response = self.build_response(request)
+        if response.get('status') != 'success':
+            yield response
+            return
+
+        if request.get('params', {}).get('generate_audio'):
+            pcm = make_pcm(self.audio_seconds, self.audio_sample_rate)
+            chunk_bytes = max(2, int(self.chunk_seconds * self.audio_sample_rate) * 2)
+            for prompt in range(len(response['response'])):
+                for offset in range(0, len(pcm), chunk_bytes):
+                    yield {
+                        'status': 'partial', 'prompt': prompt,
+                        'audio': pcm[offset:offset + chunk_bytes], 'sample_rate': self.audio_sample_rate
+                    }
+            # Audio was delivered in the partial messages
+            response = {key: value for key, value in response.items() if key != 'files'}
+        else:
+            for prompt, text in enumerate(response['response']):
+                for i, word in enumerate(text.split(' ')):
+                    yield {'status': 'partial', 'prompt': prompt, 'text': word if i == 0 else f" {word}"}
+        yield response
+
+    def reply_format(self, request: Dict, request_format: str) -> str:
+        """Wire format to answer in: the request's own, or the best one the client offered."""
+        if request_format != 'json':
+            return request_format
+        for wire_format in request.get('accept_formats', []):
+            if wire_format in WIRE_FORMATS and wire_format != 'auto':
+                return wire_format
+        return 'json'
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve requests on one connection until the client closes it."""
+        peer = writer.get_extra_info('peername')
+        try:
+            while True:
+                try:
+                    request, request_format = await read_message(reader)
+                except (ConnectionResetError, asyncio.IncompleteReadError):
+                    break
+                except (WireProtocolError, ValueError) as e:
+                    logger.error(f"Malformed request from {peer}: {str(e)}")
+                    break
+                if not isinstance(request, dict):
+                    write_message(writer, {'error': 'Request must be a JSON object'}, request_format)
+                    await writer.drain()
+                    continue
+                reply_format = self.reply_format(request, request_format)
+                batch = request.get('batch')
+                delay = self.response_delay + self._random.uniform(0, self.response_jitter)
+                if isinstance(batch, list):
+                    delay += self.batch_item_delay * max(0, len(batch) - 1)
+                if delay:
+                    await asyncio.sleep(delay)
+                if self.drop_rate and self._random.random() < self.drop_rate:
+                    self.connections_dropped += 1
+                    logger.info(f"Dropping connection from {peer} (injected failure)")
+                    break
+                params = request.get('params')
+                if self.error_rate and self._random.random() < self.error_rate:
+                    self.errors_injected += 1
+                    write_message(writer, {'error': 'Injected stub error'}, reply_format)
+                    await writer.drain()
+                elif batch is not None:
+                    write_message(writer, self.build_batch_response(request), reply_format)
+                    await writer.drain()
+                    self.batches_served += 1
+                elif isinstance(params, dict) and params.get('stream'):
+                    try:
+                        for i, message in enumerate(self.stream_messages(request)):
+                            if i and self.chunk_delay:
+                                await asyncio.sleep(self.chunk_delay)
+                            write_message(writer, message, reply_format)
+                            await writer.drain()
+                    except (ConnectionResetError, BrokenPipeError):
+                        logger.info(f"Client {peer} closed the connection mid-stream")
+                        break
+                else:
+                    write_message(writer, self.build_response(request), reply_format)
+                    await writer.drain()
+                self.requests_served += 1
+        finally:
+            writer.close()
+
+    async def start(self):
+        """Start listening; returns once the socket is bound."""
+        self._server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Stub model service listening on {self.host}:{self.port}")
+        return self._server
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import os
+import numpy as np
+from common.audio_utils import AudioProcessor
+from common.file_utils import AudioProcessingError
+from common.tcp_utils import send_one_shot_request
+from common.upload_utils import ingest_path
+from common.wire_utils import attachment_bytes
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def run_voice_mimic_cli(args):
+    """Run voice mimic CLI logic."""
+    params = {
+        'sampling': args.sampling,
+        'max_new_tokens': args.max_new_tokens,
+        'use_tts_template': args.use_tts_template,
+        'temperature': args.temperature,
+        'generate_audio': args.generate_audio,
+        'sample_rate': args.sample_rate
+    }
+
+    logger.info("Configuration parameters:")
+    for key, value in params.items():
+        logger.info(f"  {key}: {value}")
+
+    try:
+        input_file_path = args.input_file
+        if not os.path.exists(input_file_path):
+            raise AudioProcessingError(f"Input file not found: {input_file_path}")
+
+        # Streamed to FFmpeg from the file itself rather than read into memory first
+        with ingest_path(input_file_path) as upload:
+            audio_input, trim_stats = asyncio.run(AudioProcessor.load_reference_audio(upload, sample_rate=params['sample_rate']))
+        if trim_stats is not None:
+            logger.info(f"Reference audio trim: {trim_stats}")
+
+        mimick_prompt = "As a professional voice actor, mimick the voice style, pitch, tone, and speech patterns from reference file for the next message."
+        messages = [{'role': 'user', 'content': [mimick_prompt, audio_input]}]
+        for text in args.texts:
+            say_this_prompt = f"Say this \"{text}\""
+            messages.append({'role': 'user', 'content': [say_this_prompt]})
+
+        logger.info("Messages to be sent to server:")
+        for msg in messages:
+            logger.info(f"  Role: {msg['role']}")
+            logger.info(f"  Content: {[type(c) if isinstance(c, np.ndarray) else c for c in msg['content']]}")
+
+        response = asyncio.run(send_one_shot_request(messages, params))
+        
+        if response.get('status') != 'success':
+            raise RuntimeError(f"Server processing failed: {response}")
+
+        if 'files' not in response or not response['files'].get('output_audio_path'):
+            raise RuntimeError("No response data received")
+
+        results = []
+        audio_data = attachment_bytes(response['files']['output_audio_path'])
+        if audio_data is None:
+            raise RuntimeError("Response does not contain audio data")
+        output_path = f"output_0.wav"
+        with open(output_path, 'wb') as f:
+            f.write(audio_data)
+            
+        results.append({
+            'text': args.texts[0],
+            'output_path': output_path
+        })
+
+        logger.info("Processing complete:")
+        for result in results:
+            logger.info(f"  Text: {result['text']}")
+            logger.info(f"  Saved to: {result['output_path']}")
+
+    except Exception as e:
+        logger.error(f"Error in CLI execution: {str(e)}")
+        raise
@@ -1,15 +1,24 @@
 import base64
 import json
 import logging
-import os
 import numpy as np
-import tempfile
-from typing import Dict, List
+from contextlib import aclosing
+from functools import partial
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from starlette.responses import JSONResponse
 from pydantic import BaseModel, field_validator
+from common.admission_utils import AdmissionRejectedError, admit_request
+from common.async_utils import gather_bounded, merge_bounded, repeat_concurrency
 from common.audio_utils import AudioProcessor
-from common.tcp_utils import send_request_to_server
+from common.executor_utils import WorkerPoolFullError
+from common.log_utils import PayloadSummary, log_verbose
+from common.file_utils import FileHandler
+from common.output_utils import publish_output
+from common.sse_utils import sse_response
+from common.tcp_utils import send_request_to_server, stream_request_to_server
+from common.upload_utils import UploadTooLargeError, ingest_upload, upload_limit
+from common.wire_utils import attachment_bytes
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -17,6 +26,10 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def audio_data_uri(wav: bytes) -> str:
+    """Inline a short WAV clip as a data URI."""
+    return f"data:audio/wav;base64,{base64.b64encode(wav).decode('utf-8')}"
+
 class RequestPayload(BaseModel):
     input_mimick_text: List[str]
     temperature: float = 0.3
@@ -26,6 +39,9 @@ class RequestPayload(BaseModel):
     use_tts_template: bool = True
     generate_audio: bool = True
     repeats: int = 1
+    concurrency: Optional[int] = None
+    fresh_samples: bool = False
+    incremental: bool = False
     mimick_prompt: str = "As a professional voice actor, mimic the voice style, pitch, tone, and speech patterns from reference file for the next message."
 
     @field_validator('input_mimick_text')
@@ -42,6 +58,154 @@ class RequestPayload(BaseModel):
             raise ValueError("repeats must be at least 1")
         return v
 
+    @field_validator('concurrency')
+    @classmethod
+    def check_concurrency(cls, v):
+        if v is not None and v < 1:
+            raise ValueError("concurrency must be at least 1")
+        return v
+
+def parse_payload(payload: str) -> RequestPayload:
+    """Parse and validate the JSON form field; invalid payloads are a 400."""
+    try:
+        return RequestPayload(**json.loads(payload))
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON payload: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Invalid JSON payload: {str(e)}")
+    except ValueError as e:
+        logger.error(f"Payload validation error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+def build_params(request_data: RequestPayload) -> Dict:
+    params = {
+        'sampling': request_data.sampling,
+        'max_new_tokens': request_data.max_new_tokens,
+        'use_tts_template': request_data.use_tts_template,
+        'temperature': request_data.temperature,
+        'generate_audio': request_data.generate_audio,
+        'sample_rate': request_data.sample_rate
+    }
+
+    log_verbose(logger, "Configuration parameters: %s (repeats: %d)", params, request_data.repeats)
+    return params
+
+def build_messages(request_data: RequestPayload, audio_input: np.ndarray) -> List[Dict]:
+    messages = [{'role': 'user', 'content': [request_data.mimick_prompt, audio_input]}]
+    for text in request_data.input_mimick_text:
+        messages.append({'role': 'user', 'content': [text]})
+
+    # Binary content is logged as its size and hash, and only for sampled requests
+    log_verbose(logger, "Messages to be sent to server: %s", PayloadSummary(messages))
+    return messages
+
+async def run_repeat(request_data: RequestPayload, messages: List[Dict], params: Dict, repeat: int) -> List[Dict]:
+    """Send one repeat to the model service; failures are logged and yield no results."""
+    logger.info(f"Processing repeat {repeat + 1}/{request_data.repeats}")
+    repeat_results = []
+    # Send request to server
+    try:
+        response = await send_request_to_server(
+            messages, params, use_cache=not request_data.fresh_samples, variant=repeat
+        )
+    except Exception as e:
+        logger.error(f"Failed to connect to model service on repeat {repeat + 1}: {str(e)}")
+        return repeat_results
+
+    log_verbose(logger, "Received response from model service (repeat %d): %s", repeat + 1, PayloadSummary(response))
+
+    if response.get('status') != 'success':
+        logger.error("Model service failed on repeat %d: %s", repeat + 1, PayloadSummary(response))
+        return repeat_results
+
+    return await extract_audio_results(request_data, response, repeat)
+
+def response_audio(request_data: RequestPayload, response: Dict, repeat: int) -> List[Tuple[int, str, str, Any]]:
+    """Find each prompt's audio in a complete model service response as (index, text, files key, bytes)."""
+    found = []
+    if 'files' in response:
+        audio_files = response['files']
+        # Try flexible key names
+        for i, text in enumerate(request_data.input_mimick_text):
+            for key in [f'output_audio_path_{i}', 'output_audio_path', f'audio_{i}', 'audio']:
+                audio_data = attachment_bytes(audio_files.get(key))
+                if audio_data is not None:
+                    found.append((i, text, key, audio_data))
+                    break
+            else:
+                logger.warning(f"No valid audio data for prompt {i}: {text} (repeat {repeat + 1})")
+    else:
+        logger.warning("No 'files' in response from model service (repeat %d): %s", repeat + 1, PayloadSummary(response))
+    return found
+
+async def extract_audio_results(request_data: RequestPayload, response: Dict, repeat: int) -> List[Dict]:
+    """Publish each prompt's audio from a complete model service response to the output store."""
+    repeat_results = []
+    published = {}
+    for _, text, key, audio_data in response_audio(request_data, response, repeat):
+        # Prompts that fall back to a shared key share one stored file
+        if key not in published:
+            published[key] = await publish_output(audio_data, 'audio/wav')
+        repeat_results.append({
+            'text': text,
+            'audio_url': published[key],
+            'repeat': repeat
+        })
+    return repeat_results
+
+async def stream_repeat(request_data: RequestPayload, messages: List[Dict], params: Dict,
+                        repeat: int) -> AsyncIterator[Tuple[str, Any]]:
+    """Relay one repeat's audio while the model service is still generating it.
+
+    Yields a ('chunk', ...) event per streamed audio chunk, wrapped as a playable WAV, then
+    ('result', files) with each prompt's chunks joined into one file. A model service without
+    streaming support answers with a complete response, which is handled as in run_repeat.
+    Failures are logged and yield no results.
+    """
+    logger.info(f"Streaming repeat {repeat + 1}/{request_data.repeats}")
+    texts = request_data.input_mimick_text
+    pcm: Dict[int, bytearray] = {}
+    sample_rates: Dict[int, int] = {}
+    response = {}
+    try:
+        async with aclosing(stream_request_to_server(messages, params)) as stream:
+            async for message in stream:
+                if message.get('status') != 'partial':
+                    response = message
+                    continue
+                chunk = attachment_bytes(message.get('audio'))
+                prompt = message.get('prompt', 0)
+                if chunk is None or not isinstance(prompt, int) or not 0 <= prompt < len(texts):
+                    continue
+                sample_rate = message.get('sample_rate', params['sample_rate'])
+                pcm.setdefault(prompt, bytearray()).extend(chunk)
+                sample_rates[prompt] = sample_rate
+                # Chunks are small and played once, so they are inlined rather than kept in the output store
+                yield 'chunk', {
+                    'prompt': prompt,
+                    'text': texts[prompt],
+                    'audio_url': audio_data_uri(FileHandler.pcm_to_wav(chunk, sample_rate))
+                }
+    except Exception as e:
+        logger.error(f"Streaming from model service failed on repeat {repeat + 1}: {str(e)}")
+        yield 'result', []
+        return
+
+    if response.get('status') != 'success':
+        logger.error("Model service failed on repeat %d: %s", repeat + 1, PayloadSummary(response))
+        yield 'result', []
+        return
+    if not pcm:
+        yield 'result', await extract_audio_results(request_data, response, repeat)
+        return
+    yield 'result', [
+        {
+            'text': texts[prompt],
+            'audio_url': await publish_output(FileHandler.pcm_to_wav(pcm[prompt], sample_rates[prompt]), 'audio/wav'),
+            'repeat': repeat
+        }
+        for prompt in sorted(pcm)
+    ]
+
 @router.post("/process_audio")
 async def process_audio(
     audio_file: UploadFile = File(...),
@@ -49,107 +213,123 @@ async def process_audio(
 ):
     """Handle audio processing requests."""
     try:
-        # Parse payload
-        try:
-            request_data = RequestPayload(**json.loads(payload))
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON payload: {str(e)}")
-            raise HTTPException(status_code=400, detail=f"Invalid JSON payload: {str(e)}")
-        except ValueError as e:
-            logger.error(f"Payload validation error: {str(e)}")
-            raise HTTPException(status_code=400, detail=str(e))
-
-        params = {
-            'sampling': request_data.sampling,
-            'max_new_tokens': request_data.max_new_tokens,
-            'use_tts_template': request_data.use_tts_template,
-            'temperature': request_data.temperature,
-            'generate_audio': request_data.generate_audio,
-            'sample_rate': request_data.sample_rate
-        }
+        request_data = parse_payload(payload)
+        params = build_params(request_data)
+        concurrency = repeat_concurrency(request_data.concurrency)
 
-        # Log parameters
-        logger.info("Configuration parameters:")
-        for key, value in params.items():
-            logger.info(f"  {key}: {value}")
-        logger.info(f"  repeats: {request_data.repeats}")
-
-        # Save uploaded audio file temporarily
-        with tempfile.TemporaryDirectory() as temp_dir:
-            input_file_path = os.path.join(temp_dir, audio_file.filename)
-            with open(input_file_path, 'wb') as f:
-                f.write(await audio_file.read())
-
-            # Process audio
-            cleaned_audio_path = AudioProcessor.process_audio(input_file_path, temp_dir)
-            audio_input = AudioProcessor.load_and_validate_audio(
-                cleaned_audio_path,
-                sample_rate=params['sample_rate']
-            )
+        # Wait for model service capacity before spending any preprocessing on the request
+        with await admit_request(concurrency):
+            # Spool the upload in chunks, enforcing the size cap and hashing it on the way
+            with await ingest_upload(audio_file, upload_limit('audio'), 'audio') as upload:
+                # Process audio without blocking the event loop; repeated uploads are served from the cache
+                audio_input, trim_stats = await AudioProcessor.load_reference_audio(upload, sample_rate=params['sample_rate'])
+            messages = build_messages(request_data, audio_input)
 
-            # Prepare messages
-            messages = [{'role': 'user', 'content': [request_data.mimick_prompt, audio_input]}];
-            for text in request_data.input_mimick_text:
-                messages.append({'role': 'user', 'content': [text]});
-
-            # Log messages
-            logger.info("Messages to be sent to server:")
-            for msg in messages:
-                logger.info(f"  Role: {msg['role']}")
-                logger.info(f"  Content: {[type(c) if isinstance(c, np.ndarray) else c for c in msg['content']]}")
-
-            results = []
-            for repeat in range(request_data.repeats):
-                logger.info(f"Processing repeat {repeat + 1}/{request_data.repeats}")
-                # Send request to server
-                try:
-                    response = await send_request_to_server(messages, params)
-                except Exception as e:
-                    logger.error(f"Failed to connect to model service on repeat {repeat + 1}: {str(e)}")
-                    continue
-                
-                logger.info(f"Received response from model service (repeat {repeat + 1}): {json.dumps(response, default=str)}")
+            logger.info(f"Running {request_data.repeats} repeat(s) with concurrency {concurrency}")
+            repeat_results = await gather_bounded(
+                request_data.repeats, partial(run_repeat, request_data, messages, params), concurrency
+            )
+        results = [result for results_for_repeat in repeat_results for result in results_for_repeat]
 
-                if response.get('status') != 'success':
-                    logger.error(f"Model service failed on repeat {repeat + 1}: {response}")
-                    continue
+        if not results:
+            logger.error("No valid audio files in response across all repeats")
+            raise HTTPException(status_code=500, detail="No valid audio files received; check model service response")
 
-                # Process response
-                if 'files' in response:
-                    audio_files = response['files']
-                    # Try flexible key names
-                    for i, text in enumerate(request_data.input_mimick_text):
-                        for key in [f'output_audio_path_{i}', 'output_audio_path', f'audio_{i}', 'audio']:
-                            if key in audio_files and isinstance(audio_files[key], dict) and 'data' in audio_files[key]:
-                                audio_data = audio_files[key]['data']
-                                if audio_data.startswith('base64:'):
-                                    results.append({
-                                        'text': text,
-                                        'audio_data': f"data:audio/wav;base64,{audio_data[7:]}"
-                                    })
-                                    break
-                            elif key in audio_files and isinstance(audio_files[key], str) and audio_files[key].startswith('base64:'):
-                                results.append({
-                                    'text': text,
-                                    'audio_data': f"data:audio/wav;base64,{audio_files[key][7:]}"
-                                })
-                                break
-                        else:
-                            logger.warning(f"No valid audio data for prompt {i}: {text} (repeat {repeat + 1})")
-                else:
-                    logger.warning(f"No 'files' in response from model service (repeat {repeat + 1}): {response}")
-
-            if not results:
-                logger.error("No valid audio files in response across all repeats")
-                raise HTTPException(status_code=500, detail="No valid audio files received; check model service response")
-
-            # Return browser-readable payload
-            return JSONResponse({
-                'status': 'success',
-                'files': results,
-                'metadata': {'input_texts': request_data.input_mimick_text, 'repeats': request_data.repeats}
-            })
+        # Return browser-readable payload
+        return JSONResponse({
+            'status': 'success',
+            'files': results,
+            'metadata': {
+                'input_texts': request_data.input_mimick_text, 'repeats': request_data.repeats,
+                'concurrency': concurrency, 'audio_trim': trim_stats
+            }
+        })
 
+    except UploadTooLargeError as e:
+        logger.error(f"Rejecting upload: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except AdmissionRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={'Retry-After': str(e.retry_after)})
+    except WorkerPoolFullError as e:
+        logger.error(f"Rejecting request: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '1'})
     except Exception as e:
         logger.error(f"Error in processing request: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/process_audio/stream")
+async def process_audio_stream(
+    audio_file: UploadFile = File(...),
+    payload: str = Form(...)
+):
+    """Handle audio processing requests, streaming each repeat's results as server-sent events.
+
+    Emits `progress` events for the preprocessing stages, a `result` event per repeat as soon as
+    the model service answers it, and a final `done` event (or `error` if the job fails). With
+    `incremental`, audio chunks are also relayed as `chunk` events while they are generated.
+    """
+    request_data = parse_payload(payload)
+    params = build_params(request_data)
+    concurrency = repeat_concurrency(request_data.concurrency)
+    # Admit and spool the upload before responding, so rejections get a proper status code;
+    # the form is closed once streaming starts
+    try:
+        ticket = await admit_request(concurrency)
+    except AdmissionRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={'Retry-After': str(e.retry_after)})
+    try:
+        upload = await ingest_upload(audio_file, upload_limit('audio'), 'audio')
+    except UploadTooLargeError as e:
+        ticket.release()
+        logger.error(f"Rejecting upload: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except BaseException:
+        ticket.release()
+        raise
+
+    async def events():
+        # The model service capacity is held until the stream ends
+        with ticket:
+            async with aclosing(job_events()) as job:
+                async for event in job:
+                    yield event
+
+    async def job_events():
+        yield 'progress', {'stage': 'uploaded', 'bytes': upload.size}
+        yield 'progress', {'stage': 'preprocessing'}
+        with upload:
+            audio_input, trim_stats = await AudioProcessor.load_reference_audio(upload, sample_rate=params['sample_rate'])
+        yield 'progress', {'stage': 'preprocessed', 'samples': len(audio_input), 'audio_trim': trim_stats}
+        messages = build_messages(request_data, audio_input)
+
+        async def repeat_events(repeat: int):
+            if request_data.incremental:
+                async for event in stream_repeat(request_data, messages, params, repeat):
+                    yield event
+            else:
+                yield 'result', await run_repeat(request_data, messages, params, repeat)
+
+        logger.info(f"Streaming {request_data.repeats} repeat(s) with concurrency {concurrency}")
+        yield 'progress', {'stage': 'generating', 'repeats': request_data.repeats, 'concurrency': concurrency}
+        completed = 0
+        result_count = 0
+        async for repeat, (event, data) in merge_bounded(request_data.repeats, repeat_events, concurrency):
+            if event == 'chunk':
+                yield 'chunk', {'repeat': repeat, **data}
+                continue
+            completed += 1
+            result_count += len(data)
+            yield 'result', {'repeat': repeat, 'files': data, 'completed': completed, 'total': request_data.repeats}
+
+        if not result_count:
+            logger.error("No valid audio files in response across all repeats")
+            raise RuntimeError("No valid audio files received; check model service response")
+        yield 'done', {
+            'status': 'success',
+            'metadata': {
+                'input_texts': request_data.input_mimick_text, 'repeats': request_data.repeats,
+                'concurrency': concurrency, 'audio_trim': trim_stats
+            }
+        }
+
+    return sse_response(events())
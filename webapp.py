@@ -0,0 +1,95 @@
+import logging
+import os
+import uvicorn
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse
+from starlette.responses import PlainTextResponse, Response as StarletteResponse
+from voice_mimic.views import router as voice_mimic_router
+from describe_photo.views import router as describe_photo_router
+from outputs.views import router as outputs_router
+from common.tcp_utils import close_model_service_client, get_micro_batcher, get_model_service_client
+from common.executor_utils import shutdown_worker_pool
+from common.admission_utils import get_admission_controller
+from common.async_utils import coalescing_stats
+from common.cache_utils import get_audio_cache, get_image_cache, get_response_cache
+from common.log_utils import RequestIdMiddleware, configure_logging
+from common.metrics_utils import MetricsMiddleware, metrics_enabled, render_metrics
+from common.output_utils import get_output_store
+from common.upload_utils import RequestSizeLimitMiddleware, configure_spooling
+from common.config import config  # Import configuration
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+configure_logging()
+configure_spooling()
+
+app = FastAPI(title="MiniCPM-o Frontend")
+
+# Refuse oversized request bodies before they are received
+app.add_middleware(RequestSizeLimitMiddleware)
+
+# Outside the size limit, so that rejected requests are counted too
+if metrics_enabled():
+    app.add_middleware(MetricsMiddleware)
+
+# Outermost: tag every log record of a request with its correlation ID
+app.add_middleware(RequestIdMiddleware)
+
+# Mount static files
+app.mount("/static", StaticFiles(directory="static"), name="static")
+
+# Include routers with prefixes
+app.include_router(voice_mimic_router, prefix="/voice-mimic")
+app.include_router(describe_photo_router, prefix="/describe-photo")
+app.include_router(outputs_router, prefix="/outputs")
+
+@app.on_event("shutdown")
+async def close_model_service_connections():
+    """Close pooled model service connections and stop preprocessing workers on shutdown."""
+    await close_model_service_client()
+    shutdown_worker_pool()
+
+@app.get("/stats")
+async def stats():
+    """Report model service, admission, cache, output store, request-coalescing and batching counters."""
+    caches = {'audio': get_audio_cache(), 'image': get_image_cache(), 'response': get_response_cache()}
+    output_store = get_output_store()
+    admission = get_admission_controller()
+    batcher = get_micro_batcher()
+    return {
+        'model_service': get_model_service_client().stats(),
+        'admission': admission.stats() if admission is not None else None,
+        'outputs': output_store.stats() if output_store is not None else None,
+        'caches': {name: cache.stats() for name, cache in caches.items() if cache is not None},
+        'coalescing': coalescing_stats(),
+        'batching': batcher.stats() if batcher is not None else None
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Expose latency histograms, payload sizes, in-flight gauges and error counters for Prometheus."""
+    if not metrics_enabled():
+        return StarletteResponse(status_code=404)
+    return PlainTextResponse(render_metrics(), media_type='text/plain; version=0.0.4')
+
+@app.get("/")
+async def serve_index():
+    """Serve the landing page with tabs."""
+    return FileResponse("static/index.html")
+
+@app.get("/favicon.ico")
+async def favicon():
+    """Serve favicon.ico from static directory."""
+    favicon_path = os.path.join("static", "favicon.ico")
+    if os.path.exists(favicon_path):
+        return FileResponse(favicon_path)
+    return StarletteResponse(status_code=204)  # No Content if favicon is missing
+
+def run_server(args=None):
+    """Serve the web interface on the host and port from conf.yaml."""
+    server_config = config.get('server', {})
+    host = server_config.get('host', '0.0.0.0')
+    port = server_config.get('port', 8000)
+    uvicorn.run(app, host=host, port=port)